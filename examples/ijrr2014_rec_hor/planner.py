@@ -20,7 +20,8 @@ import networkx as nx
 import itertools as it
 from matplotlib.path import Path
 import lomap
-from lomap.algorithms.dijkstra import dijkstra_to_all, source_to_target_dijkstra
+from lomap.algorithms.dijkstra import (dijkstra_to_all, dijkstra_to_set,
+                                       source_to_target_dijkstra)
 from collections import defaultdict
 from pprint import pprint as pp
 import logging
@@ -225,6 +226,7 @@ class Planner(object):
 				# Restore incoming edge weights of avoided cells
 				for u, v, k in local_ts.g.in_edges_iter(avoid_cells, keys=True):
 					local_ts.g[u][v][k]['weight'] = 1
+				local_ts.invalidate_successor_table()
 
 				# Plan for each cell in target_cells while avoiding the cells in avoid_cells
 				for target_cell in target_cells:
@@ -265,6 +267,7 @@ class Planner(object):
 			# Restore incoming edge weights of avoided cells
 			for u, v, k in local_ts.g.in_edges_iter(avoid_cells, keys=True):
 				local_ts.g[u][v][k]['weight'] = 1
+			local_ts.invalidate_successor_table()
 
 			# Plan for each cell in target_cells while avoiding the cells in avoid_cells
 			for target_cell in target_cells:
@@ -337,16 +340,18 @@ class Planner(object):
 
 	def compute_dist_and_path_tables(self):
 		# Find the shortest distance of each state in the product to the final states
-		dist_table = dict()
+		# (single reverse search from all final states, returns 0 for node=final)
+		dist_table, next_hop = dijkstra_to_set(self.global_pa.g, self.global_pa.final, weight_key='weight')
 		path_table = dict()
 		for node in self.global_pa.g.nodes():
-			dist_table[node] = float('inf') # initialize to inf
-			path_table[node] = None
-			dists, paths = dijkstra_to_all(self.global_pa.g, node, degen_paths=True, weight_key='weight') # returns 0 for node=final
-			for final in self.global_pa.final:
-				if final in dists and dists[final] < dist_table[node]:
-					dist_table[node] = dists[final]
-					path_table[node] = paths[final]
+			if dist_table[node] == float('inf'):
+				path_table[node] = None
+				continue
+			# Follow the next hops until a final state is reached
+			path = [node]
+			while next_hop[path[-1]] is not None:
+				path.append(next_hop[path[-1]])
+			path_table[node] = path
 		return (dist_table, path_table)
 
 
@@ -18,7 +18,9 @@ from .classes import Model, Ts, Markov
 from .classes import Automaton, Buchi, Fsa, Rabin
 from .classes import Timer
 from .algorithms.product import *
-from .algorithms.optimal_run import optimal_run
+from .algorithms.optimal_run import (optimal_run, anytime_optimal_run,
+        OptimalRunResult, PlanningError, NoSatisfyingCycleError, NoPrefixError)
+from .algorithms.planning_session import PlanningSession
 from .algorithms.multi_agent_optimal_run import multi_agent_optimal_run
 from .algorithms.robust_multi_agent_optimal_run import robust_multi_agent_optimal_run
 from .algorithms.value_iteration import *
@@ -19,7 +19,11 @@
 from __future__ import print_function
 
 __all__ = ['subset_to_subset_dijkstra_path_value', 'source_to_target_dijkstra',
-		'dijkstra_to_all']
+		'dijkstra_to_all', 'graph_to_csr', 'dijkstra_to_set',
+		'csr_subset_to_subset_dijkstra', 'bottleneck_floyd_warshall',
+		'bounded_shortest_path', 'bounded_shortest_path_lengths',
+		'nearest_target_dijkstra',
+		'DynamicDistanceToSet']
 
 
 def subset_to_subset_dijkstra_path_value(source_set, G, target_set,
@@ -107,7 +111,7 @@ def subset_to_subset_dijkstra_path_value(source_set, G, target_set,
 						heapq.heappush(fringe,(vw_dist,w))
 
 			# Remove the entries that we are not interested in
-			for key in dist.keys():
+			for key in list(dist.keys()):
 				if key not in target_set:
 					dist.pop(key)
 
@@ -162,7 +166,7 @@ def subset_to_subset_dijkstra_path_value(source_set, G, target_set,
 						heapq.heappush(fringe,(vw_dist_bot,vw_dist_sum,w))
 
 			# Remove the entries that we are not interested in
-			for key in dist.keys():
+			for key in list(dist.keys()):
 				if key not in target_set:
 					dist.pop(key)
 
@@ -309,9 +313,11 @@ def source_to_target_dijkstra(G, source, target, combine_fn='sum',
 	(overflows and roundoff errors can cause problems).
 	"""
 	import heapq
+	import itertools as it
 
 	dist = {}	# dictionary of final distances
-	fringe=[] # use heapq with (distance,label) tuples
+	fringe=[] # use heapq with (distance,count,label) tuples
+	count = it.count() # avoids comparing the labels, e.g. of team states
 
 	if combine_fn == 'sum':
 		if degen_paths:
@@ -323,7 +329,7 @@ def source_to_target_dijkstra(G, source, target, combine_fn='sum',
 				# Add zero length path from source to source
 				paths = {source:[source]}	# dictionary of paths
 				seen = {source:0}
-				heapq.heappush(fringe,(0,source))
+				heapq.heappush(fringe,(0,next(count),source))
 		else:
 			# Don't allow degenerate paths
 			# Add all neighbors of source to start the algorithm
@@ -333,10 +339,10 @@ def source_to_target_dijkstra(G, source, target, combine_fn='sum',
 				vw_dist = edgedata[weight_key]
 				paths[w] = [source, w]
 				seen[w] = vw_dist
-				heapq.heappush(fringe,(vw_dist,w))
+				heapq.heappush(fringe,(vw_dist,next(count),w))
 
 		while fringe:
-			(d,v)=heapq.heappop(fringe)
+			(d,_,v)=heapq.heappop(fringe)
 
 			if v in dist:
 				continue # already searched this node.
@@ -357,7 +363,7 @@ def source_to_target_dijkstra(G, source, target, combine_fn='sum',
 				elif w not in seen or vw_dist < seen[w]:
 					seen[w] = vw_dist
 					paths[w] = paths[v]+[w]
-					heapq.heappush(fringe,(vw_dist,w))
+					heapq.heappush(fringe,(vw_dist,next(count),w))
 
 		# Add inf cost to target if not in dist
 		if target not in dist.keys():
@@ -424,3 +430,613 @@ def source_to_target_dijkstra(G, source, target, combine_fn='sum',
 		return (dist[target][0],paths[target])
 	else:
 		assert(False)
+
+
+
+def nearest_target_dijkstra(G, source_set, targets, weight_key='weight'):
+	"""
+	Compute a shortest path from a set of nodes to the nearest node of an
+	ordered collection of targets with a single multi-source search, which
+	stops as soon as the nearest targets are settled. Degenerate paths are
+	allowed, i.e. a source that is also a target is at distance 0.
+
+	Parameters
+	----------
+	G : NetworkX graph
+
+	source_set: Iterable of node labels
+		Starting nodes for paths
+
+	targets: List of node labels
+		Ending nodes for paths, may contain duplicates. Among the targets
+		nearest to source_set, the one with the smallest index is returned.
+
+	weight_key: String, optional (default: 'weight')
+		Edge data key corresponding to the edge weight.
+
+	Returns
+	-------
+	distance, path, index : Tuple
+		The length of the path, the path from a source to the target, and the
+		smallest index of the target in targets. (inf, [], None) if no target
+		is reachable.
+	"""
+	import heapq
+	import itertools as it
+
+	rank = dict()
+	for i, t in enumerate(targets):
+		rank.setdefault(t, i)
+
+	dist = {}	# dictionary of final distances
+	pred = {}	# predecessors on the shortest paths
+	seen = {}
+	fringe = []	# use heapq with (distance,count,label) tuples
+	count = it.count() # avoids comparing the labels
+
+	for source in source_set:
+		if source not in seen:
+			seen[source] = 0
+			pred[source] = None
+			heapq.heappush(fringe, (0, next(count), source))
+
+	d_star = float('inf')
+	t_star = None
+	while fringe:
+		(d, _, v) = heapq.heappop(fringe)
+
+		if d > d_star:
+			break # all targets at distance d_star are settled
+
+		if v in dist:
+			continue # already searched this node.
+
+		dist[v] = d	# Update distance to this node
+
+		if v in rank:
+			if t_star is None or rank[v] < rank[t_star]:
+				d_star = d
+				t_star = v
+
+		for _, w, edgedata in G.edges_iter([v], data=True):
+			vw_dist = dist[v] + edgedata[weight_key]
+			if w in dist:
+				if vw_dist < dist[w]:
+					raise ValueError('Contradictory paths found:',
+									'negative weights?')
+			elif w not in seen or vw_dist < seen[w]:
+				seen[w] = vw_dist
+				pred[w] = v
+				heapq.heappush(fringe, (vw_dist, next(count), w))
+
+	if t_star is None:
+		return (float('inf'), [], None)
+
+	path = [t_star]
+	while pred[path[-1]] is not None:
+		path.append(pred[path[-1]])
+	path.reverse()
+	return (d_star, path, rank[t_star])
+
+
+def graph_to_csr(G, weight_key='weight', nodelist=None, reverse=False):
+	"""
+	Convert a weighted graph to compressed sparse row (CSR) format.
+
+	Parameters
+	----------
+	G : NetworkX graph
+
+	weight_key: String, optional (default: 'weight')
+		Edge data key corresponding to the edge weight.
+
+	nodelist: List of node labels, optional (default: None)
+		Order of the nodes, i.e. node nodelist[i] has index i. If None, the
+		order given by G.nodes() is used.
+
+	reverse: Boolean, optional (default: False)
+		If True, the edges of the graph are reversed.
+
+	Returns
+	-------
+	nodes, index, csr : Tuple
+		The list of node labels, a dictionary mapping node labels to indices,
+		and a SciPy CSR matrix holding the edge weights.
+
+	Notes
+	-----
+	Each edge of an undirected graph gives the entries of both directions.
+	Parallel edges are collapsed to the one with the smallest weight, and
+	edges with infinite weight are dropped. Edges with zero weight are kept
+	as explicit entries of the matrix.
+	"""
+	import numpy as np
+	from scipy.sparse import csr_matrix
+
+	nodes = list(G.nodes()) if nodelist is None else list(nodelist)
+	index = dict(zip(nodes, range(len(nodes))))
+
+	u, v, w = [], [], []
+	for x, y, edgedata in G.edges_iter(data=True):
+		u.append(index[x])
+		v.append(index[y])
+		w.append(edgedata[weight_key])
+	if not G.is_directed():
+		# The edges of undirected graphs are traversed in both directions
+		u, v, w = u + v, v + u, w + w
+	if reverse:
+		u, v = v, u
+	u = np.asarray(u, dtype=np.int32)
+	v = np.asarray(v, dtype=np.int32)
+	w = np.asarray(w, dtype=np.float64)
+
+	# Keep only the lightest finite edge between each pair of nodes
+	order = np.lexsort((w, v, u))
+	u, v, w = u[order], v[order], w[order]
+	keep = np.isfinite(w)
+	keep[1:] &= (u[1:] != u[:-1]) | (v[1:] != v[:-1])
+	u, v, w = u[keep], v[keep], w[keep]
+
+	indptr = np.zeros(len(nodes)+1, dtype=np.int32)
+	np.cumsum(np.bincount(u, minlength=len(nodes)), out=indptr[1:])
+	csr = csr_matrix((w, v, indptr), shape=(len(nodes), len(nodes)))
+
+	return (nodes, index, csr)
+
+
+def dijkstra_to_set(G, target_set, weight_key='weight'):
+	"""
+	Compute the shortest distances and next hops from all nodes to a set of
+	nodes in a weighted graph G.
+
+	A single Dijkstra search is performed from all targets simultaneously on
+	the reversed graph, instead of one search per node.
+
+	Parameters
+	----------
+	G : NetworkX graph
+
+	target_set: Set of node labels
+		Ending nodes for paths
+
+	weight_key: String, optional (default: 'weight')
+		Edge data key corresponding to the edge weight.
+
+	Returns
+	-------
+	distance,next_hop : Tuple
+		Dictionaries keyed by node labels. distance[v] is the length of a
+		shortest path from v to the closest node in target_set (inf if there
+		is none), and next_hop[v] is the successor of v on that path (None if
+		v is a target or cannot reach the target set).
+
+	Examples
+	--------
+	>>> G=networkx.path_graph(5)
+	>>> networkx.set_edge_attributes(G, 'weight', 1)
+	>>> dist,next_hop=dijkstra_to_set(G,set([0, 4]))
+	>>> print(dist[1], next_hop[1])
+	1.0 0
+
+	Notes
+	---------
+	Edge weight attributes must be numerical and non-negative.
+	Degenerate paths are allowed, i.e. the distance of a target is zero.
+	"""
+	import numpy as np
+	from scipy.sparse.csgraph import dijkstra
+
+	nodes, index, csr = graph_to_csr(G, weight_key=weight_key, reverse=True)
+
+	dist = dict.fromkeys(nodes, float('inf'))
+	next_hop = dict.fromkeys(nodes)
+	targets = [index[t] for t in target_set if t in index]
+	if not targets:
+		return (dist, next_hop)
+
+	# NOTE: with min_only set, SciPy also returns the closest sources
+	d, pred = dijkstra(csr, directed=True, indices=targets,
+					return_predecessors=True, min_only=True)[:2]
+	# In the reversed graph, the predecessor of a node is its next hop
+	for i in np.flatnonzero(np.isfinite(d)):
+		dist[nodes[i]] = float(d[i])
+		if pred[i] >= 0:
+			next_hop[nodes[i]] = nodes[pred[i]]
+
+	return (dist, next_hop)
+
+
+def csr_subset_to_subset_dijkstra(source_ids, csr, target_ids,
+					degen_paths=False, reverse_csr=None, batch_size=64):
+	"""
+	Compute the shortest path lengths between two sets of nodes in a weighted
+	graph in CSR format.
+
+	Parameters
+	----------
+	source_ids: List of node indices
+		Starting nodes for paths
+
+	csr: SciPy CSR matrix
+		Edge weights of the graph, see graph_to_csr().
+
+	target_ids: List of node indices
+		Ending nodes for paths
+
+	degen_paths: Boolean, optional (default: False)
+		Controls whether degenerate paths (paths that do not traverse any edges)
+		are acceptable.
+
+	reverse_csr: SciPy CSR matrix, optional (default: None)
+		Edge weights of the reversed graph. It is used to compute the shortest
+		non-degenerate paths from nodes to themselves. If None, it is computed
+		from csr.
+
+	batch_size: Integer, optional (default: 64)
+		Number of sources searched at once. Bounds the memory used for the
+		distances to all nodes.
+
+	Returns
+	-------
+	length : NumPy array
+		Array of shortest lengths, length[i, j] is the length of a shortest
+		path from source_ids[i] to target_ids[j] (inf if there is none).
+	"""
+	import numpy as np
+	from scipy.sparse.csgraph import dijkstra
+
+	source_ids = np.asarray(source_ids, dtype=np.int64)
+	target_ids = np.asarray(target_ids, dtype=np.int64)
+	length = np.empty((len(source_ids), len(target_ids)))
+	if not degen_paths and reverse_csr is None:
+		reverse_csr = csr.transpose().tocsr()
+
+	for start in range(0, len(source_ids), batch_size):
+		sources = source_ids[start:start+batch_size]
+		dist = dijkstra(csr, directed=True, indices=sources)
+		if not degen_paths:
+			# The shortest non-degenerate path from a node to itself is
+			# the shortest cycle through an incoming edge of the node
+			indptr = reverse_csr.indptr
+			for k, u in enumerate(sources):
+				preds = reverse_csr.indices[indptr[u]:indptr[u+1]]
+				if len(preds):
+					dist[k, u] = np.min(dist[k, preds]
+									+ reverse_csr.data[indptr[u]:indptr[u+1]])
+				else:
+					dist[k, u] = float('inf')
+		length[start:start+len(sources)] = dist[:, target_ids]
+
+	return length
+
+
+def bottleneck_floyd_warshall(weights):
+	"""
+	Compute the minimum bottleneck path values between all pairs of nodes of a
+	dense weighted graph.
+
+	Parameters
+	----------
+	weights: NumPy array of shape (n, n)
+		Edge weights, weights[i, j] is the weight of the edge from i to j
+		(inf if there is no such edge).
+
+	Returns
+	-------
+	bottleneck, length : Tuple of NumPy arrays of shape (n, n)
+		bottleneck[i, j] is the smallest maximum edge weight of a
+		non-degenerate path from i to j, and length[i, j] is the total edge
+		weight of such a path (inf if there is none).
+
+	Notes
+	-----
+	This is the Floyd-Warshall algorithm over the (max, +) pairs ordered
+	lexicographically, vectorized over all pairs of nodes for each
+	intermediate node. As with the 'max' combine_fn of
+	subset_to_subset_dijkstra_path_value(), the bottleneck values are exact,
+	but since the lexicographic order is not preserved by appending edges,
+	the lengths are only upper bounds of the lengths of the shortest minimum
+	bottleneck paths. See bounded_shortest_path_lengths() for the exact
+	lengths. Edge weights must be non-negative.
+	"""
+	import numpy as np
+
+	bottleneck = np.array(weights, dtype=np.float64)
+	length = bottleneck.copy()
+
+	for k in range(bottleneck.shape[0]):
+		via_bottleneck = np.maximum(bottleneck[:, k, None], bottleneck[None, k, :])
+		via_length = length[:, k, None] + length[None, k, :]
+		better = (via_bottleneck < bottleneck) \
+				| ((via_bottleneck == bottleneck) & (via_length < length))
+		np.copyto(bottleneck, via_bottleneck, where=better)
+		np.copyto(length, via_length, where=better)
+
+	return (bottleneck, length)
+
+
+def bounded_shortest_path(weights, source, target, bound):
+	"""
+	Compute a shortest non-degenerate path between two nodes of a dense
+	weighted graph using only the edges with weight at most bound. With bound
+	set to the minimum bottleneck value, this is a minimum bottleneck path
+	with the smallest length.
+
+	Parameters
+	----------
+	weights: NumPy array of shape (n, n)
+		Edge weights, see bottleneck_floyd_warshall().
+
+	source, target: Integers
+		Indices of the starting and ending nodes of the path.
+
+	bound: Float
+		Largest edge weight allowed on the path.
+
+	Returns
+	-------
+	length, path : Tuple
+		The length of the path and the list of node indices on the path,
+		(inf, []) if there is no such path.
+	"""
+	import numpy as np
+	from scipy.sparse import csr_matrix
+	from scipy.sparse.csgraph import dijkstra
+
+	n = weights.shape[0]
+	rows, cols = np.nonzero(weights <= bound)
+	# Zero weights are kept as explicit entries, i.e. edges
+	csr = csr_matrix((weights[rows, cols], (rows, cols)), shape=(n, n))
+	dist, pred = dijkstra(csr, directed=True, indices=source,
+							return_predecessors=True)
+
+	# The path ends with the edge (last, target)
+	if source == target:
+		preds = rows[cols == target]
+		if not len(preds):
+			return (float('inf'), [])
+		totals = dist[preds] + weights[preds, target]
+		last = preds[np.argmin(totals)]
+		length = totals.min()
+	else:
+		last = pred[target]
+		length = dist[target]
+	if length == float('inf'):
+		return (float('inf'), [])
+
+	path = [target]
+	while last != source:
+		path.append(last)
+		last = pred[last]
+	path.append(source)
+	path.reverse()
+	return (float(length), [int(u) for u in path])
+
+
+def bounded_shortest_path_lengths(weights, sources, targets, bounds):
+	"""
+	Compute the lengths of the paths of bounded_shortest_path() for several
+	pairs of nodes. The pairs with the same bound share a Dijkstra search.
+
+	Parameters
+	----------
+	weights: NumPy array of shape (n, n)
+		Edge weights, see bottleneck_floyd_warshall().
+
+	sources, targets, bounds: Sequences of the same size
+		The pairs of nodes and the largest edge weight allowed on the path
+		between each pair.
+
+	Returns
+	-------
+	lengths : NumPy array
+		The length of a shortest non-degenerate path between each pair, inf
+		if there is no such path.
+	"""
+	import numpy as np
+	from scipy.sparse import csr_matrix
+	from scipy.sparse.csgraph import dijkstra
+
+	n = weights.shape[0]
+	sources = np.asarray(sources, dtype=int)
+	targets = np.asarray(targets, dtype=int)
+	bounds = np.asarray(bounds, dtype=np.float64)
+	lengths = np.full(len(sources), np.inf)
+
+	for bound in np.unique(bounds[np.isfinite(bounds)]):
+		pairs = np.flatnonzero(bounds == bound)
+		allowed = np.where(weights <= bound, weights, np.inf)
+		rows, cols = np.nonzero(np.isfinite(allowed))
+		# Zero weights are kept as explicit entries, i.e. edges
+		csr = csr_matrix((allowed[rows, cols], (rows, cols)), shape=(n, n))
+		indices, pos = np.unique(sources[pairs], return_inverse=True)
+		dist = dijkstra(csr, directed=True, indices=indices).reshape((-1, n))
+		lengths[pairs] = dist[pos, targets[pairs]]
+		# Cycles end with an edge to the source
+		cycles = np.flatnonzero(sources[pairs] == targets[pairs])
+		if len(cycles):
+			lengths[pairs[cycles]] = (dist[pos[cycles]]
+					+ allowed[:, targets[pairs[cycles]]].T).min(axis=1)
+
+	return lengths
+
+
+class DynamicDistanceToSet(object):
+	"""
+	Shortest distances and next hops from all nodes of a weighted graph to a
+	set of target nodes, which are repaired incrementally after the graph or
+	the target set changes.
+
+	The repair follows the dynamic shortest path algorithm of Ramalingam and
+	Reps. The subtrees of the shortest path tree whose paths were broken are
+	invalidated first, then Dijkstra's algorithm is run from the invalidated
+	nodes and the tails of the changed edges. Only the nodes whose distances
+	change, and their predecessors, are processed.
+
+	Parameters
+	----------
+	G : NetworkX graph
+		The graph is modified by the user, then update() is called with the
+		changes.
+
+	target_set: Set of node labels
+
+	weight_key: String, optional (default: 'weight')
+		Edge data key corresponding to the edge weight.
+
+	Examples
+	--------
+	>>> table = DynamicDistanceToSet(G, targets)
+	>>> G.remove_edge(u, v)
+	>>> G.add_edge(v, w, weight=2)
+	>>> table.update(changed_edges=[(u, v), (v, w)])
+	>>> table.dist[u], table.next_hop[u]
+
+	Notes
+	-----
+	Edge weight attributes must be numerical and non-negative. Degenerate
+	paths are allowed, i.e. the distance of a target is zero.
+
+	References
+	----------
+	G. Ramalingam, T. Reps, "An incremental algorithm for a generalization of
+	the shortest-path problem", Journal of Algorithms, 21(2):267-305, 1996.
+	"""
+
+	def __init__(self, G, target_set, weight_key='weight'):
+		self.G = G
+		self.targets = set(target_set)
+		self.weight_key = weight_key
+		self.dist, self.next_hop = dijkstra_to_set(G, self.targets, weight_key)
+		# Nodes keyed by their next hop, i.e. the shortest path tree
+		self.tree = dict()
+		for u, v in self.next_hop.items():
+			if v is not None:
+				self.tree.setdefault(v, set()).add(u)
+
+	def _set_next_hop(self, u, v):
+		old = self.next_hop.get(u, None)
+		if old == v:
+			return
+		if old is not None and old in self.tree:
+			self.tree[old].discard(u)
+		if v is not None:
+			self.tree.setdefault(v, set()).add(u)
+		self.next_hop[u] = v
+
+	def _best_hop(self, u):
+		'''Returns the shortest distance and next hop of u via its successors.'''
+		if u in self.targets:
+			return (0, None)
+		best, hop = float('inf'), None
+		for _, v, edgedata in self.G.edges_iter([u], data=True):
+			d = edgedata[self.weight_key] + self.dist.get(v, float('inf'))
+			if d < best:
+				best, hop = d, v
+		return (best, hop)
+
+	def update(self, changed_edges=(), removed_nodes=(), added_targets=(),
+				removed_targets=()):
+		"""
+		Repairs the distances and next hops after the graph changed.
+
+		Parameters
+		----------
+		changed_edges: Iterable of (u, v) pairs
+			Edges that were added or removed, or whose weight changed. New
+			nodes must be the source or target of a changed edge.
+
+		removed_nodes: Iterable of node labels
+			Nodes that were removed from the graph, together with their edges.
+
+		added_targets, removed_targets: Iterables of node labels
+			Changes of the target set.
+
+		Returns
+		-------
+		changed : Dictionary
+			The old distances of the nodes whose distances changed, keyed by
+			node label (inf for new nodes).
+		"""
+		import heapq
+		import itertools as it
+
+		inf = float('inf')
+		changed = dict()
+		fringe = [] # use heapq with (distance,count,label,next_hop) tuples
+		count = it.count()
+
+		def edge_weight(u, v):
+			return min(d[self.weight_key] for d in self.G[u][v].values()) \
+					if self.G.is_multigraph() else self.G[u][v][self.weight_key]
+
+		# Phase 1: find the nodes whose shortest paths were broken
+		broken = []
+		for u in removed_nodes:
+			broken.extend(self.tree.pop(u, ()))
+			self._set_next_hop(u, None)
+			changed[u] = self.dist.pop(u, inf)
+			self.next_hop.pop(u, None)
+			self.targets.discard(u)
+		self.targets.update(added_targets)
+		self.targets.difference_update(removed_targets)
+		broken.extend(removed_targets)
+		for u, v in changed_edges:
+			for w in (u, v):
+				if w not in self.dist and w in self.G:
+					self.dist[w] = inf
+					self.next_hop[w] = None
+					changed[w] = inf
+			if u in self.G and self.next_hop[u] == v and (
+					not self.G.has_edge(u, v)
+					or edge_weight(u, v) + self.dist[v] > self.dist[u]):
+				broken.append(u)
+
+		# Invalidate the subtrees of the shortest path tree rooted at the
+		# broken nodes. The paths of the other nodes are still valid, i.e.
+		# their distances did not increase.
+		invalid = []
+		while broken:
+			u = broken.pop()
+			if u not in self.G or self.dist[u] == inf or u in self.targets:
+				continue
+			changed.setdefault(u, self.dist[u])
+			self.dist[u] = inf
+			self._set_next_hop(u, None)
+			invalid.append(u)
+			broken.extend(self.tree.get(u, ()))
+
+		# Phase 2: Dijkstra's algorithm seeded with the invalid nodes, the new
+		# targets and the tails of the changed edges
+		for u in invalid:
+			best, hop = self._best_hop(u)
+			if best < inf:
+				heapq.heappush(fringe, (best, next(count), u, hop))
+		for u in added_targets:
+			if u in self.G and u in self.targets:
+				# The target may already be at distance zero
+				self._set_next_hop(u, None)
+				heapq.heappush(fringe, (0, next(count), u, None))
+		for u, v in changed_edges:
+			if u in self.G and self.G.has_edge(u, v):
+				d = edge_weight(u, v) + self.dist[v]
+				if d < self.dist[u]:
+					heapq.heappush(fringe, (d, next(count), u, v))
+
+		while fringe:
+			(d, _, u, hop) = heapq.heappop(fringe)
+			if d >= self.dist[u]:
+				continue # already found a path that is not longer
+			changed.setdefault(u, self.dist[u])
+			self.dist[u] = d
+			self._set_next_hop(u, hop)
+			for p, _, edgedata in self.G.in_edges_iter([u], data=True):
+				p_dist = d + edgedata[self.weight_key]
+				if p_dist < self.dist[p]:
+					heapq.heappush(fringe, (p_dist, next(count), p, u))
+
+		# Remove the nodes whose distances did not change in the end
+		for u in list(changed.keys()):
+			if u in self.dist and changed[u] == self.dist[u]:
+				del changed[u]
+		return changed
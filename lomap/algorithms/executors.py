@@ -0,0 +1,278 @@
+#! /usr/bin/python
+
+# Copyright (C) 2012-2015, Alphan Ulusoy (alphan@bu.edu)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import print_function
+
+import os
+import pickle
+import tempfile
+import threading
+import logging
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+try:
+    from multiprocessing import shared_memory
+    shared_memory_available = True
+except ImportError:
+    shared_memory_available = False
+
+# Logger configuration
+logger = logging.getLogger(__name__)
+#logger.addHandler(logging.NullHandler())
+
+__all__ = ['SerialExecutor', 'ThreadExecutor', 'ProcessExecutor',
+           'get_executor', 'executor_scope']
+
+
+def chunks(l, n):
+    '''Splits the list l into consecutive chunks of size n.'''
+    return [l[i:i+n] for i in range(0, len(l), n)]
+
+
+class SerialExecutor(object):
+    '''Executes jobs sequentially in the calling process.
+
+    A job is a call func(chunk, *data), where chunk is a part of the argument
+    list that is split among jobs, and data is shared by all jobs.
+
+    The workers of the parallel executors are started by the first call of
+    `map()` and kept until `close()` is called, e.g. at the end of a with
+    statement, so that the calls of `map()` share them.
+    '''
+
+    def __init__(self, workers=1):
+        self.workers = workers
+
+    def chunk_size(self, n, chunk_size=None):
+        '''Returns the chunk size used to split n arguments. By default, each
+        worker gets about four chunks to balance the load.
+        '''
+        if chunk_size is None:
+            chunk_size = -(-n // (4 * self.workers))
+        return max(1, chunk_size)
+
+    def map(self, func, arg_to_split, data=(), chunk_size=None):
+        '''Splits arg_to_split into chunks, calls func(chunk, *data) for each
+        chunk, and returns the list of results in the order of the chunks.
+        '''
+        arg_chunks = chunks(list(arg_to_split),
+                            self.chunk_size(len(arg_to_split), chunk_size))
+        logger.debug('Dispatching %d jobs of %s', len(arg_chunks),
+                     func.__name__)
+        return self._map(func, arg_chunks, data)
+
+    def _map(self, func, arg_chunks, data):
+        return [func(chunk, *data) for chunk in arg_chunks]
+
+    def barrier(self, parties):
+        '''Returns a barrier for parties jobs of a call of `map()`, which can
+        be passed to the jobs in the shared data.
+        '''
+        return threading.Barrier(parties)
+
+    def close(self):
+        '''Stops the workers. The executor can still be used, the workers are
+        started again by the next call of `map()`.
+        '''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ThreadExecutor(SerialExecutor):
+    '''Executes jobs using a pool of threads of the calling process.
+
+    Note: Useful for jobs that release the GIL, e.g., NumPy or SciPy routines.
+    '''
+
+    def __init__(self, workers=None):
+        SerialExecutor.__init__(self, workers or multiprocessing.cpu_count())
+        self._pool = None
+
+    def _map(self, func, arg_chunks, data):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(self.workers)
+        return list(self._pool.map(lambda chunk: func(chunk, *data),
+                                   arg_chunks))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+# Call id and job (func, data) of the last call of ProcessExecutor.map() run
+# by a worker process
+_worker_job = (None, None)
+
+def _share_job(func, data, call):
+    '''Pickles the job function and the shared data of a call to a new shared
+    memory block, or to a temporary file if shared memory is not available.
+    Returns the picklable handle of the block and the block.
+    '''
+    payload = pickle.dumps((func, data), pickle.HIGHEST_PROTOCOL)
+    if shared_memory_available:
+        block = shared_memory.SharedMemory(create=True,
+                                           size=max(len(payload), 1))
+        block.buf[:len(payload)] = payload
+        return ('shm', block.name, len(payload), call), block
+    fd, path = tempfile.mkstemp(prefix='lomap_', suffix='.job')
+    with os.fdopen(fd, 'wb') as fout:
+        fout.write(payload)
+    return ('file', path, len(payload), call), path
+
+def _remove_job(block):
+    '''Removes the block created by `_share_job()`.'''
+    if isinstance(block, str):
+        os.remove(block)
+    else:
+        block.close()
+        block.unlink()
+
+def _load_job(handle):
+    '''Returns the job function and the shared data stored in the block.'''
+    backend, name, size, _ = handle
+    if backend == 'shm':
+        # The block is owned and unlinked by its creator. Before Python 3.13,
+        # attaching does not register with the tracker.
+        try:
+            block = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            block = shared_memory.SharedMemory(name=name)
+        try:
+            payload = bytes(block.buf[:size])
+        finally:
+            block.close()
+    else:
+        with open(name, 'rb') as fin:
+            payload = fin.read()
+    return pickle.loads(payload)
+
+def _run_job(chunk, handle):
+    global _worker_job
+    # Load the job once per call, the worker keeps only the last one
+    if _worker_job[0] != handle[3]:
+        _worker_job = (handle[3], _load_job(handle))
+    func, data = _worker_job[1]
+    return func(chunk, *data)
+
+
+class ProcessExecutor(SerialExecutor):
+    '''Executes jobs using a pool of processes on the local host.
+
+    The job function and the shared data of a call of `map()` are pickled
+    once and stored in shared memory, from where each worker process loads
+    them once. Only the argument chunks and the results are sent to and from
+    the jobs. The job function must be defined at the top level of a module.
+    Large read-only data should rather be shared by the caller, e.g. as a
+    `lomap.algorithms.shared_graph.SharedCsrGraph`.
+
+    The worker processes are started with the 'fork' method if available
+    (default).
+    '''
+
+    def __init__(self, workers=None, start_method='fork'):
+        SerialExecutor.__init__(self, workers or multiprocessing.cpu_count())
+        if start_method not in multiprocessing.get_all_start_methods():
+            start_method = None
+        self.context = multiprocessing.get_context(start_method)
+        self._pool = None
+        self._manager = None
+        self._calls = 0
+
+    def _map(self, func, arg_chunks, data):
+        if self.workers <= 1 or len(arg_chunks) <= 1:
+            return SerialExecutor._map(self, func, arg_chunks, data)
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers,
+                                             mp_context=self.context)
+        self._calls += 1
+        handle, block = _share_job(func, data, (os.getpid(), id(self),
+                                                self._calls))
+        try:
+            return list(self._pool.map(_run_job, arg_chunks,
+                                       [handle] * len(arg_chunks)))
+        finally:
+            _remove_job(block)
+
+    def barrier(self, parties):
+        '''Returns a barrier for parties jobs of a call of `map()`. A single
+        job runs in the calling process. Otherwise, the barrier is served by
+        a manager process, which is started once and stopped by `close()`.
+        '''
+        if self.workers <= 1 or parties <= 1:
+            return threading.Barrier(parties)
+        if self._manager is None:
+            self._manager = self.context.Manager()
+        return self._manager.Barrier(parties)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+
+def get_executor(executor=None, workers=None):
+    '''Returns an executor object.
+
+    Parameters
+    ----------
+    executor: None, string or executor object, optional (default: None)
+        Either an executor object, which is returned as is, or one of 'serial'
+        (same as None), 'thread' or 'process'.
+
+    workers: integer, optional (default: None)
+        The number of workers, defaults to the number of CPUs.
+    '''
+    if executor is None or executor == 'serial':
+        return SerialExecutor()
+    elif executor == 'thread':
+        return ThreadExecutor(workers)
+    elif executor == 'process':
+        return ProcessExecutor(workers)
+    elif isinstance(executor, SerialExecutor):
+        return executor
+    raise ValueError('Expected parameter executor to be either: "serial", '
+                     + '"thread", "process" or an executor object!')
+
+@contextmanager
+def executor_scope(executor=None, workers=None):
+    '''Context manager that provides the executor object returned by
+    `get_executor()`. The executor is closed at the end if it was created
+    here, while executor objects given by the caller are left open for their
+    next calls.
+
+    Examples
+    --------
+    >>> with executor_scope(executor) as executor:
+    >>>     executor.map(func, args)
+    '''
+    executor_obj = get_executor(executor, workers)
+    try:
+        yield executor_obj
+    finally:
+        if executor_obj is not executor:
+            executor_obj.close()
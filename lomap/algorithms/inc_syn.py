@@ -17,12 +17,16 @@
 import logging
 import collections as coll
 
+import numpy as np
+
 from ..classes import Markov
 from ..classes import Timer
 from .product import markov_times_markov
 from .product import markov_times_fsa
+from .product import markov_tuple_times_fsa
 from .value_iteration import policy_synthesis
 from .value_iteration import compute_mrp
+from .sparse_mdp import SparseMdp, policy_values
 
 # Logger configuration
 logger = logging.getLogger(__name__)
@@ -31,36 +35,171 @@ logger = logging.getLogger(__name__)
 __all__ = ['minimize_mdp', 'incremental_synthesis', 'classical_synthesis']
 
 def minimize_mdp(mdp, exp_rwd, exp_rwd_ver):
-	# mdp is the mdp to be minimized
-	# exp_rwd is the expected rwd of taking action at a state of mdp x fsa
-	# exp_rwd_ver is the expected rwd from verification
-
-	state_cnt = len(next(iter(mdp.g.node.keys())))
-	min_exp_rwd_ver = dict()
-	for s in exp_rwd_ver:
-		mdp_state = s[:state_cnt]
-		min_exp_rwd_ver[mdp_state] = min(min_exp_rwd_ver.get(mdp_state,float('inf')), exp_rwd_ver[s])
-
-	# Find out which controls must be kept
-	# at each state of the mdp
-	ctrls_to_keep = coll.defaultdict(set)
-	for s in exp_rwd:
-		for ctrl in exp_rwd[s]:
-			if (exp_rwd[s][ctrl] > 0) and ((exp_rwd[s][ctrl]+1e-3) >= min_exp_rwd_ver.get(s[:-1], 0)):
-				ctrls_to_keep[s[0:-1]].add(ctrl)
-
-	# Remove edges corresponding to
-	# the controls to be removed
-	cnt = 0
-	for s in mdp.g:
-		edges = [(s, t, key)
-			for _,t,key,d in mdp.g.out_edges_iter((s,), data=True, keys=True)
-				if d['control'] not in ctrls_to_keep[s]]
-		mdp.g.remove_edges_from(edges)
-		#logger.info('Removed %s -%s-> %s' % (s, d['control'][0], t))
-		cnt += len(edges)
-	logger.info('Removed %d edges' % cnt)
+	'''Removes the controls of the MDP whose expected rewards are below the
+	rewards verified for the policy of the product MDP.
+
+	A control of a state of mdp is kept if, at some state of the product MDP
+	that projects onto it, its expected reward is positive and at least the
+	smallest verified reward of the states that project onto it (up to
+	1e-3). The states of the products are grouped by their projections once.
+	The controls of the states are gathered from the successor table of mdp
+	in one pass, and the transitions of the removed controls are dropped
+	from the table in bulk. The edges are also removed from the graph, which
+	stays authoritative since the value iteration and the policies read the
+	graph, and the pruned table is kept for the next products with mdp.
+
+	Parameters
+	----------
+	mdp : Markov object
+		The MDP to be minimized in place.
+
+	exp_rwd : dictionary
+		The expected reward of taking each control at each state of the
+		product of mdp and the FSA.
+
+	exp_rwd_ver : dictionary
+		The expected reward of each state of the verification product.
+
+	Returns
+	-------
+	stats : dictionary
+		The numbers of states, of controls, i.e. state-control pairs, and of
+		edges of mdp before the minimization, and the numbers of removed
+		controls and edges.
+	'''
+	nodes = mdp.g.nodes()
+	index = dict(zip(nodes, range(len(nodes))))
+	state_cnt = len(nodes[0])
+
+	# Smallest verified reward of each state of the MDP, 0 if not verified
+	ver_states = np.fromiter((index.get(s[:state_cnt], -1)
+			for s in exp_rwd_ver), dtype=int, count=len(exp_rwd_ver))
+	ver_rwds = np.fromiter(exp_rwd_ver.values(), dtype=float,
+			count=len(exp_rwd_ver))
+	verified = ver_states >= 0
+	min_exp_rwd_ver = np.full(len(nodes), np.inf)
+	np.minimum.at(min_exp_rwd_ver, ver_states[verified], ver_rwds[verified])
+	min_exp_rwd_ver[np.isinf(min_exp_rwd_ver)] = 0
+
+	# Number the controls, and find out which state-control pairs must be
+	# kept. The controls that are not in exp_rwd are numbered afterwards.
+	ctrl_ids = dict()
+	pair_states, pair_ctrls, pair_rwds = [], [], []
+	for s, ctrl_rwds in exp_rwd.items():
+		k = index.get(s[:-1], -1)
+		for ctrl, rwd in ctrl_rwds.items():
+			pair_states.append(k)
+			pair_ctrls.append(ctrl_ids.setdefault(ctrl, len(ctrl_ids)))
+			pair_rwds.append(rwd)
+	pair_states = np.array(pair_states, dtype=int)
+	pair_ctrls = np.array(pair_ctrls, dtype=int)
+	pair_rwds = np.array(pair_rwds, dtype=float)
+	keep = ((pair_states >= 0) & (pair_rwds > 0)
+		& (pair_rwds + 1e-3 >= min_exp_rwd_ver[pair_states]))
+
+	# The transitions of the states, mostly cached by the product with the
+	# FSA, with the state and control of each transition
+	table = mdp.successor_table()
+	entries = [table[s] for s in nodes]
+	counts = np.fromiter(map(len, entries), dtype=int, count=len(nodes))
+	tran_ctrls = np.fromiter((ctrl_ids.setdefault(ctrl, len(ctrl_ids))
+			for entry in entries for _, _, ctrl, _ in entry),
+			dtype=int, count=counts.sum())
+	# The pair of state k and control c is numbered k*n + c, where n is the
+	# number of controls
+	n = len(ctrl_ids)
+	tran_states = np.repeat(np.arange(len(nodes)), counts)
+	tran_pairs = tran_states * n + tran_ctrls
+	kept_pairs = np.unique(pair_states[keep] * n + pair_ctrls[keep])
+	tran_kept = np.isin(tran_pairs, kept_pairs)
+	pairs = np.unique(tran_pairs)
+
+	# Drop the transitions of the removed controls from the table, and
+	# collect the controls to remove from the graph
+	removed_ctrls = dict()
+	offsets = np.concatenate(([0], np.cumsum(counts)))
+	for k in np.unique(tran_states[~tran_kept]).tolist():
+		start, stop = offsets[k], offsets[k+1]
+		entry, entry_kept = entries[k], tran_kept[start:stop].tolist()
+		removed_ctrls[nodes[k]] = set(tran[2] for tran, kept
+				in zip(entry, entry_kept) if not kept)
+		entries[k] = tuple(tran for tran, kept in zip(entry, entry_kept)
+				if kept)
+	edges = [(s, t, key) for s, ctrls in removed_ctrls.items()
+		for _, t, key, ctrl in mdp.g.out_edges_iter((s,), keys=True,
+				data='control')
+			if ctrl in ctrls]
+	stats = {'states': len(nodes), 'controls': len(pairs),
+		'edges': mdp.g.number_of_edges(),
+		'removed_controls': len(pairs) - int(np.count_nonzero(
+				np.isin(pairs, kept_pairs))),
+		'removed_edges': len(edges)}
+	mdp.g.remove_edges_from(edges)
+	mdp.replace_successor_table(zip(nodes, entries))
 
+	logger.info('Removed %d edges' % stats['removed_edges'])
+	return stats
+
+
+def _targets_product(targets, products):
+	'''Returns the product of the target MCs. The products of the suffixes of
+	targets are cached in the dictionary products by their length, so the
+	products of the remaining targets of incremental_synthesis() are
+	computed once.
+	'''
+	if len(targets) == 1:
+		return targets[0]
+	product = products.get(len(targets), None)
+	if product is None:
+		product = markov_times_markov((targets[0],
+				_targets_product(targets[1:], products)))
+		products[len(targets)] = product
+	return product
+
+def _verification_product(mc, targets, products):
+	'''Returns the product of the MC mc and the target MCs, i.e. the product
+	markov_times_markov(tuple([mc]+targets)).
+
+	The cached product of the targets, see _targets_product(), is used only
+	if no transition of it is split by the traveling states of the product,
+	i.e. if all the transitions of the targets take the same time and those
+	of mc do not take less. Otherwise the traveling states of the targets
+	would be nested tuples instead of the flat states labeled by
+	prop_set_fn, and the product of all MCs is computed.
+	'''
+	weights = set(d['weight'] for target in targets
+			for _, _, d in target.g.edges_iter(data=True))
+	if len(weights) <= 1 and all(d['weight'] >= max(weights or [0])
+			for _, _, d in mc.g.edges_iter(data=True)):
+		return markov_times_markov((mc, _targets_product(targets, products)))
+	return markov_times_markov(tuple([mc]+targets))
+
+def _projected_policy_values(p, state_cnt, policy, val):
+	'''Returns the values of the policy of the previous product MDP projected
+	onto the product MDP p, which are lower bounds of the maximal
+	probabilities of the states of p.
+
+	The states of p project onto the states of the previous product by
+	removing the components of the new target, i.e. keeping the first
+	state_cnt components and the state of the FSA. The control of the policy
+	at the projection of a state selects the control of p that extends it.
+	States without such a control are assumed to stop with value 0. The
+	linear system of the values starts from the projected values val of the
+	previous product.
+	'''
+	smdp = SparseMdp(p)
+	projection = [s[:state_cnt] + s[-1:] for s in smdp.nodes]
+	chosen = np.full(len(smdp.nodes), -1, dtype=int)
+	for k, s in enumerate(projection):
+		ctrl = policy.get(s, None)
+		if ctrl is None:
+			continue
+		for j in smdp.pairs(k):
+			if smdp.controls[j][:len(ctrl)] == ctrl:
+				chosen[k] = j
+				break
+	x0 = np.array([val.get(s, 0) for s in projection], dtype=float)
+	return smdp.to_dict(policy_values(smdp, chosen, x0))
 
 def incremental_synthesis(vehicle_mdp, fsa, targets, prop_set_fn, assumed_props=None):
 
@@ -68,6 +207,10 @@ def incremental_synthesis(vehicle_mdp, fsa, targets, prop_set_fn, assumed_props=
 	i = 0
 	max_prod_mdp = (0,0)
 	max_prod_mc = (0,0)
+	# Products of the remaining targets, see _verification_product()
+	remaining_products = dict()
+	# Solution of the previous iteration to warm start the synthesis
+	result = None
 
 	while targets:
 		iter_name = 'Iteration %d - ' % (i+1)
@@ -76,6 +219,8 @@ def incremental_synthesis(vehicle_mdp, fsa, targets, prop_set_fn, assumed_props=
 			logger.info(iter_name + 'Considering target %s' % new_target.name)
 
 			# Take the product with the previous mdp
+			if result is not None:
+				state_cnt = len(next(iter(mdp.g.node.keys())))
 			mdp = markov_times_markov((mdp, new_target))
 			#logger.info(iter_name + 'Size of the partial model: %d nodes, %d edges' % mdp.size())
 			if assumed_props:
@@ -89,8 +234,14 @@ def incremental_synthesis(vehicle_mdp, fsa, targets, prop_set_fn, assumed_props=
 			if p.size() > max_prod_mdp:
 				max_prod_mdp = p.size()
 
-			# Find the optimal policy
-			prob, exp_rwd, policy = policy_synthesis(p)
+			# Find the optimal policy starting from the values of the previous
+			# policy
+			init_val = None
+			if result is not None:
+				init_val = _projected_policy_values(p, state_cnt,
+						result.act_max, result.val)
+			result = policy_synthesis(p, init_val=init_val)
+			prob, exp_rwd, policy = result
 			logger.info(iter_name + 'Synthesis probability: %.6f' % prob)
 			#pp.pprint(policy)
 
@@ -103,7 +254,7 @@ def incremental_synthesis(vehicle_mdp, fsa, targets, prop_set_fn, assumed_props=
 				mc = Markov()
 				# Compute the MC induced by policy
 				mc.mc_from_mdp_policy(p, policy)
-				mc = markov_times_markov(tuple([mc]+targets))
+				mc = _verification_product(mc, targets, remaining_products)
 				prop_set_fn(mc)
 				# MC times FSA
 				p_verify = markov_times_fsa(mc, fsa)
@@ -116,7 +267,9 @@ def incremental_synthesis(vehicle_mdp, fsa, targets, prop_set_fn, assumed_props=
 					logger.info('Optimal policy w/ prob %f found before considering all agents', prob)
 					break
 				# Minimization
-				minimize_mdp(mdp, exp_rwd, exp_rwd_ver)
+				stats = minimize_mdp(mdp, exp_rwd, exp_rwd_ver)
+				logger.info(iter_name + 'Removed %d of %d controls'
+						% (stats['removed_controls'], stats['controls']))
 			# Increment counter
 			i+=1
 
@@ -125,20 +278,13 @@ def incremental_synthesis(vehicle_mdp, fsa, targets, prop_set_fn, assumed_props=
 
 def classical_synthesis(vehicle_mdp, fsa, targets, prop_set_fn):
 
-	# Take the product of the vehicle mdp and MCs of the targets
-	mdp = markov_times_markov(tuple([vehicle_mdp]+targets))
-	# Print info
-	#logger.info('Size of the complete system model: %d nodes, %d edges' % mdp.size())
-
-	# Define properties at the relevant states
-	prop_set_fn(mdp)
-
 	# Construct the full-state fsa using scheck
 	# (full-state ensures proper MDP after product)
 	logger.info('Size of the FSA: %d nodes, %d edges' % fsa.size())
 
-	# Compute the product MDP
-	p = markov_times_fsa(mdp, fsa)
+	# Compute the product MDP of the vehicle mdp, the MCs of the targets and
+	# the fsa, the properties are defined only at the reachable states
+	p = markov_tuple_times_fsa(tuple([vehicle_mdp]+targets), fsa, prop_set_fn)
 	logger.info('Size of the product MDP: %d nodes, %d edges' % p.size())
 
 	# Find the optimal policy
@@ -18,7 +18,9 @@
 
 import logging
 
-from lomap.algorithms.product import ts_times_ts
+from lomap.classes import LazyTeamTs
+from lomap.algorithms.product import (ts_times_ts, compact_ts_times_ts,
+										expand_symmetric_run)
 from lomap.algorithms.optimal_run import optimal_run
 
 # Logger configuration
@@ -26,13 +28,12 @@ logger = logging.getLogger(__name__)
 
 
 def pretty_print(agent_cnt, prefix, suffix):
-	import string
 	# Pretty print the prefix and suffix_cycle on team_ts
 	hdr_line_1 = ''
 	hdr_line_2 = ''
 	for i in range(0,agent_cnt):
-		hdr_line_1 += string.ljust('Robot-%d' % (i+1), 20)
-		hdr_line_2 += string.ljust('-------', 20)
+		hdr_line_1 += ('Robot-%d' % (i+1)).ljust(20)
+		hdr_line_2 += '-------'.ljust(20)
 	logger.info(hdr_line_1)
 	logger.info(hdr_line_2)
 
@@ -40,21 +41,67 @@ def pretty_print(agent_cnt, prefix, suffix):
 	for s in prefix:
 		line = ''
 		for ss in s:
-			line += string.ljust('%s' % (ss,), 20)
+			line += ('%s' % (ss,)).ljust(20)
 		logger.info(line)
 
 	logger.info('*** Suffix: ***')
 	for s in suffix:
 		line = ''
 		for ss in s:
-			line += string.ljust('%s' % (ss,), 20)
+			line += ('%s' % (ss,)).ljust(20)
 		logger.info(line)
 
-def multi_agent_optimal_run(ts_tuple, formula, opt_prop):
+def multi_agent_optimal_run(ts_tuple, formula, opt_prop, symmetry=False,
+							lazy=False, compact=False):
+	"""
+	Computes the optimal run of a team of agents, see
+	`lomap.algorithms.optimal_run.optimal_run()`.
+
+	Parameters
+	----------
+	symmetry: bool or iterable of lists, optional (default: False)
+		Merges the team states that differ only by a permutation of
+		interchangeable agents, see `lomap.algorithms.product.ts_times_ts()`.
+		The returned runs are the runs of the individual agents.
+
+	lazy: bool, optional (default: False)
+		Generates the team states on demand while the product with the Buchi
+		automaton is constructed, see `lomap.classes.LazyTeamTs`, so only
+		the team states reachable in the product are created.
+
+	compact: bool, optional (default: False)
+		Packs the team states into integers, see
+		`lomap.algorithms.product.compact_ts_times_ts()`, so the states of the
+		product with the Buchi automaton hold state indices instead of tuples
+		of agent states. The transition weights must be integers. Cannot be
+		combined with symmetry or lazy.
+	"""
+	if compact and (symmetry or lazy):
+		raise ValueError('The compact team cannot be combined with the '
+						+ 'symmetry or lazy options!')
 	# Construct the team_ts
-	team_ts = ts_times_ts(ts_tuple)
+	if compact:
+		team_ts = compact_ts_times_ts(ts_tuple)
+	elif lazy:
+		team_ts = LazyTeamTs(ts_tuple, symmetry=symmetry)
+	else:
+		team_ts = ts_times_ts(ts_tuple, symmetry=symmetry)
 	# Find the optimal run and shortest prefix on team_ts
 	prefix_length, prefix_on_team_ts, suffix_cycle_cost, suffix_cycle_on_team_ts = optimal_run(team_ts, formula, opt_prop)
+	if compact:
+		# Decode the state indices of the run
+		prefix_on_team_ts = team_ts.run_states(prefix_on_team_ts)
+		suffix_cycle_on_team_ts = team_ts.run_states(suffix_cycle_on_team_ts)
+	if symmetry:
+		# Map the run back to the agents. The suffix cycle is repeated until
+		# the agents are back in their positions at the start of the cycle.
+		prefix_on_team_ts, perm = expand_symmetric_run(team_ts, prefix_on_team_ts)
+		cycle_perm = perm
+		suffix = []
+		while not suffix or perm != cycle_perm:
+			cycle, perm = expand_symmetric_run(team_ts, suffix_cycle_on_team_ts, perm)
+			suffix.extend(cycle[1:] if suffix else cycle)
+		suffix_cycle_on_team_ts = suffix
 	# Pretty print the run
 	pretty_print(len(ts_tuple), prefix_on_team_ts, suffix_cycle_on_team_ts)
 	# Project the run on team_ts down to individual agents
@@ -18,203 +18,282 @@
 
 from __future__ import print_function
 
-import sys
-import traceback
+import time
 import logging
+from collections import namedtuple
 
-try:
-    import pp
-    pp_installed = True
-except ImportError:
-    pp_installed = False
-import networkx as nx
+import numpy as np
 
-from lomap.classes import Buchi
-from lomap.algorithms.product import ts_times_buchi
+from lomap.classes import Buchi, Timer
+from lomap.algorithms.product import (ts_times_buchi,
+                                      ts_times_buchi_init_states,
+                                      ts_times_buchi_next_states)
 from lomap.algorithms.dijkstra import (source_to_target_dijkstra,
-                                       subset_to_subset_dijkstra_path_value)
+                                       bottleneck_floyd_warshall,
+                                       bounded_shortest_path,
+                                       bounded_shortest_path_lengths,
+                                       nearest_target_dijkstra,
+                                       graph_to_csr)
+from lomap.algorithms.executors import executor_scope, ProcessExecutor
+from lomap.algorithms.shared_graph import (SharedCsrGraph, LocalCsrGraph,
+                                           shared_dijkstra_job)
 
 # Logger configuration
 logger = logging.getLogger(__name__)
 #logger.addHandler(logging.NullHandler())
 
-# Cluster configuration
-#SERVER_ADDR is the ip address of the computer running lomap
-#pp_servers is a tuple of server ips that are running ppserver.py
-#SERVER_ADDR = '107.20.62.59'
-#pp_servers = ('23.22.80.26', '50.17.177.92', '50.16.82.182', '50.16.116.126')
-SERVER_ADDR = 'localhost'
-pp_servers = ()
-SERVER_PORT = 60001
-data_source = (SERVER_ADDR, SERVER_PORT)
-
-def optimal_run(t, formula, opt_prop):
-    try:
-        logger.info('T has %d states', len(t.g))
-        # Convert formula to Buchi automaton
+class PlanningError(Exception):
+    """ Base class of the errors raised by the planning algorithms. """
+    pass
+
+class NoSatisfyingCycleError(PlanningError):
+    """ Raised if no accepting cycle exists, i.e., the specification cannot be
+    satisfied. """
+    pass
+
+class NoPrefixError(PlanningError):
+    """ Raised if the suffix cycle is not reachable from the initial states. """
+    pass
+
+class OptimalRunResult(namedtuple('OptimalRunResult', ['prefix_length',
+                            'prefix', 'suffix_cycle_cost', 'suffix_cycle'])):
+    """ Result of optimal_run().
+
+    The result is a tuple (prefix_length, prefix, suffix_cycle_cost,
+    suffix_cycle) with the following additional attributes:
+
+    prefix_on_p, suffix_cycle_on_p : Lists of product states
+        The run on the product automaton.
+
+    timings : dictionary
+        Durations of the phases of the algorithm in ms, keyed by the name of
+        the phase.
+
+    sizes : dictionary
+        Number of states of T, B and P, and the sizes of the sets S and F.
+    """
+
+    def __new__(cls, prefix_length, prefix, suffix_cycle_cost, suffix_cycle,
+                prefix_on_p=None, suffix_cycle_on_p=None, timings=None,
+                sizes=None):
+        self = super(OptimalRunResult, cls).__new__(cls, prefix_length, prefix,
+                                                suffix_cycle_cost, suffix_cycle)
+        self.prefix_on_p = prefix_on_p
+        self.suffix_cycle_on_p = suffix_cycle_on_p
+        self.timings = dict() if timings is None else timings
+        self.sizes = dict() if sizes is None else sizes
+        return self
+
+def optimal_run(t, formula, opt_prop, executor=None, chunk_size=None):
+    """ Returns the run of the transition system t that satisfies formula and
+    minimizes the maximum time between visits to the states with opt_prop.
+
+    Returns
+    -------
+    result : OptimalRunResult object
+        The tuple (prefix_length, prefix, suffix_cycle_cost, suffix_cycle)
+        with the timings of the phases and the sizes of the product.
+
+    Raises
+    ------
+    NoSatisfyingCycleError, NoPrefixError
+        If formula cannot be satisfied.
+    """
+    timings = dict()
+    sizes = dict()
+
+    # Convert formula to Buchi automaton
+    with Timer('Buchi') as timer:
         b = Buchi()
         b.from_formula(formula)
-        logger.info('B has %d states', len(b.g))
-        # Compute the product automaton
+    timings['Buchi'] = timer.duration
+    sizes['B'] = len(b.g)
+    logger.info('B has %d states', len(b.g))
+    # Compute the product automaton
+    with Timer('Product') as timer:
         p = ts_times_buchi(t, b)
-        logger.info('P has %d states', len(p.g))
-        logger.info('Set F has %d states', len(p.final))
-        # Find the set S of states w/ opt_prop
-        s = p.nodes_w_prop(opt_prop)
-        logger.info('Set S has %d states', len(s))
-        # Compute the suffix_cycle* and suffix_cycle_cost*
-        suffix_cycle_cost, suffix_cycle_on_p = min_bottleneck_cycle(p.g, s, p.final)
-        # Compute the prefix: a shortest path from p.init to suffix_cycle
-        prefix_length = float('inf')
-        prefix_on_p = ['']
-        i_star = 0
-        for init_state in p.init.keys():
-            for i in range(0,len(suffix_cycle_on_p)):
-                length, prefix = source_to_target_dijkstra(p.g, init_state, suffix_cycle_on_p[i], degen_paths = True)
-                if(length < prefix_length):
-                    prefix_length = length
-                    prefix_on_p = prefix
-                    i_star = i
-
-        if(prefix_length == float('inf')):
-            raise Exception(__name__, 'Could not compute the prefix.')
-
-        # Wrap suffix_cycle_on_p as required
-        if i_star != 0:
-            # Cut and paste
-            suffix_cycle_on_p = suffix_cycle_on_p[i_star:] + suffix_cycle_on_p[1:i_star+1]
-
-        # Compute projection of prefix and suffix-cycle to T and return
-        suffix_cycle = [x[0] for x in suffix_cycle_on_p]
-        prefix = [x[0] for x in prefix_on_p]
-        return (prefix_length, prefix, suffix_cycle_cost, suffix_cycle)
-    except Exception as ex:
-        if(len(ex.args) == 2):
-            print("{}: {}".format(*ex.args))
-        else:
-            print("{}: Unknown exception {}: {}".format(__name__, type(ex), ex))
-            exc_type, exc_value, exc_traceback = sys.exc_info()
-            traceback.print_tb(exc_traceback)
-            exit(1)
+    timings['Product'] = timer.duration
+    # After the product, since the states of lazy systems are created on demand
+    sizes['T'] = len(t.g)
+    logger.info('T has %d states', len(t.g))
+    sizes['P'] = len(p.g)
+    sizes['F'] = len(p.final)
+    logger.info('P has %d states', len(p.g))
+    logger.info('Set F has %d states', len(p.final))
+    # Find the set S of states w/ opt_prop
+    s = p.nodes_w_prop(opt_prop)
+    sizes['S'] = len(s)
+    logger.info('Set S has %d states', len(s))
+    # Compute the suffix_cycle* and suffix_cycle_cost*
+    suffix_cycle_cost, suffix_cycle_on_p = min_bottleneck_cycle(p.g, s,
+                               p.final, executor=executor, chunk_size=chunk_size,
+                               timings=timings)
+    # Compute the prefix: a shortest path from p.init to suffix_cycle
+    with Timer('Prefix') as timer:
+        prefix_length, prefix_on_p, suffix_cycle_on_p = shortest_prefix(p,
+                                                            suffix_cycle_on_p)
+    timings['Prefix'] = timer.duration
+
+    # Compute projection of prefix and suffix-cycle to T and return
+    suffix_cycle = [x[0] for x in suffix_cycle_on_p]
+    prefix = [x[0] for x in prefix_on_p]
+    return OptimalRunResult(prefix_length, prefix, suffix_cycle_cost,
+                            suffix_cycle, prefix_on_p, suffix_cycle_on_p,
+                            timings, sizes)
+
+def shortest_prefix(p, suffix_cycle_on_p):
+    """ Returns a shortest path from the initial states of the product p to
+    the suffix cycle, and the cycle rotated to start at the end of the path.
+    """
+    # The search stops at the nearest state of the cycle, i_star is its
+    # first position on the cycle
+    prefix_length, prefix_on_p, i_star = nearest_target_dijkstra(p.g,
+                                            p.init.keys(), suffix_cycle_on_p)
+
+    if(prefix_length == float('inf')):
+        raise NoPrefixError(__name__, 'Could not compute the prefix.')
+
+    # Wrap suffix_cycle_on_p as required
+    if i_star != 0:
+        # Cut and paste
+        suffix_cycle_on_p = suffix_cycle_on_p[i_star:] + suffix_cycle_on_p[1:i_star+1]
+
+    return (prefix_length, prefix_on_p, suffix_cycle_on_p)
+
+def find_best_cycle(f_rows, d_f_to_s, d_s_to_f, bot_cost, bot_len, f_in_s,
+                    block_size=2**20):
+    """ Returns the triple in F x S x S that minimizes the cost and then the
+    length of the cycle F->S1->S2->F.
+
+    Parameters
+    ----------
+    f_rows : List of integers
+        Indices of the final states to consider.
+
+    d_f_to_s : NumPy array of shape (|F|, |S|)
+        Shortest path lengths from F to S (degenerate paths allowed).
+
+    d_s_to_f : NumPy array of shape (|S|, |F|)
+        Shortest path lengths from S to F (degenerate paths allowed).
+
+    bot_cost, bot_len : NumPy arrays of shape (|S|, |S|)
+        Costs and lengths of the S-bottleneck paths between states in S.
+
+    f_in_s : NumPy array of shape (|F|,)
+        Index in S of each final state, or -1 if it is not in S.
+
+    block_size : integer, optional (default: 2**20)
+        Maximum number of triples evaluated at once, bounds the memory usage.
 
-def find_best_cycle(f, s, d_f_to_s, d_s_to_f, d_bot):
-    import itertools
+    Returns
+    -------
+    (cost, length, triple) : Tuple
+        Cost and length of the best cycle and the triple (f, s1, s2) of
+        indices, which is None if there is no cycle. Ties are broken in favor
+        of the lexicographically smallest triple w.r.t. the order of f_rows.
+    """
 
     cost_star = float('inf')
     len_star = float('inf')
     cycle_star = None
-    for triple in itertools.product(f, s, s):
-        (ff, s1, s2) = triple
-        f_s_cycle_cost = d_f_to_s[ff][s1] + d_s_to_f[s2][ff]
-        # Cost and length of this triple
-        if s1 == s2 and ff != s1:
-            cost = f_s_cycle_cost
-            this_len = f_s_cycle_cost
-        else:
-            cost = max(f_s_cycle_cost, d_bot[s1][s2][0])
-            this_len = f_s_cycle_cost + d_bot[s1][s2][1]
+    n_s = d_f_to_s.shape[1]
+    if n_s == 0:
+        return (cost_star, len_star, cycle_star)
+    rows_per_block = max(1, block_size // n_s)
+    for ff in f_rows:
+        for start in range(0, n_s, rows_per_block):
+            s1 = np.arange(start, min(start + rows_per_block, n_s))
+            f_s_cycle_cost = d_f_to_s[ff, s1, None] + d_s_to_f[None, :, ff]
+            cost = np.maximum(f_s_cycle_cost, bot_cost[s1])
+            this_len = f_s_cycle_cost + bot_len[s1]
+            # The cycle F->S1==S2->F does not need an S-bottleneck path
+            s1 = s1[s1 != f_in_s[ff]]
+            cost[s1 - start, s1] = f_s_cycle_cost[s1 - start, s1]
+            this_len[s1 - start, s1] = f_s_cycle_cost[s1 - start, s1]
+
+            min_cost = cost.min()
+            if min_cost > cost_star:
+                continue
+            this_len[cost != min_cost] = float('inf')
+            k = this_len.argmin()
+            min_len = this_len.flat[k]
+            if(min_cost < cost_star or (min_cost == cost_star and min_len < len_star)):
+                cost_star = min_cost
+                len_star = min_len
+                cycle_star = (ff, start + int(k) // n_s, int(k) % n_s)
+    return (cost_star, len_star, cycle_star)
 
-        if(cost < cost_star or (cost == cost_star and this_len < len_star)):
-            cost_star = cost
-            len_star = this_len
-            cycle_star = triple
+def tied_bottleneck_pairs(f_rows, d_f_to_s, d_s_to_f, bot_cost, bot_len_bound,
+                          f_in_s, cost_star, len_star, block_size=2**20):
+    """ Returns the pairs of S whose cycles F->S1->S2->F may tie with the
+    cycle of cost cost_star and length len_star.
 
-    return (cost_star, len_star, cycle_star)
+    Parameters
+    ----------
+    bot_len_bound : NumPy array of shape (|S|, |S|)
+        Lower bounds of the lengths of the S-bottleneck paths.
 
-def chunks(l, n):
-    return [l[i:i+n] for i in range(0, len(l), n)]
+    cost_star, len_star : Floats
+        Cost and length of the best cycle found with upper bounds of the
+        lengths of the S-bottleneck paths.
 
-def job_worker(chunk, data_source, func_name):
-    global data_id
-    global my_data
-    import socket
-    import pickle
+    See find_best_cycle() for the other parameters.
 
-    need_data = False
+    Returns
+    -------
+    pairs : NumPy array of shape (|S|, |S|)
+        Boolean matrix of the pairs (s1, s2) such that a cycle F->S1->S2->F
+        through an S-bottleneck path has the cost cost_star and a length
+        lower bound of at most len_star.
+    """
 
-    # Get new_data_id
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.connect(data_source)
-    sock.sendall('data_id')
-    new_data_id = sock.recv(64)
-    sock.close()
+    n_s = d_f_to_s.shape[1]
+    pairs = np.zeros((n_s, n_s), dtype=bool)
+    if n_s == 0:
+        return pairs
+    rows_per_block = max(1, block_size // n_s)
+    for ff in f_rows:
+        for start in range(0, n_s, rows_per_block):
+            s1 = np.arange(start, min(start + rows_per_block, n_s))
+            f_s_cycle_cost = d_f_to_s[ff, s1, None] + d_s_to_f[None, :, ff]
+            tied = (np.maximum(f_s_cycle_cost, bot_cost[s1]) == cost_star) \
+                   & (f_s_cycle_cost + bot_len_bound[s1] <= len_star)
+            # The cycle F->S1==S2->F does not need an S-bottleneck path
+            s1 = s1[s1 != f_in_s[ff]]
+            tied[s1 - start, s1] = False
+            pairs[start:start + len(tied)] |= tied
+    return pairs
+
+def map_best_cycle(executor, f_rows, tables, chunk_size=None):
+    """ Runs find_best_cycle() for the final states in f_rows with the
+    executor and returns the best result, see find_best_cycle(). The tables
+    are the arguments of find_best_cycle() after f_rows.
+    """
+    cost_star = float('inf')
+    len_star = float('inf')
+    cycle_star = None
+    results = executor.map(find_best_cycle, f_rows, tables, chunk_size)
+    for this_cost, this_len, this_cycle in results:
+        if (this_cost < cost_star or (this_cost == cost_star and this_len < len_star)):
+            cost_star = float(this_cost)
+            len_star = float(this_len)
+            cycle_star = this_cycle
+    return (cost_star, len_star, cycle_star)
 
-    if 'data_id' in globals():
-        if new_data_id != data_id:
-            need_data = True
-    else:
-        need_data = True
-
-    if need_data:# or 'my_data' not in globals():
-        # Get new data from data_address
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.connect(data_source)
-        sock.sendall('data')
-        new_data = ''
-        while True:
-            this_data = sock.recv(8192)
-            if not this_data:
-                break
-            new_data += this_data
-        sock.close()
-        my_data = pickle.loads(new_data)
-        # set the data_id
-        data_id = new_data_id
-
-    # Call the dijkstra routine for this source_chunk
-    return eval(func_name+'(chunk, *my_data)')
-
-def job_dispatcher(job_server, func, arg_to_split, chunk_size, data_id, data, data_source):
-    import socket
-    import threading
-    from six.moves import socketserver
-    import pickle
-
-    pickled_data = pickle.dumps(data,pickle.HIGHEST_PROTOCOL)
-
-    # Data Server Configuration
-    class ThreadedTCPRequestHandler(socketserver.BaseRequestHandler):
-        def handle(self):
-            req = self.request.recv(32)
-            if req == 'data_id':
-                self.request.sendall(data_id)
-                #logger.info('data_id req received from %s', self.client_address)
-            elif req == 'data':
-                self.request.sendall(pickled_data)
-                logger.info('Served dataset %s to %s', data_id, self.client_address)
-            else:
-                assert(False)
-
-    class ThreadedTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
-        allow_reuse_address = True
-        pass
-
-    # Start the server
-    server = ThreadedTCPServer(('0.0.0.0',data_source[1]), ThreadedTCPRequestHandler)
-    server_thread = threading.Thread(target=server.serve_forever)
-    # Exit the server thread when the main thread terminates
-    server_thread.daemon = True
-    server_thread.start()
-
-    # Array of dispatched jobs
-    jobs = []
-    # Split sl to chunks of size chunk_size
-    arg_chunks = chunks(arg_to_split, chunk_size)
-    # Dispatch jobs, job_worker will load static data from data_source
-    for chunk in arg_chunks:
-        jobs.append(job_server.submit(job_worker, (chunk, data_source, func.__name__), (func,)))
-
-    # Wait for all jobs to complete
-    job_server.wait()
-    job_server.print_stats()
-
-    # Shutdown the data server
-    server.shutdown()
-    server.server_close()
-
-    return jobs
-
-def min_bottleneck_cycle(g, s, f):
+def phase_clock(timings=None):
+    """ Returns a function lap(phase) that stores the time elapsed since the
+    previous call (or the creation of the clock) in timings[phase] in ms.
+    """
+    timings = dict() if timings is None else timings
+    clock = [time.time()]
+    def lap(phase):
+        now = time.time()
+        timings[phase] = (now - clock[0]) * 1000
+        clock[0] = now
+    return lap
+
+def min_bottleneck_cycle(g, s, f, executor=None, chunk_size=None, budget=None,
+                         timings=None):
     """ Returns the minimum bottleneck cycle from s to f in graph g.
 
     An implementation of the Min-Bottleneck-Cycle Algortihm
@@ -231,6 +310,25 @@ def min_bottleneck_cycle(g, s, f):
     f : A set of nodes
         These nodes are the final states of B x T product.
 
+    executor : None, string or executor object, optional (default: None)
+        Executor used to run the phases of the algorithm, see
+        `lomap.algorithms.executors.get_executor()`. By default, the phases
+        are run serially. An executor created from a string is closed at the
+        end, while the workers of an executor object are kept for its next
+        calls.
+
+    chunk_size : integer, optional (default: None)
+        Number of sources (or final states) processed by a job. By default,
+        the sources are split into about four chunks per worker.
+
+    budget : Budget object, optional (default: None)
+        If given, the budget is checked between the phases of the algorithm
+        and BudgetExceeded is raised once it is exhausted.
+
+    timings : dictionary, optional (default: None)
+        If given, the durations of the phases of the algorithm in ms are
+        stored in it, keyed by the name of the phase.
+
     Returns
     -------
     cycle : List of node labels.
@@ -244,97 +342,140 @@ def min_bottleneck_cycle(g, s, f):
 
     """
 
-    global pp_installed
-    if not pp_installed:
-        raise Exception('This functionality is not enables because, '
-                        'Parallel Python not installed!')
-
-    # Start job server
-    job_server = pp.Server(ppservers=pp_servers, secret='trivial')
-
-    # Compute shortest S->S and S->F paths
-    logger.info('S->S+F')
-    #d = subset_to_subset_dijkstra_path_value(g, s, s|f, degen_paths = False)
-    jobs = job_dispatcher(job_server, subset_to_subset_dijkstra_path_value, list(s), 1, '0', (g, s|f, 'sum', False, 'weight'), data_source)
-    d = dict()
-    for i in range(0,len(jobs)):
-        d.update(jobs[i]())
-        jobs[i]=''
-    del jobs
-    logger.info('Collected results for S->S+F')
-
-    # Create S->S, S->F dict of dicts
-    g_s_edges = []
-    d_s_to_f = dict()
-    for src in d.keys():
-        for dest in d[src].keys():
-            if dest in s:
-                w = d[src][dest]
-                g_s_edges.append((src,dest,w))
-            if dest in f:
-                # We allow degenerate S->F paths
-                w = 0 if src == dest else d[src][dest]
-                if src not in d_s_to_f:
-                    d_s_to_f[src] = dict()
-                d_s_to_f[src][dest] = w
-
-    # Create the G_s graph
-    g_s = nx.MultiDiGraph()
-    g_s.add_weighted_edges_from(g_s_edges)
-    # Remove d and g_s_edges to save memory
-    del d
-    del g_s_edges
-
-    # Compute shortest F->S paths
-    logger.info('F->S')
-    #d_f_to_s = subset_to_subset_dijkstra_path_value(g, f, s, degen_paths = True)
-    jobs = job_dispatcher(job_server, subset_to_subset_dijkstra_path_value, list(f), 1, '1', (g, s, 'sum', True, 'weight'), data_source)
-    d_f_to_s = dict()
-    for i in range(0,len(jobs)):
-        d_f_to_s.update(jobs[i]())
-        jobs[i]=''
-    del jobs
-    logger.info('Collected results for F->S')
+    lap = phase_clock(timings)
+    with executor_scope(executor) as executor:
+        # Export the graph once for worker processes, which attach to it
+        # read-only. Jobs run by this process use the graph directly.
+        if isinstance(executor, ProcessExecutor):
+            graph = SharedCsrGraph.from_graph(g)
+        else:
+            graph = LocalCsrGraph(g)
+        with graph:
+            s_list, f_list, sf_list = list(s), list(f), list(s|f)
+            s_ids = [graph.index[u] for u in s_list]
+            f_ids = [graph.index[u] for u in f_list]
+            sf_ids = [graph.index[u] for u in sf_list]
+            # Positions of the nodes of S in s_list
+            s_pos = dict(zip(s_list, range(len(s_list))))
+
+            # Compute shortest S->S and S->F paths
+            logger.info('S->S+F')
+            #d = subset_to_subset_dijkstra_path_value(g, s, s|f, degen_paths = False)
+            rows = executor.map(shared_dijkstra_job, s_ids,
+                                (graph.handle, sf_ids, False), chunk_size)
+            d = np.vstack(rows) if rows else np.empty((0, len(sf_list)))
+            del rows
+            logger.info('Collected results for S->S+F')
+            lap('S->S+F')
+
+            # Create S->S, S->F matrices
+            sf_pos = dict(zip(sf_list, range(len(sf_list))))
+            d_s_to_s = d[:, [sf_pos[u] for u in s_list]]
+            d_s_to_f = d[:, [sf_pos[u] for u in f_list]]
+            # We allow degenerate S->F paths
+            f_in_s = np.array([s_pos.get(u, -1) for u in f_list], dtype=int)
+            d_s_to_f[f_in_s[f_in_s >= 0], np.flatnonzero(f_in_s >= 0)] = 0
+
+            # Remove d to save memory, d_s_to_s holds the edge weights of G_s
+            del d
+
+            # Compute shortest F->S paths
+            logger.info('F->S')
+            #d_f_to_s = subset_to_subset_dijkstra_path_value(g, f, s, degen_paths = True)
+            rows = executor.map(shared_dijkstra_job, f_ids,
+                                (graph.handle, s_ids, True), chunk_size)
+            d_f_to_s = np.vstack(rows) if rows else np.empty((0, len(s_list)))
+            del rows
+        logger.info('Collected results for F->S')
+        lap('F->S')
+        if budget is not None:
+            budget.check()
+
+        return bottleneck_cycle_from_tables(g, s_list, f_list, d_s_to_s,
+                                            d_s_to_f, d_f_to_s, executor,
+                                            chunk_size, budget, timings)
+
+def bottleneck_cycle_from_tables(g, s_list, f_list, d_s_to_s, d_s_to_f,
+                                 d_f_to_s, executor=None, chunk_size=None,
+                                 budget=None, timings=None):
+    """ Returns the minimum bottleneck cycle from s to f in graph g given the
+    shortest path lengths between the states in S and F, see
+    min_bottleneck_cycle().
+
+    Parameters
+    ----------
+    s_list, f_list : Lists of nodes
+        The sets S and F, the tables are indexed by the positions of the
+        states in these lists.
+
+    d_s_to_s : NumPy array of shape (|S|, |S|)
+        Shortest non-degenerate path lengths from S to S.
+
+    d_s_to_f : NumPy array of shape (|S|, |F|)
+        Shortest path lengths from S to F (degenerate paths allowed).
+
+    d_f_to_s : NumPy array of shape (|F|, |S|)
+        Shortest path lengths from F to S (degenerate paths allowed).
+    """
+
+    lap = phase_clock(timings)
+    s_pos = dict(zip(s_list, range(len(s_list))))
+    f_pos = dict(zip(f_list, range(len(f_list))))
+    f_in_s = np.array([s_pos.get(u, -1) for u in f_list], dtype=int)
 
     # Compute shortest S-bottleneck paths between verices in s
     logger.info('S-bottleneck')
     #d_bot = subset_to_subset_dijkstra_path_value(g_s, s, s, combine_fn = (lambda a,b: max(a,b)), degen_paths = False)
-    jobs = job_dispatcher(job_server, subset_to_subset_dijkstra_path_value, list(s), 1, '2', (g_s, s, 'max', False, 'weight'), data_source)
-
-    d_bot = dict()
-    for i in range(0,len(jobs)):
-        d_bot.update(jobs[i]())
-        jobs[i]=''
-    del jobs
+    bot_cost, bot_len = bottleneck_floyd_warshall(d_s_to_s)
     logger.info('Collected results for S-bottleneck')
+    lap('S-bottleneck')
+    if budget is not None:
+        budget.check()
 
     # Find the triple \in F x S x S that minimizes C(f,s1,s2)
     logger.info('Path*')
-    jobs = job_dispatcher(job_server, find_best_cycle, list(f), 1, '3', (s, d_f_to_s, d_s_to_f, d_bot), data_source)
-    cost_star = float('inf')
-    len_star = float('inf')
-    cycle_star = None
-    for i in range(0,len(jobs)):
-        this_cost, this_len, this_cycle = jobs[i]()
-        jobs[i]=''
-        if (this_cost < cost_star or (this_cost == cost_star and this_len < len_star)):
-            cost_star = this_cost
-            len_star = this_len
-            cycle_star = this_cycle
-    del jobs
+    f_rows = list(range(len(f_list)))
+    with executor_scope(executor) as executor:
+        cost_star, len_star, cycle_star = map_best_cycle(executor, f_rows,
+                        (d_f_to_s, d_s_to_f, bot_cost, bot_len, f_in_s),
+                        chunk_size)
+        # The lengths of the S-bottleneck paths are upper bounds of the
+        # lengths of the extracted paths, which are at least the S->S path
+        # lengths and the bottleneck values. The extracted lengths of the
+        # pairs whose cycles may tie with the best one are computed, and the
+        # triple is chosen again with them.
+        bot_len_bound = np.maximum(d_s_to_s, bot_cost)
+        inexact = bot_len > bot_len_bound
+        if cost_star < float('inf') and inexact.any():
+            pairs = executor.map(tied_bottleneck_pairs, f_rows,
+                        (d_f_to_s, d_s_to_f, bot_cost, bot_len_bound, f_in_s,
+                         cost_star, len_star), chunk_size)
+            s1, s2 = np.nonzero(np.logical_or.reduce(pairs) & inexact)
+            logger.info('Extracted lengths of %d S-bottleneck paths', len(s1))
+            if len(s1):
+                bot_len = bot_len.copy()
+                bot_len[s1, s2] = bounded_shortest_path_lengths(d_s_to_s,
+                                                s1, s2, bot_cost[s1, s2])
+                cost_star, len_star, cycle_star = map_best_cycle(executor,
+                        f_rows, (d_f_to_s, d_s_to_f, bot_cost, bot_len,
+                                 f_in_s), chunk_size)
+    if cycle_star is not None:
+        ff, s1, s2 = cycle_star
+        cycle_star = (f_list[ff], s_list[s1], s_list[s2])
     logger.info('Collected results for Path*')
-    logger.info('Cost*: %d, Len*: %d, Cycle*: %s', cost_star, len_star, cycle_star)
+    lap('Path*')
+    logger.info('Cost*: %s, Len*: %s, Cycle*: %s', cost_star, len_star, cycle_star)
 
     if cost_star == float('inf'):
-        raise Exception(__name__, 'Failed to find a satisfying cycle, spec cannot be satisfied.')
+        raise NoSatisfyingCycleError(__name__, 'Failed to find a satisfying cycle, spec cannot be satisfied.')
 
     else:
         logger.info('Extracting Path*')
         (ff, s1, s2) = cycle_star
         # This is the F->S1 path
-        (cost_ff_to_s1, path_ff_to_s1) = source_to_target_dijkstra(g, ff, s1, degen_paths = True, cutoff = d_f_to_s[ff][s1])
+        (cost_ff_to_s1, path_ff_to_s1) = source_to_target_dijkstra(g, ff, s1, degen_paths = True, cutoff = d_f_to_s[f_pos[ff], s_pos[s1]])
         # This is the S2->F path
-        (cost_s2_to_ff, path_s2_to_ff) = source_to_target_dijkstra(g, s2, ff, degen_paths = True, cutoff = d_s_to_f[s2][ff])
+        (cost_s2_to_ff, path_s2_to_ff) = source_to_target_dijkstra(g, s2, ff, degen_paths = True, cutoff = d_s_to_f[s_pos[s2], f_pos[ff]])
         if s1 == s2 and ff != s1:
             # The path will be F->S1==S2->F
             path_star = path_ff_to_s1[0:-1] + path_s2_to_ff
@@ -343,7 +484,10 @@ def min_bottleneck_cycle(g, s, f):
         else:
             # The path will be F->S1->S2->F
             # Extract the path from s_1 to s_2
-            (bot_cost_s1_to_s2, bot_path_s1_to_s2) = source_to_target_dijkstra(g_s, s1, s2, combine_fn = 'max', degen_paths = False, cutoff = d_bot[s1][s2][0])
+            # This is a shortest among the min-bottleneck paths in G_s
+            (_, bot_path_s1_to_s2) = bounded_shortest_path(d_s_to_s, s_pos[s1], s_pos[s2], bot_cost[s_pos[s1], s_pos[s2]])
+            bot_cost_s1_to_s2 = max(d_s_to_s[i, j] for i, j in zip(bot_path_s1_to_s2[:-1], bot_path_s1_to_s2[1:]))
+            bot_path_s1_to_s2 = [s_list[i] for i in bot_path_s1_to_s2]
             assert(cost_star == max((cost_ff_to_s1 + cost_s2_to_ff),bot_cost_s1_to_s2))
             path_s1_to_s2 = []
             cost_s1_to_s2 = 0
@@ -360,4 +504,313 @@ def min_bottleneck_cycle(g, s, f):
             # last ff is kept to make it clear that this is a suffix-cycle
             path_star = path_ff_to_s1[0:-1] + path_s1_to_s2[0:-1] + path_s2_to_ff
 
+        lap('Path extraction')
         return (cost_star, path_star)
+
+
+class BudgetExceeded(PlanningError):
+    """ Raised when the budget of an anytime search is exhausted. """
+    pass
+
+class Budget(object):
+    """ Wall-clock time and node expansion budget of an anytime search.
+
+    Parameters
+    ----------
+    deadline : float, optional (default: None)
+        Time limit in seconds from the creation of the budget.
+
+    max_expansions : integer, optional (default: None)
+        Maximum number of expanded nodes.
+    """
+
+    def __init__(self, deadline=None, max_expansions=None):
+        self.deadline = deadline
+        self.max_expansions = max_expansions
+        self.start = time.time()
+        self.expansions = 0
+
+    def exhausted(self):
+        """ Returns True if the time or the expansions are used up. """
+        if self.deadline is not None and \
+                                time.time() - self.start >= self.deadline:
+            return True
+        return self.max_expansions is not None and \
+                                self.expansions >= self.max_expansions
+
+    def check(self):
+        """ Raises BudgetExceeded if the budget is exhausted. """
+        if self.exhausted():
+            raise BudgetExceeded(__name__, 'Budget exhausted after {:.3f}s '
+                                 'and {} expansions.'.format(
+                                 time.time() - self.start, self.expansions))
+
+    def expand(self, count=1):
+        """ Records count node expansions and checks the budget. """
+        self.expansions += count
+        self.check()
+
+def suffix_cycle_cost(cycle, weight, s):
+    """ Returns the maximum total weight between two consecutive visits to
+    the states in s along the cycle, i.e. the cost minimized by
+    min_bottleneck_cycle(), or inf if the cycle does not visit s.
+
+    Parameters
+    ----------
+    cycle : List of node labels
+        The cycle, the first and last nodes are the same.
+
+    weight : Function
+        weight(u, v) returns the weight of the transition from u to v.
+
+    s : Container of node labels
+    """
+    weights = [weight(u, v) for u, v in zip(cycle[:-1], cycle[1:])]
+    visits = [i for i, u in enumerate(cycle[:-1]) if u in s]
+    if not visits:
+        return float('inf')
+    gaps = [sum(weights[i:j]) for i, j in zip(visits, visits[1:])]
+    gaps.append(sum(weights[visits[-1]:]) + sum(weights[:visits[0]]))
+    return max(gaps)
+
+def accepting_lasso(t, b, budget=None):
+    """ Returns an accepting run of the product of t and b in prefix-suffix
+    form, found with a nested depth-first search that constructs the product
+    on-the-fly.
+
+    Parameters
+    ----------
+    t : Ts object
+
+    b : Buchi object
+
+    budget : Budget object, optional (default: None)
+        Each state whose successors are generated counts as an expansion.
+
+    Returns
+    -------
+    (prefix, suffix_cycle, weights) : Tuple
+        Prefix and suffix cycle on the product, and the dictionary of
+        transition weights, or None if the product has no accepting run.
+
+    Notes
+    -----
+    C. Courcoubetis, M. Vardi, P. Wolper, M. Yannakakis, "Memory-efficient
+    algorithms for the verification of temporal properties", in Formal
+    Methods in System Design, 1992. The inner search stops at any state on
+    the stack of the outer search.
+    """
+    succ = dict()
+    weights = dict()
+    def next_states(state):
+        if state not in succ:
+            if budget is not None:
+                budget.expand()
+            succ[state] = []
+            for next_state, weight, _ in ts_times_buchi_next_states(t, b,
+                                                                    state):
+                succ[state].append(next_state)
+                weights[(state, next_state)] = weight
+        return succ[state]
+
+    visited = set()
+    inner_visited = set()
+    for init_state in ts_times_buchi_init_states(t, b):
+        if init_state in visited:
+            continue
+        visited.add(init_state)
+        stack = [(init_state, iter(next_states(init_state)))]
+        on_stack = {init_state: 0}
+        while stack:
+            state, children = stack[-1]
+            child = next(children, None)
+            if child is not None:
+                if child not in visited:
+                    visited.add(child)
+                    on_stack[child] = len(stack)
+                    stack.append((child, iter(next_states(child))))
+                continue
+
+            # Post-order: search a cycle from accepting states
+            if state[1] in b.final:
+                inner_path = [state]
+                inner_stack = [iter(next_states(state))]
+                while inner_stack:
+                    child = next(inner_stack[-1], None)
+                    if child is None:
+                        inner_stack.pop()
+                        inner_path.pop()
+                    elif child in on_stack:
+                        # Close the cycle through the outer stack
+                        k = on_stack[child]
+                        outer_path = [x for x, _ in stack]
+                        prefix = outer_path[:k+1]
+                        suffix_cycle = outer_path[k:] + inner_path[1:]
+                        suffix_cycle.append(child)
+                        return (prefix, suffix_cycle, weights)
+                    elif child not in inner_visited:
+                        inner_visited.add(child)
+                        inner_path.append(child)
+                        inner_stack.append(iter(next_states(child)))
+
+            stack.pop()
+            del on_stack[state]
+    return None
+
+def final_state_cycles(p, s, budget=None):
+    """ Yields, for each final state f of the product p, a shortest cycle
+    f->s->f through a state s in S, or a shortest cycle through f if f is in
+    S. These cycles are feasible for the min-bottleneck cycle problem and
+    their costs are upper bounds of the optimal cost.
+
+    Note: Each state settled by the searches counts as an expansion.
+    """
+    from scipy.sparse.csgraph import dijkstra
+
+    nodes, index, csr = graph_to_csr(p.g)
+    reverse_csr = csr.transpose().tocsr()
+    s_ids = np.array([index[u] for u in s], dtype=int)
+
+    def path_to(pred, source, target):
+        path = [target]
+        while path[-1] != source:
+            path.append(pred[path[-1]])
+        return path
+
+    for f in p.final:
+        fi = index[f]
+        dist_from, pred_from = dijkstra(csr, directed=True, indices=fi,
+                                        return_predecessors=True)
+        dist_to, pred_to = dijkstra(reverse_csr, directed=True, indices=fi,
+                                    return_predecessors=True)
+        if budget is not None:
+            budget.expand(np.count_nonzero(np.isfinite(dist_from))
+                          + np.count_nonzero(np.isfinite(dist_to)))
+
+        cycle = None
+        length = float('inf')
+        if len(s_ids):
+            totals = dist_from[s_ids] + dist_to[s_ids]
+            totals[s_ids == fi] = float('inf')
+            k = np.argmin(totals)
+            if totals[k] < length:
+                length = totals[k]
+                # f->s path followed by the s->f path
+                cycle = path_to(pred_from, fi, s_ids[k])[::-1] \
+                        + path_to(pred_to, fi, s_ids[k])[1:]
+        if f in s:
+            # Shortest non-degenerate cycle through f
+            indptr = reverse_csr.indptr
+            preds = reverse_csr.indices[indptr[fi]:indptr[fi+1]]
+            if len(preds):
+                totals = dist_from[preds] + reverse_csr.data[indptr[fi]:indptr[fi+1]]
+                k = np.argmin(totals)
+                if totals[k] < length:
+                    length = totals[k]
+                    cycle = path_to(pred_from, fi, preds[k])[::-1] + [fi]
+        if cycle is not None:
+            yield [nodes[i] for i in cycle]
+
+def anytime_optimal_run(t, formula, opt_prop, deadline=None,
+                        max_expansions=None, callback=None, executor=None,
+                        chunk_size=None):
+    """ Returns the best run found by optimal_run() within a budget.
+
+    The search first returns any accepting run, found with an on-the-fly
+    nested depth-first search of the product. It then improves the suffix
+    cycle cost (and the prefix length for equal costs) with the shortest
+    cycles through each final state, and finally with the optimal cycle of
+    min_bottleneck_cycle(), as long as the budget allows.
+
+    Parameters
+    ----------
+    t, formula, opt_prop :
+        See optimal_run().
+
+    deadline : float, optional (default: None)
+        Time limit in seconds.
+
+    max_expansions : integer, optional (default: None)
+        Maximum number of expanded product states.
+
+    callback : Function, optional (default: None)
+        callback(solution) is called with each improved solution.
+
+    executor, chunk_size :
+        See min_bottleneck_cycle().
+
+    Returns
+    -------
+    solution : OptimalRunResult object
+        The best run as returned by optimal_run(), or None if no run was found
+        within the budget. The suffix cycle cost is inf if the cycle does not
+        visit opt_prop. The time elapsed until the run was found is stored in
+        its timings with the key 'Elapsed'.
+
+    Notes
+    -----
+    The budget is checked while searching and between the phases of the
+    algorithm. The construction of the product automaton and the phases of
+    min_bottleneck_cycle() are not interrupted, so the deadline can be
+    exceeded by the duration of a phase.
+    """
+    budget = Budget(deadline, max_expansions)
+    best = [None]
+
+    def improve(prefix_length, prefix_on_p, cost, suffix_cycle_on_p, phase):
+        if best[0] is not None and (cost, prefix_length) >= (best[0][2], best[0][0]):
+            return
+        best[0] = OptimalRunResult(prefix_length,
+                        [x[0] for x in prefix_on_p], cost,
+                        [x[0] for x in suffix_cycle_on_p], prefix_on_p,
+                        suffix_cycle_on_p,
+                        {'Elapsed': (time.time() - budget.start) * 1000})
+        logger.info('%s: Cost: %s, Prefix length: %s', phase, cost,
+                    prefix_length)
+        if callback is not None:
+            callback(best[0])
+
+    try:
+        b = Buchi()
+        b.from_formula(formula)
+
+        # Find any accepting run
+        lasso = accepting_lasso(t, b, budget)
+        if lasso is None:
+            raise NoSatisfyingCycleError(__name__, 'Failed to find a satisfying cycle, spec cannot be satisfied.')
+        prefix_on_p, suffix_cycle_on_p, weights = lasso
+        weight = lambda u, v: weights[(u, v)]
+        in_s = lambda x: opt_prop <= t.g.node[x[0]].get('prop', set())
+        improve(sum(weight(u, v) for u, v in zip(prefix_on_p[:-1], prefix_on_p[1:])),
+                prefix_on_p, suffix_cycle_cost(suffix_cycle_on_p, weight,
+                set(filter(in_s, suffix_cycle_on_p))), suffix_cycle_on_p,
+                'Lasso')
+        del lasso, weights
+
+        # Improve with the shortest cycles through the final states
+        budget.check()
+        p = ts_times_buchi(t, b)
+        s = p.nodes_w_prop(opt_prop)
+        weight = lambda u, v: min(d['weight'] for d in p.g[u][v].values())
+        found_cycle = False
+        for suffix_cycle_on_p in final_state_cycles(p, s, budget):
+            found_cycle = True
+            cost = suffix_cycle_cost(suffix_cycle_on_p, weight, s)
+            prefix_length, prefix_on_p, suffix_cycle_on_p = shortest_prefix(p,
+                                                            suffix_cycle_on_p)
+            improve(prefix_length, prefix_on_p, cost, suffix_cycle_on_p,
+                    'Final state cycle')
+
+        # Compute the optimal cycle, which exists iff there is a final state
+        # cycle through S
+        if found_cycle:
+            cost, suffix_cycle_on_p = min_bottleneck_cycle(p.g, s, p.final,
+                    executor=executor, chunk_size=chunk_size, budget=budget)
+            prefix_length, prefix_on_p, suffix_cycle_on_p = shortest_prefix(p,
+                                                            suffix_cycle_on_p)
+            improve(prefix_length, prefix_on_p, cost, suffix_cycle_on_p,
+                    'Optimal cycle')
+    except BudgetExceeded as ex:
+        logger.info('%s', ex.args[-1])
+
+    return best[0]
@@ -0,0 +1,264 @@
+#! /usr/bin/python
+
+# Copyright (C) 2012-2015, Alphan Ulusoy (alphan@bu.edu)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import print_function
+
+import os
+import tempfile
+import logging
+
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+    shared_memory_available = True
+except ImportError:
+    shared_memory_available = False
+
+from lomap.algorithms.executors import (ThreadExecutor, ProcessExecutor,
+                                        executor_scope)
+from lomap.algorithms.sparse_mdp import (SolverResult, initial_values,
+                                         reduce_segments)
+
+# Logger configuration
+logger = logging.getLogger(__name__)
+#logger.addHandler(logging.NullHandler())
+
+__all__ = ['SharedValues', 'partition_states', 'jacobi_job',
+           'parallel_value_iteration']
+
+
+# Value vectors created or attached by this process, keyed by block name
+_shared_values = dict()
+
+
+class SharedValues(object):
+    '''Two value vectors of the states of an MDP and the changes of the values
+    computed by each worker in the last two sweeps, stored in a single shared
+    memory block, or in a memory-mapped temporary file if shared memory is not
+    available.
+
+    Sweep k reads the values from vectors[k % 2] and writes the new values to
+    vectors[(k + 1) % 2], and the largest change of the values of the states
+    of worker w to changes[k % 2, w].
+    '''
+
+    def __init__(self, handle, buf, owner=False):
+        '''Creates the views of the vectors stored in the buffer. Use
+        `create()` and `attach()` to obtain objects of this class.
+        '''
+        self.handle = handle
+        self.owner = owner
+        self._buf = buf
+
+        _, _, n, workers = handle
+        if isinstance(buf, np.ndarray): # memory-mapped file
+            data = buf
+        else:
+            data = np.ndarray((2 * (n + workers),), dtype=np.float64,
+                              buffer=buf.buf)
+        self.vectors = data[:2*n].reshape(2, n)
+        self.changes = data[2*n:].reshape(2, workers)
+
+    @classmethod
+    def create(cls, values, workers):
+        '''Creates a new block with both vectors set to values.'''
+        size = 2 * (len(values) + workers)
+        if shared_memory_available:
+            buf = shared_memory.SharedMemory(create=True, size=8 * size)
+            handle = ('shm', buf.name, len(values), workers)
+        else:
+            fd, path = tempfile.mkstemp(prefix='lomap_', suffix='.val')
+            os.close(fd)
+            buf = np.memmap(path, dtype=np.float64, mode='w+',
+                            shape=(size,))
+            handle = ('mmap', path, len(values), workers)
+
+        shared = cls(handle, buf, owner=True)
+        shared.vectors[:] = values
+        shared.changes[:] = 0
+        _shared_values[handle[1]] = shared
+        return shared
+
+    @classmethod
+    def attach(cls, handle):
+        '''Returns the vectors corresponding to the handle. The block is
+        attached only once per process, and a process other than the creator
+        detaches from the previously attached blocks.
+        '''
+        shared = _shared_values.get(handle[1], None)
+        if shared is None:
+            # The long-lived workers of an executor keep only the last block
+            # they attached to, the blocks of previous calls are released
+            for other in [x for x in _shared_values.values() if not x.owner]:
+                other.close()
+            backend, name, n, workers = handle
+            if backend == 'shm':
+                # The block is owned and unlinked by its creator. Before
+                # Python 3.13, attaching does not register with the tracker.
+                try:
+                    buf = shared_memory.SharedMemory(name=name, track=False)
+                except TypeError:
+                    buf = shared_memory.SharedMemory(name=name)
+            else:
+                buf = np.memmap(name, dtype=np.float64, mode='r+',
+                                shape=(2 * (n + workers),))
+            shared = cls(handle, buf)
+            _shared_values[name] = shared
+        return shared
+
+    def close(self):
+        '''Detaches from the block. The creator also removes the block.'''
+        _shared_values.pop(self.handle[1], None)
+        self.vectors = self.changes = None
+        if isinstance(self._buf, np.ndarray):
+            self._buf = None
+            if self.owner:
+                os.remove(self.handle[1])
+        else:
+            self._buf.close()
+            if self.owner:
+                self._buf.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def partition_states(smdp, states, parts):
+    '''Splits the sorted state indices into at most parts consecutive blocks
+    with about the same number of transitions.
+    '''
+    indptr = smdp.matrix.indptr
+    state_nnz = (indptr[smdp.pair_ptr[states + 1]]
+                 - indptr[smdp.pair_ptr[states]])
+    # Every state counts, so that the states without transitions are split
+    cumulative = np.cumsum(state_nnz + 1)
+    bounds = np.searchsorted(cumulative,
+                             cumulative[-1] * np.arange(1, parts) / parts,
+                             side='right')
+    return [block for block in np.split(states, bounds) if len(block)]
+
+
+def jacobi_job(blocks, handle, barrier, tol):
+    '''Updates the values of the states of a block by synchronous Bellman
+    backups, in lockstep with the jobs of the other blocks. The block is
+    given as (block number, states, matrix of the state-action pairs of the
+    states, pointers of the states to the rows of the matrix). The values are
+    exchanged through the shared vectors, see `SharedValues`, and the jobs
+    wait for each other at the barrier after each sweep. Returns the number
+    of sweeps.
+
+    Note: Job function for the executors in `lomap.algorithms.executors`.
+    The jobs of all blocks must run at the same time, i.e. each job must be
+    run by a separate worker.
+    '''
+    (block, states, matrix, ptr), = blocks
+    shared = SharedValues.attach(handle)
+    try:
+        iterations = 0
+        while True:
+            current = iterations % 2
+            iterations += 1
+            values = shared.vectors[current]
+            new_values = reduce_segments(np.maximum, matrix.dot(values), ptr,
+                                         0.0)
+            old_values = values[states]
+            shared.changes[current, block] = (new_values - old_values).max()
+            # Values only increase as in the asynchronous value iteration
+            np.maximum(new_values, old_values, out=new_values)
+            shared.vectors[1 - current, states] = new_values
+            # After the barrier, all jobs see the same changes. The changes
+            # are overwritten two sweeps later, i.e. after the next barrier.
+            barrier.wait()
+            if shared.changes[current].max() < tol:
+                return iterations
+    except BaseException:
+        # Release the jobs of the other blocks
+        barrier.abort()
+        raise
+
+
+def parallel_value_iteration(smdp, tol=1e-9, precompute=True, start=None,
+                             executor='process', workers=None):
+    '''Computes the maximal probabilities of reaching the final states by
+    synchronous (Jacobi) value iteration, where the states are split among
+    workers that update their values in parallel.
+
+    The values of each sweep are computed from the values of the previous
+    sweep only, so the result does not depend on the number of workers and
+    is the same as the one of `sparse_value_iteration()`.
+
+    Parameters
+    ----------
+    smdp : SparseMdp object
+
+    tol : float, optional (default: 1e-9)
+        The iteration stops when no value changes by tol or more.
+
+    precompute : Boolean, optional (default: True)
+        If True, the states with maximal probability 0 or 1 are found by
+        graph analysis, see `prob0()` and `prob1()`, and only the values of
+        the other states are iterated.
+
+    start : array, optional (default: None)
+        Lower bounds of the values of the states, see
+        `sparse_value_iteration()`.
+
+    executor : None, string or executor object, optional (default: 'process')
+        The executor of the workers, see
+        `lomap.algorithms.executors.get_executor()`. The value vectors are
+        shared between the worker processes, see `SharedValues`. An executor
+        created from a string is closed at the end.
+
+    workers : integer, optional (default: None)
+        The number of workers if executor is a string, defaults to the
+        number of CPUs.
+
+    Returns
+    -------
+    result : SolverResult object
+        The values of the states and of the state-action pairs.
+    '''
+    values, maybe = initial_values(smdp, precompute, start)
+    states = np.flatnonzero(maybe)
+
+    iterations = 0
+    if len(states):
+        with executor_scope(executor, workers) as executor:
+            parallel = isinstance(executor, (ThreadExecutor, ProcessExecutor))
+            blocks = []
+            for k, block in enumerate(partition_states(smdp, states,
+                                    executor.workers if parallel else 1)):
+                pairs, ptr = smdp.pairs_of(block)
+                blocks.append((k, block, smdp.matrix[pairs], ptr))
+            barrier = executor.barrier(len(blocks))
+            logger.info('Parallel value iteration on %d blocks of states',
+                        len(blocks))
+
+            with SharedValues.create(values, len(blocks)) as shared:
+                iterations = executor.map(jacobi_job, blocks,
+                                          (shared.handle, barrier, tol),
+                                          chunk_size=1)[0]
+                values = shared.vectors[iterations % 2].copy()
+
+    logger.info('Parallel value iteration converged in %d iterations',
+                iterations)
+    return SolverResult(values, smdp.matrix.dot(values), iterations)
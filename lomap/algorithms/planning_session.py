@@ -0,0 +1,257 @@
+#! /usr/bin/python
+
+# Copyright (C) 2012-2015, Alphan Ulusoy (alphan@bu.edu)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import print_function
+
+import logging
+
+import numpy as np
+from scipy.sparse.csgraph import dijkstra, connected_components
+
+from lomap.classes import Buchi, Timer
+from lomap.algorithms.product import ts_times_buchi
+from lomap.algorithms.executors import get_executor, ProcessExecutor
+from lomap.algorithms.shared_graph import (SharedCsrGraph, LocalCsrGraph,
+                                           shared_dijkstra_job)
+from lomap.algorithms.optimal_run import (bottleneck_cycle_from_tables,
+                                          phase_clock, OptimalRunResult,
+                                          NoPrefixError)
+
+# Logger configuration
+logger = logging.getLogger(__name__)
+#logger.addHandler(logging.NullHandler())
+
+__all__ = ['PlanningSession']
+
+
+class PlanningSession(object):
+    '''Answers optimal_run() queries for a fixed transition system and formula
+    and different optimizing propositions.
+
+    The Buchi automaton, the product automaton and everything that does not
+    depend on the optimizing proposition are computed once when the session
+    is created:
+
+    - the product in compressed sparse row (CSR) format,
+    - the self-reachable final states (srfs), i.e., the final states on a
+      cycle, found by the strongly connected components of the product,
+    - the shortest path lengths from and to the srfs,
+    - the shortest paths from the initial states.
+
+    The shortest path lengths between the states with the optimizing
+    proposition are computed by the queries and cached, so queries whose sets
+    S overlap share them. The cache holds the lengths between the states of
+    the union of the sets S of the queries, see `clear_cache()`. The
+    transition system must not be changed during the session.
+
+    The shortest path searches of the queries are run by the executor. The
+    product is exported once for worker processes, see
+    `lomap.algorithms.shared_graph.SharedCsrGraph`. The queries share the
+    workers of the executor, which are stopped by `close()`, e.g. at the end
+    of a with statement.
+
+    Examples
+    --------
+    >>> with PlanningSession(ts, formula, executor='process') as session:
+    >>>     result_a = session.optimal_run({'a'})
+    >>>     result_b = session.optimal_run({'b'})
+    '''
+
+    def __init__(self, ts, formula, executor=None, chunk_size=None):
+        '''Translates the formula and constructs and analyzes the product.
+
+        Parameters
+        ----------
+        ts : Ts object
+
+        formula : string
+            LTL formula.
+
+        executor, chunk_size :
+            See `lomap.algorithms.optimal_run.min_bottleneck_cycle()`. An
+            executor created from a string is closed by `close()`.
+        '''
+        self.ts = ts
+        self.formula = formula
+        self.executor = get_executor(executor)
+        self._owns_executor = self.executor is not executor
+        self.chunk_size = chunk_size
+        self.timings = dict()
+
+        # Convert formula to Buchi automaton
+        with Timer('Buchi') as timer:
+            self.buchi = Buchi()
+            self.buchi.from_formula(formula)
+        self.timings['Buchi'] = timer.duration
+        # Compute the product automaton
+        with Timer('Product') as timer:
+            self.product = ts_times_buchi(ts, self.buchi)
+        self.timings['Product'] = timer.duration
+
+        with Timer('Product analysis') as timer:
+            if isinstance(self.executor, ProcessExecutor):
+                self.graph = SharedCsrGraph.from_graph(self.product.g)
+            else:
+                self.graph = LocalCsrGraph(self.product.g)
+            try:
+                self.nodes, self.index = self.graph.nodes, self.graph.index
+                self.csr = self.graph.csr
+                self.reverse_csr = self.graph.reverse_csr
+                self.srfs = self._self_reachable_final_states()
+                srfs_ids = [self.index[u] for u in self.srfs]
+                n = len(self.nodes)
+                if srfs_ids:
+                    # Degenerate paths are allowed between F and S
+                    self.d_from_srfs = dijkstra(self.csr, directed=True,
+                                                indices=srfs_ids)
+                    self.d_to_srfs = dijkstra(self.reverse_csr, directed=True,
+                                              indices=srfs_ids)
+                else:
+                    self.d_from_srfs = np.empty((0, n))
+                    self.d_to_srfs = np.empty((0, n))
+                init_ids = [self.index[u] for u in self.product.init]
+                # NOTE: newer versions of SciPy also return the sources
+                self.init_dist, self.init_pred = dijkstra(self.csr,
+                            directed=True, indices=init_ids, min_only=True,
+                            return_predecessors=True)[:2]
+            except BaseException:
+                self.graph.close()
+                raise
+        self.timings['Product analysis'] = timer.duration
+
+        # Non-degenerate shortest path lengths between the states of S of
+        # the queries, s_dist[i, j] is the length from s_ids[i] to s_ids[j]
+        self.s_ids = []
+        self.s_pos = dict()
+        self.s_dist = np.empty((0, 0))
+
+        self.sizes = {'T': len(ts.g), 'B': len(self.buchi.g),
+                      'P': len(self.product.g), 'F': len(self.product.final),
+                      'SRFS': len(self.srfs)}
+        logger.info('Session sizes: %s', self.sizes)
+
+    def _self_reachable_final_states(self):
+        '''Returns the list of final states that are in a non-trivial strongly
+        connected component of the product or have a self-loop.
+        '''
+        _, labels = connected_components(self.csr, directed=True,
+                                         connection='strong')
+        scc_sizes = np.bincount(labels)
+        indptr, indices = self.csr.indptr, self.csr.indices
+        srfs = []
+        for u in self.product.final:
+            k = self.index[u]
+            if scc_sizes[labels[k]] > 1 or k in indices[indptr[k]:indptr[k+1]]:
+                srfs.append(u)
+        return srfs
+
+    def clear_cache(self):
+        '''Removes the cached shortest path lengths between the states of S.'''
+        self.s_ids = []
+        self.s_pos = dict()
+        self.s_dist = np.empty((0, 0))
+
+    def _update_s_dist(self, s_ids):
+        '''Adds the shortest path lengths from and to the states in s_ids
+        that are not cached yet.
+        '''
+        new = [u for u in s_ids if u not in self.s_pos]
+        logger.info('S->S for %d of %d states', len(new), len(s_ids))
+        if not new:
+            return
+        old = self.s_ids
+        k, n = len(old), len(old) + len(new)
+        s_dist = np.empty((n, n))
+        s_dist[:k, :k] = self.s_dist
+        # Lengths from the new states to all states of S
+        rows = self.executor.map(shared_dijkstra_job, new,
+                        (self.graph.handle, old + new, False), self.chunk_size)
+        s_dist[k:] = np.vstack(rows)
+        if old:
+            # Lengths from the cached states to the new states, by searches
+            # from the new states on the reversed product
+            rows = self.executor.map(shared_dijkstra_job, new,
+                        (self.graph.handle, old, True, True), self.chunk_size)
+            s_dist[:k, k:] = np.vstack(rows).T
+        self.s_ids = old + new
+        self.s_pos.update(zip(new, range(k, n)))
+        self.s_dist = s_dist
+
+    def close(self):
+        '''Stops the workers of the executor if it was created by the
+        session, and removes the exported product.
+        '''
+        if self._owns_executor:
+            self.executor.close()
+        self.graph.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def optimal_run(self, opt_prop):
+        '''Returns the optimal run for the optimizing proposition opt_prop,
+        see `lomap.algorithms.optimal_run.optimal_run()`. The timings of the
+        result include only the phases of this query.
+        '''
+        timings = dict()
+        lap = phase_clock(timings)
+
+        # Find the set S of states w/ opt_prop
+        s_list = list(self.product.nodes_w_prop(opt_prop))
+        s_ids = np.array([self.index[u] for u in s_list], dtype=int)
+        logger.info('Set S has %d states', len(s_list))
+
+        # Compute the missing S->S paths
+        self._update_s_dist(s_ids.tolist())
+        pos = [self.s_pos[u] for u in s_ids.tolist()]
+        d_s_to_s = self.s_dist[np.ix_(pos, pos)]
+        d_s_to_f = self.d_to_srfs[:, s_ids].T.copy()
+        d_f_to_s = self.d_from_srfs[:, s_ids]
+        lap('S->S+F')
+
+        suffix_cycle_cost, suffix_cycle_on_p = bottleneck_cycle_from_tables(
+                    self.product.g, s_list, self.srfs, d_s_to_s, d_s_to_f,
+                    d_f_to_s, self.executor, self.chunk_size, timings=timings)
+        lap = phase_clock(timings)
+
+        # Compute the prefix from the shortest paths from the initial states,
+        # i_star is the first position of the nearest state on the cycle
+        cycle_ids = [self.index[u] for u in suffix_cycle_on_p]
+        i_star = int(np.argmin(self.init_dist[cycle_ids]))
+        prefix_length = self.init_dist[cycle_ids[i_star]]
+        if prefix_length == float('inf'):
+            raise NoPrefixError(__name__, 'Could not compute the prefix.')
+        prefix_ids = [cycle_ids[i_star]]
+        while self.init_pred[prefix_ids[-1]] >= 0:
+            prefix_ids.append(self.init_pred[prefix_ids[-1]])
+        prefix_on_p = [self.nodes[k] for k in reversed(prefix_ids)]
+        if i_star != 0:
+            # Cut and paste
+            suffix_cycle_on_p = suffix_cycle_on_p[i_star:] + suffix_cycle_on_p[1:i_star+1]
+        lap('Prefix')
+
+        sizes = dict(self.sizes)
+        sizes['S'] = len(s_list)
+        # Compute projection of prefix and suffix-cycle to T and return
+        return OptimalRunResult(float(prefix_length),
+                                [x[0] for x in prefix_on_p], suffix_cycle_cost,
+                                [x[0] for x in suffix_cycle_on_p], prefix_on_p,
+                                suffix_cycle_on_p, timings, sizes)
@@ -22,11 +22,17 @@ from __future__ import print_function
 import itertools as it
 import operator as op
 import logging
+from array import array
 from collections import deque
 
+import numpy as np
 from six.moves import zip
 
-from lomap.classes import Fsa, Markov, Model, Ts, Timer
+from lomap.classes import (Fsa, Markov, Model, Ts, Timer, TeamStateEncoder,
+                           CompactTeamTs, TravelingState)
+from lomap.classes.team import (interchangeable_agents, canonical_team_state,
+                                agent_groups, team_init_state, team_prop,
+                                team_next_states)
 from functools import reduce
 
 
@@ -35,10 +41,13 @@ logger = logging.getLogger(__name__)
 #logger.addHandler(logging.NullHandler())
 
 #TODO: make independent of graph type
-__all__ = ['ts_times_ts', 'ts_times_buchi', 'ts_times_fsa', 'ts_times_fsas',
-           'markov_times_markov', 'markov_times_fsa', 'fsa_times_fsa',
+__all__ = ['ts_times_ts', 'compact_ts_times_ts', 'interchangeable_agents',
+           'canonical_team_state', 'expand_symmetric_run', 'ts_times_buchi',
+           'ts_times_buchi_init_states', 'ts_times_buchi_next_states',
+           'ts_times_fsa', 'ts_times_fsas', 'markov_times_markov',
+           'markov_times_fsa', 'markov_tuple_times_fsa', 'fsa_times_fsa',
            'no_data', 'get_default_state_data', 'get_default_transition_data',
-           'pfsa_default_transition_data']
+           'pfsa_default_transition_data', 'update_ts_product']
 
 def powerset(iterable):
     '''powerset([1,2,3]) --> () (1,) (2,) (3,) (1,2) (1,3) (2,3) (1,2,3)
@@ -212,6 +221,7 @@ def ts_times_fsa(ts, fsa, from_current=False, expand_finals=True,
                     if act_init_fsa in fsa.final:
                         product_model.final.add(init_state)
 
+    successors = ts.successor_table()
     # Add all initial states to the stack
     stack = deque(product_model.init)
     # Consume the stack
@@ -223,8 +233,7 @@ def ts_times_fsa(ts, fsa, from_current=False, expand_finals=True,
         if not expand_finals and fsa_state in fsa.final:
             continue
 
-        for ts_next_state, weight, control in ts.next_states_of_wts(ts_state,
-                                                     traveling_states=False):
+        for ts_next_state, weight, control in successors[ts_state]:
             ts_next_prop = ts.g.node[ts_next_state].get('prop', set())
             fsa_next_state = fsa.next_state(fsa_state, ts_next_prop)
             if fsa_next_state is not None:
@@ -255,6 +264,44 @@ def ts_times_fsa(ts, fsa, from_current=False, expand_finals=True,
 
     return product_model
 
+def ts_times_buchi_init_states(ts, buchi):
+    '''Returns the list of initial states of the product of a transition
+    system and a Buchi automaton.
+    '''
+    init_states = []
+    for init_ts in ts.init:
+        init_prop = ts.g.node[init_ts].get('prop',set())
+        # Iterate over the initial states of the FSA
+        for init_buchi in buchi.init:
+            for act_init_buchi in buchi.next_states(init_buchi, init_prop):
+                init_states.append((init_ts, act_init_buchi))
+    return init_states
+
+def ts_times_buchi_next_states(ts, buchi, state, successors=None):
+    '''Returns a tuple (next_state, weight, control) for each outgoing
+    transition from the state of the product of a transition system and a
+    Buchi automaton. The product is not constructed, so this can be used to
+    search it on-the-fly. Callers expanding many states pass the successor
+    table of the transition system, see
+    `lomap.classes.model.Model.successor_table()`.
+
+    Note: Only the first transition to each next state is returned. Works
+    also for the product with an FSA.
+    '''
+    if successors is None:
+        successors = ts.successor_table()
+    ts_state, buchi_state = state
+    r = []
+    seen = set()
+    for ts_next_state, weight, control in successors[ts_state]:
+        ts_next_prop = ts.g.node[ts_next_state].get('prop',set())
+        for buchi_next_state in buchi.next_states(buchi_state, ts_next_prop):
+            next_state = (ts_next_state, buchi_next_state)
+            if next_state not in seen:
+                seen.add(next_state)
+                r.append((next_state, weight, control))
+    return tuple(r)
+
 def ts_times_buchi(ts, buchi):
     '''TODO:
     add option to choose what to save on the automaton's
@@ -266,92 +313,106 @@ def ts_times_buchi(ts, buchi):
     # Create the product_model
     product_model = Model()
 
-    # Iterate over initial states of the TS
-    init_states = []
-    for init_ts in ts.init:
-        init_prop = ts.g.node[init_ts].get('prop',set())
-        # Iterate over the initial states of the FSA
-        for init_buchi in buchi.init:
-            # Add the initial states to the graph and mark them as initial
-            for act_init_buchi in buchi.next_states(init_buchi, init_prop):
-                init_state = (init_ts, act_init_buchi)
-                init_states.append(init_state)
-                product_model.init[init_state] = 1
-                attr_dict = {'prop': init_prop,
-                        'label': '{}\\n{}'.format(init_state,list(init_prop))}
-                product_model.g.add_node(init_state, attr_dict=attr_dict)
-                if act_init_buchi in buchi.final:
-                    product_model.final.add(init_state)
+    # Iterate over initial states of the TS and the Buchi automaton
+    init_states = ts_times_buchi_init_states(ts, buchi)
+    for init_state in init_states:
+        # Add the initial states to the graph and mark them as initial
+        init_prop = ts.g.node[init_state[0]].get('prop',set())
+        product_model.init[init_state] = 1
+        attr_dict = {'prop': init_prop,
+                'label': '{}\\n{}'.format(init_state,list(init_prop))}
+        product_model.g.add_node(init_state, attr_dict=attr_dict)
+        if init_state[1] in buchi.final:
+            product_model.final.add(init_state)
 
     # Add all initial states to the stack
     stack = []
     for init_state in init_states:
         stack.append(init_state)
 
+    successors = ts.successor_table()
     # Consume the stack
     while(stack):
         cur_state = stack.pop()
-        ts_state = cur_state[0]
-        buchi_state = cur_state[1]
-
-        for ts_next in ts.next_states_of_wts(ts_state, traveling_states=False):
-            ts_next_state = ts_next[0]
-            ts_next_prop = ts.g.node[ts_next_state].get('prop',set())
-            weight = ts_next[1]
-            control = ts_next[2]
-            for buchi_next_state in buchi.next_states(buchi_state,
-                                                      ts_next_prop):
-                # TODO: use process_product_transition instead
-                next_state = (ts_next_state, buchi_next_state)
-                #print "%s -%d-> %s" % (cur_state, weight, next_state)
 
-                if(next_state not in product_model.g):
-                    next_prop = ts.g.node[ts_next_state].get('prop',set())
+        for next_state, weight, control in ts_times_buchi_next_states(ts,
+                                                buchi, cur_state, successors):
+            # TODO: use process_product_transition instead
+            #print "%s -%d-> %s" % (cur_state, weight, next_state)
 
-                    # Add the new state
-                    attr_dict = {'prop': next_prop,
-                        'label': '{}\\n{}'.format(next_state, list(next_prop))}
-                    product_model.g.add_node(next_state, attr_dict=attr_dict)
+            if(next_state not in product_model.g):
+                next_prop = ts.g.node[next_state[0]].get('prop',set())
 
-                    # Add transition w/ weight
-                    attr_dict = {'weight': weight, 'control': control}
-                    product_model.g.add_edge(cur_state, next_state,
-                                             attr_dict=attr_dict)
+                # Add the new state
+                attr_dict = {'prop': next_prop,
+                    'label': '{}\\n{}'.format(next_state, list(next_prop))}
+                product_model.g.add_node(next_state, attr_dict=attr_dict)
 
-                    # Mark as final if final in buchi
-                    if buchi_next_state in buchi.final:
-                        product_model.final.add(next_state)
+                # Add transition w/ weight
+                attr_dict = {'weight': weight, 'control': control}
+                product_model.g.add_edge(cur_state, next_state,
+                                         attr_dict=attr_dict)
 
-                    # Continue search from next state
-                    stack.append(next_state)
+                # Mark as final if final in buchi
+                if next_state[1] in buchi.final:
+                    product_model.final.add(next_state)
 
-                elif(next_state not in product_model.g[cur_state]):
-                    attr_dict = {'weight': weight, 'control': control}
-                    product_model.g.add_edge(cur_state, next_state,
-                                             attr_dict=attr_dict)
+                # Continue search from next state
+                stack.append(next_state)
+
+            elif(next_state not in product_model.g[cur_state]):
+                attr_dict = {'weight': weight, 'control': control}
+                product_model.g.add_edge(cur_state, next_state,
+                                         attr_dict=attr_dict)
 
     return product_model
 
-def ts_times_ts(ts_tuple):
-    '''TODO:
+def ts_times_ts(ts_tuple, symmetry=False):
+    '''Computes the team transition system of a tuple of weighted
+    deterministic transition systems.
+
+    The states of the team are tuples of agent states, where an agent state
+    is either a state of its transition system or a traveling state
+    (source, target, elapsed_time).
+
+    Parameters
+    ----------
+    ts_tuple: iterable of LOMAP weighted deterministic transition systems
+
+    symmetry: bool or iterable of lists, optional (default: False)
+        Indicates whether team states that differ only by a permutation of
+        interchangeable agents are merged. The groups of interchangeable
+        agents are either given or computed by `interchangeable_agents()`.
+        The states of the reduced team are given by `canonical_team_state()`
+        and each transition stores the permutation of the agents in the
+        'permutation' attribute, see `expand_symmetric_run()`. The
+        propositions and weights of the team do not depend on the order of
+        the agents, so optimal runs have the same costs as on the full team.
+
+    Returns
+    -------
+    product_ts: LOMAP Ts
+
+    TODO:
     add option to choose what to save on the automaton's
-    add description
     add regression tests
     add option to create from current state
     '''
     # NOTE: We assume deterministic TS
     assert all((len(ts.init) == 1 for ts in ts_tuple))
+    groups = agent_groups(ts_tuple, symmetry)
+    tables = [ts.successor_table() for ts in ts_tuple]
 
     # Initial state label is the tuple of initial states' labels
     product_ts = Ts()
 
-    init_state = tuple((next(iter(ts.init)) for ts in ts_tuple))
+    init_state, perm = team_init_state(ts_tuple, groups)
+    if groups is not None:
+        product_ts.g.graph['init_permutation'] = perm
     product_ts.init[init_state] = 1
 
     # Props satisfied at init_state is the union of props
-    # For each ts, get the prop of init state or empty set
-    init_prop = set.union(*[ts.g.node[ts_init].get('prop', set())
-                            for ts, ts_init in zip(ts_tuple, init_state)])
+    init_prop = team_prop(ts_tuple, init_state)
 
     # Finally, add the state
     product_ts.g.add_node(init_state, {'prop': init_prop,
@@ -362,39 +423,18 @@ def ts_times_ts(ts_tuple):
     stack.append(init_state)
     while stack:
         cur_state = stack.pop()
-        # Actual source states of traveling states
-        source_state = tuple((q[0] if type(q) == tuple else q
-                              for q in cur_state))
-        # Time spent since actual source states
-        time_spent = tuple((q[2] if type(q) == tuple else 0 for q in cur_state))
 
         # Iterate over all possible transitions
-        for tran_tuple in it.product(*[t.next_states_of_wts(q)
-                                       for t, q in zip(ts_tuple, cur_state)]):
-            # tran_tuple is a tuple of m-tuples (m: size of ts_tuple)
-
-            # First element of each tuple: next_state
-            # Second element of each tuple: time_left
-            next_state = tuple([t[0] for t in tran_tuple])
-            time_left = tuple([t[1] for t in tran_tuple])
-            control = tuple([t[2] for t in tran_tuple])
-
-            # Min time until next transition
-            w_min = min(time_left)
-
-            # Next state label. Singleton if transition taken, tuple if
-            # traveling state
-            next_state = tuple(((ss, ns, w_min+ts) if w_min < tl else ns
-                        for ss, ns, tl, ts in zip(
-                            source_state, next_state, time_left, time_spent)))
+        for next_state, w_min, control, perm in team_next_states(ts_tuple,
+                                                cur_state, groups, tables):
+            tran_data = {'weight': w_min, 'control': control}
+            if groups is not None:
+                tran_data['permutation'] = perm
 
             # Add node if new
             if next_state not in product_ts.g:
                 # Props satisfied at next_state is the union of props
-                # For each ts, get the prop of next state or empty set
-                # Note: we use .get(ns, {}) as this might be a travelling state
-                next_prop = set.union(*[ts.g.node.get(ns, {}).get('prop', set())
-                                       for ts, ns in zip(ts_tuple, next_state)])
+                next_prop = team_prop(ts_tuple, next_state)
 
                 # Add the new state
                 product_ts.g.add_node(next_state, {'prop': next_prop,
@@ -402,18 +442,125 @@ def ts_times_ts(ts_tuple):
 
                 # Add transition w/ weight
                 product_ts.g.add_edge(cur_state, next_state,
-                                attr_dict={'weight': w_min, 'control': control})
+                                      attr_dict=tran_data)
                 # Continue dfs from ns
                 stack.append(next_state)
 
             # Add tran w/ weight if new
             elif next_state not in product_ts.g[cur_state]:
                 product_ts.g.add_edge(cur_state, next_state,
-                                attr_dict={'weight': w_min, 'control': control})
+                                      attr_dict=tran_data)
 
     # Return ts_1 x ts_2 x ...
     return product_ts
 
+def expand_symmetric_run(team_ts, run, perm=None):
+    '''Returns the run of the full team corresponding to a run of a team
+    transition system constructed with symmetry reduction.
+
+    Parameters
+    ----------
+    team_ts: LOMAP Ts
+        Team transition system returned by `ts_times_ts()` with symmetry.
+
+    run: list of team states
+        Run on team_ts.
+
+    perm: tuple, optional (default: permutation of the initial state)
+        The permutation of the agents at the first state of the run, i.e.
+        agent i is at run[0][perm[i]].
+
+    Returns
+    -------
+    (full_run, perm): tuple
+        The list of team states of the full team and the permutation of the
+        agents at the last state of the run.
+    '''
+    if perm is None:
+        perm = team_ts.g.graph['init_permutation']
+    full_run = []
+    for k, state in enumerate(run):
+        if k > 0:
+            # the agent at position j moved to position tran_perm[j]
+            tran_perm = team_ts.g[run[k-1]][state][0]['permutation']
+            perm = tuple(tran_perm[j] for j in perm)
+        full_run.append(tuple(state[j] for j in perm))
+    return full_run, perm
+
+def compact_ts_times_ts(ts_tuple):
+    '''Computes the team transition system of a tuple of weighted
+    deterministic transition systems, see `ts_times_ts()`.
+
+    The team states are packed into integers and the transitions are stored in
+    arrays, which uses a fraction of the memory used by `ts_times_ts()`.
+    Propositions, labels and controls are generated on demand.
+
+    Parameters
+    ----------
+    ts_tuple: iterable of LOMAP weighted deterministic transition systems
+        The transition weights must be integers.
+
+    Returns
+    -------
+    team_ts: CompactTeamTs
+        Can be used in place of the result of `ts_times_ts()` by
+        `ts_times_buchi()` and `lomap.algorithms.optimal_run.optimal_run()`,
+        whose states are then state indices. Use `team_ts.to_ts()` to obtain
+        the result of `ts_times_ts()`.
+    '''
+    # NOTE: We assume deterministic TS
+    assert all((len(ts.init) == 1 for ts in ts_tuple))
+    encoder = TeamStateEncoder(ts_tuple)
+    init_code = encoder.encode(tuple((next(iter(ts.init)) for ts in ts_tuple)))
+
+    # Temporary state indices in the order of discovery
+    ids = {init_code: 0}
+    codes = array('q', [init_code])
+    sources, targets = array('q'), array('q')
+    weights, edge_ids = array('d'), array('q')
+
+    # Start depth first search from the initial state
+    stack = [init_code]
+    while stack:
+        cur_code = stack.pop()
+        u = ids[cur_code]
+        # Keep only the first transition to a state, like ts_times_ts()
+        seen = set()
+        for next_code, w_min, tran in encoder.next_states(cur_code):
+            if next_code in seen:
+                continue
+            seen.add(next_code)
+            v = ids.get(next_code, None)
+            if v is None:
+                v = ids[next_code] = len(codes)
+                codes.append(next_code)
+                stack.append(next_code)
+            sources.append(u)
+            targets.append(v)
+            weights.append(w_min)
+            edge_ids.extend(tran)
+    del ids
+
+    # Sort the states by code and the transitions by source state
+    codes = np.frombuffer(codes, dtype=np.int64)
+    order = np.argsort(codes)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(codes))
+    sources = rank[np.frombuffer(sources, dtype=np.int64)]
+    targets = rank[np.frombuffer(targets, dtype=np.int64)]
+    perm = np.argsort(sources, kind='mergesort')
+    index_type = np.int32 if len(codes) < 2**31 else np.int64
+    indptr = np.zeros(len(codes) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=len(codes)), out=indptr[1:])
+    edge_ids = np.frombuffer(edge_ids, dtype=np.int64).astype(np.int32)
+    team_ts = CompactTeamTs(encoder, codes[order], {int(rank[0]): 1}, indptr,
+                    targets[perm].astype(index_type),
+                    np.frombuffer(weights, dtype=np.float64)[perm],
+                    edge_ids.reshape((len(perm), len(ts_tuple)))[perm])
+    logger.info('Compact team TS with %d states and %d transitions',
+                *team_ts.size())
+    return team_ts
+
 def pfsa_default_transition_data(current_state, next_state, guard, bitmaps,
                                  fsa_tuple):
     '''Returns the default data to store for a transition of a product FSA.'''
@@ -615,6 +762,7 @@ def ts_times_fsas(ts, fsa_tuple, from_current=None, expand_finals=True,
                        for fsa_state, fsa in zip(act_init_pfsa, fsa_tuple)):
                         product_model.final.add(init_state)
 
+    successors = ts.successor_table()
     # Add all initial states to the stack
     stack = deque(product_model.init)
     # Consume the stack
@@ -625,8 +773,7 @@ def ts_times_fsas(ts, fsa_tuple, from_current=None, expand_finals=True,
         if not expand_finals and current_state in product_model.final:
             continue
         # Loop over next states of transition system
-        for ts_next_state, _, _ in ts.next_states_of_wts(ts_state,
-                                                     traveling_states=False):
+        for ts_next_state, _, _ in successors[ts_state]:
             # Get the propositions satisfied at the next state
             ts_next_prop = ts.g.node[ts_next_state].get('prop', set())
             # Get next product FSA state using the TS prop
@@ -678,6 +825,48 @@ def flatten_tuple(t):
             flat_tuple += (item,)
     return flat_tuple
 
+def _markov_tuple_next_states(markov_tuple, cur_state, tables):
+    '''Generates the transitions (next_state, weight, control, prob) of the
+    product of the Markov models from cur_state, a tuple of states of the
+    models. The components of next_state that are still traveling are
+    TravelingState objects, and control is flattened. The transitions of the
+    models are looked up in tables, their successor tables.
+    '''
+    # Actual source states of traveling states
+    source_state = tuple([q.source if isinstance(q, TravelingState)
+                          else q for q in cur_state])
+    # Time spent since actual source states
+    time_spent = tuple([q.elapsed if isinstance(q, TravelingState)
+                        else 0 for q in cur_state])
+
+    # Iterate over all possible transitions
+    for tran_tuple in it.product(*[table[q]
+                           for table, q in zip(tables, cur_state)]):
+        # tran_tuple is a tuple of m-tuples (m: size of ts_tuple)
+
+        # First element of each tuple: next_state
+        # Second element of each tuple: time_left
+        # Third element of each tuple: control
+        # Forth element of each tuple: tran_prob
+        next_state = tuple([t[0] for t in tran_tuple])
+        time_left = tuple([t[1] for t in tran_tuple])
+        control = tuple([t[2] for t in tran_tuple])
+        prob = tuple([t[3] for t in tran_tuple])
+
+        # Min time until next transition
+        w_min = min(time_left)
+        tran_prob = reduce(lambda x,y: x*y, prob)
+
+        # Next state label. Singleton if transition taken, tuple if
+        # traveling state
+        next_state = tuple(map(lambda ss, ns, tl, ts:
+                                    TravelingState((ss, ns, w_min+ts))
+                                    if w_min < tl else ns,
+                               source_state, next_state, time_left,
+                               time_spent))
+
+        yield next_state, w_min, flatten_tuple(control), tran_prob
+
 def markov_times_markov(markov_tuple):
     '''TODO:
     add option to choose what to save on the automaton's
@@ -693,6 +882,7 @@ def markov_times_markov(markov_tuple):
 
     # Stack for depth first search
     stack=[]
+    tables = [m.successor_table() for m in markov_tuple]
 
     # Find the initial states of the MDP
     for init_state in it.product(*map(lambda m: m.init.keys(), markov_tuple)):
@@ -719,47 +909,12 @@ def markov_times_markov(markov_tuple):
 
     while stack:
         cur_state = stack.pop()
-
-        # Actual source states of traveling states
-        source_state = tuple([q[0] if isinstance(q, tuple)
-                                        and len(q)==3
-                                        and isinstance(q[2], (int, float))
-                                        else q for q in cur_state])
-        # Time spent since actual source states
-        time_spent = tuple([q[2] if isinstance(q, tuple)
-                                        and len(q)==3
-                                        and isinstance(q[2], (int, float))
-                                        else 0 for q in cur_state])
+        flat_cur_state = flatten_tuple(cur_state)
 
         # Iterate over all possible transitions
-        for tran_tuple in it.product(*[t.next_states_of_markov(q)
-                               for t, q in zip(markov_tuple, cur_state)]):
-            # tran_tuple is a tuple of m-tuples (m: size of ts_tuple)
-
-            # First element of each tuple: next_state
-            # Second element of each tuple: time_left
-            # Third element of each tuple: control
-            # Forth element of each tuple: tran_prob
-            next_state = tuple([t[0] for t in tran_tuple])
-            time_left = tuple([t[1] for t in tran_tuple])
-            control = tuple([t[2] for t in tran_tuple])
-            prob = tuple([t[3] for t in tran_tuple])
-
-            # Min time until next transition
-            w_min = min(time_left)
-            tran_prob = reduce(lambda x,y: x*y, prob)
-
-            # Next state label. Singleton if transition taken, tuple if
-            # traveling state
-            next_state = tuple(map(lambda ss, ns, tl, ts: (ss,ns,w_min+ts)
-                                                         if w_min < tl else ns,
-                                   source_state, next_state, time_left,
-                                   time_spent))
-
-            # Compute flat labels
-            flat_cur_state = flatten_tuple(cur_state)
+        for next_state, w_min, flat_control, tran_prob in \
+                    _markov_tuple_next_states(markov_tuple, cur_state, tables):
             flat_next_state = flatten_tuple(next_state)
-            flat_control = flatten_tuple(control)
 
             # Add node if new
             if(flat_next_state not in mdp.g):
@@ -832,6 +987,7 @@ def markov_times_fsa(markov, fsa):
                 # Add this initial state to stack
                 stack.append(init_state)
 
+    successors = markov.successor_table()
     # Consume the stack
     while stack:
         cur_state = stack.pop()
@@ -839,8 +995,7 @@ def markov_times_fsa(markov, fsa):
         markov_state = cur_state[0]
         fsa_state = cur_state[1]
 
-        for markov_next in markov.next_states_of_markov(markov_state,
-                                                      traveling_states = False):
+        for markov_next in successors[markov_state]:
             markov_next_state = markov_next[0]
             markov_next_prop = markov.g.node[markov_next_state]['prop']
             weight = markov_next[1]
@@ -881,3 +1036,344 @@ def markov_times_fsa(markov, fsa):
                                             'prob': prob})
 
     return p
+
+def _markov_tuple_props(markov_tuple, states, prop_set_fn):
+    '''Returns the propositions of the states of the product of the Markov
+    models, given as a list of pairs (flat label, state), see
+    `markov_tuple_times_fsa()`.
+    '''
+    # Props satisfied at a state is the union of props of its components
+    # Note: we use .get(q, {}) as this might be a travelling state
+    props = [set.union(*[m.g.node.get(q, {}).get('prop', set())
+                         for m, q in zip(markov_tuple, state)])
+             for _, state in states]
+    if prop_set_fn is None:
+        return props
+
+    # Label the states in bulk on a model holding only these states
+    model = Markov()
+    for (flat_state, _), prop in zip(states, props):
+        model.g.add_node(flat_state, {'prop': prop})
+    prop_set_fn(model)
+    return [model.g.node[flat_state].get('prop', set())
+            for flat_state, _ in states]
+
+def markov_tuple_times_fsa(markov_tuple, fsa, prop_set_fn=None):
+    '''Returns the product of the Markov models in markov_tuple and the FSA,
+    i.e. the product MDP
+
+        mdp = markov_times_markov(markov_tuple)
+        prop_set_fn(mdp)
+        p = markov_times_fsa(mdp, fsa)
+
+    without building the product of the Markov models. The product is
+    explored breadth first. The transitions of each reachable state of the
+    product of the Markov models are computed once and shared by all states
+    of the FSA, and only the reachable states are labeled.
+
+    Parameters
+    ----------
+    markov_tuple : tuple of Markov objects
+        The Markov models, e.g. the MDP of a vehicle and the MCs of targets.
+
+    fsa : Fsa object
+
+    prop_set_fn : function, optional (default: None)
+        Function that takes a Markov object and sets the propositions of the
+        states of its graph, as for the product built by
+        `markov_times_markov()`. It is called once per level of the search
+        with a model holding only the new reachable states of the product of
+        the Markov models, whose 'prop' is the union of the propositions of
+        their components. If None, the union is used.
+
+    Returns
+    -------
+    p : Markov object
+        The product MDP, with the same states, transitions, initial and final
+        states as the one built by `markov_times_fsa()`.
+    '''
+    # Create the product_model
+    p = Markov()
+    p.name = 'Product of %s and %s' % (' x '.join([m.name
+                                         for m in markov_tuple]), fsa.name)
+    p.init = {}
+    p.final = set()
+
+    # Propositions and transitions of the reached states of the product of
+    # the Markov models, keyed by their flat labels
+    props = dict()
+    bitmaps = dict()
+    transitions = dict()
+    # Next states of the FSA keyed by state and bitmap of propositions
+    fsa_next_states = dict()
+
+    # Find the initial states of the product of the Markov models
+    init_prob = dict()
+    init_states = []
+    for init_state in it.product(*[m.init.keys() for m in markov_tuple]):
+        flat_init_state = flatten_tuple(init_state)
+        init_prob[flat_init_state] = reduce(op.mul,
+                    [m.init[s] for m, s in zip(markov_tuple, init_state)])
+        init_states.append((flat_init_state, init_state))
+    for (flat_state, _), prop in zip(init_states,
+            _markov_tuple_props(markov_tuple, init_states, prop_set_fn)):
+        props[flat_state] = prop
+        bitmaps[flat_state] = fsa.bitmap_of_props(prop)
+
+    tables = [m.successor_table() for m in markov_tuple]
+    # States (flat Markov state, Markov state, FSA state) of the current level
+    level = []
+    for flat_init_markov, init_markov in init_states:
+        init_prop = props[flat_init_markov]
+        # Iterate over the initial states of the FSA
+        for init_fsa in fsa.init.keys():
+            # Add the initial states to the graph and mark them as initial
+            for act_init_fsa in fsa.next_states(init_fsa, init_prop):
+                flat_init_state = flatten_tuple((flat_init_markov,
+                                                 act_init_fsa))
+                p.init[flat_init_state] = init_prob[flat_init_markov]
+                p.g.add_node(flat_init_state, {'prop': init_prop,
+                        'label':r'{}\n{:.2f}\n{}'.format(flat_init_state,
+                                    p.init[flat_init_state], list(init_prop))})
+                if act_init_fsa in fsa.final:
+                    p.final.add(flat_init_state)
+                level.append((flat_init_markov, init_markov, act_init_fsa))
+
+    while level:
+        # Compute the transitions of the new states of the product of the
+        # Markov models and collect the states they reach for the first time
+        new_states = dict()
+        for flat_markov_state, markov_state, _ in level:
+            if flat_markov_state in transitions:
+                continue
+            tran = []
+            targets = set()
+            for next_state, weight, control, prob in \
+                _markov_tuple_next_states(markov_tuple, markov_state, tables):
+                flat_next_state = flatten_tuple(next_state)
+                # Only the first transition between two states is kept, as
+                # in markov_times_markov()
+                if flat_next_state in targets:
+                    continue
+                targets.add(flat_next_state)
+                tran.append((flat_next_state, next_state, weight, control,
+                             prob))
+                if flat_next_state not in props:
+                    new_states[flat_next_state] = next_state
+            transitions[flat_markov_state] = tran
+
+        new_states = list(new_states.items())
+        for (flat_state, _), prop in zip(new_states,
+                _markov_tuple_props(markov_tuple, new_states, prop_set_fn)):
+            props[flat_state] = prop
+            bitmaps[flat_state] = fsa.bitmap_of_props(prop)
+
+        next_level = []
+        for flat_markov_state, _, fsa_state in level:
+            flat_cur_state = flatten_tuple((flat_markov_state, fsa_state))
+            for flat_markov_next, markov_next_state, weight, control, prob \
+                                            in transitions[flat_markov_state]:
+                next_prop = props[flat_markov_next]
+                key = (fsa_state, bitmaps[flat_markov_next])
+                fsa_next = fsa_next_states.get(key, None)
+                if fsa_next is None:
+                    fsa_next = fsa.next_states(fsa_state, next_prop)
+                    fsa_next_states[key] = fsa_next
+                for fsa_next_state in fsa_next:
+                    flat_next_state = flatten_tuple((flat_markov_next,
+                                                     fsa_next_state))
+
+                    if flat_next_state not in p.g:
+                        # Add the new state
+                        p.g.add_node(flat_next_state, {'prop': next_prop,
+                                    'label': "{}\\n{}".format(flat_next_state,
+                                                              list(next_prop))})
+
+                        # Add transition w/ weight and prob
+                        p.g.add_edge(flat_cur_state, flat_next_state,
+                                     attr_dict={'weight': weight,
+                                                'control': control,
+                                                'prob': prob})
+
+                        # Mark as final if final in fsa
+                        if fsa_next_state in fsa.final:
+                            p.final.add(flat_next_state)
+
+                        # Continue search from next state
+                        next_level.append((flat_markov_next,
+                                           markov_next_state, fsa_next_state))
+
+                    elif flat_next_state not in p.g[flat_cur_state]:
+                        p.g.add_edge(flat_cur_state, flat_next_state,
+                                     attr_dict={'weight': weight,
+                                                'control': control,
+                                                'prob': prob})
+        level = next_level
+
+    return p
+
+def update_ts_product(product_model, ts, automaton, added_edges=(),
+                      removed_edges=(), removed_nodes=(), relabeled_nodes=(),
+                      expand_finals=True,
+                      get_state_data=get_default_state_data,
+                      get_transition_data=get_default_transition_data):
+    '''Updates in place the product of a transition system and an automaton
+    after the transition system was changed.
+
+    Parameters
+    ----------
+    product_model: LOMAP Model
+        Product constructed by ts_times_buchi() or ts_times_fsa() from the
+        initial states.
+
+    ts: LOMAP transition system
+        The changed transition system.
+
+    automaton: LOMAP Buchi or FSA automaton
+
+    added_edges, removed_edges: iterables of (u, v) pairs of TS states
+        Added and removed transitions of the TS. Transitions whose weight or
+        control changed should be given as added transitions.
+
+    removed_nodes: iterable of TS states
+        Removed TS states (the transitions of these states are implicitly
+        removed).
+
+    relabeled_nodes: iterable of TS states
+        TS states whose propositions changed. New TS states are added with
+        the added transitions.
+
+    expand_finals: bool, optional (default: True)
+        Same as for ts_times_fsa().
+
+    get_state_data, get_transition_data: functions, optional
+        Same as for ts_times_fsa().
+
+    Returns
+    -------
+    (added_states, removed_states, modified_states): tuple of sets
+        The product states that were added or removed, and the states whose
+        outgoing transitions or data changed.
+
+    Notes
+    -----
+    Only the outgoing transitions of the product states corresponding to
+    the sources of the changed TS transitions and to the predecessors of the
+    relabeled TS states are recomputed, and only new states are explored.
+    States that lost an incoming transition, and the states reachable from
+    them, are checked for reachability from the initial states and the
+    states outside this region, and removed if unreachable. Thus, the work
+    is proportional to the size of the affected region of the product.
+    '''
+    g = product_model.g
+    added, removed, modified = set(), set(), set()
+    lost = set() # states which lost incoming transitions
+    stack = []
+
+    def states_of(ts_state):
+        '''Product states whose TS component is ts_state.'''
+        return [(ts_state, q) for q in automaton.g if (ts_state, q) in g]
+
+    def add_state(state):
+        prop = ts.g.node[state[0]].get('prop', set())
+        g.add_node(state, **get_state_data(state, prop=prop, ts=ts,
+                                           fsa=automaton))
+        if state[1] in automaton.final:
+            product_model.final.add(state)
+        added.add(state)
+        stack.append(state)
+
+    def remove_state(state):
+        lost.update(g.successors(state))
+        g.remove_node(state)
+        product_model.final.discard(state)
+        product_model.init.pop(state, None)
+        removed.add(state)
+
+    def expand(state):
+        '''(Re)computes the outgoing transitions of state and returns the
+        set of next states.'''
+        g.remove_edges_from(list(g.out_edges(state)))
+        if not expand_finals and state[1] in automaton.final:
+            return set()
+        next_states = set()
+        for next_state, weight, control in ts_times_buchi_next_states(ts,
+                                                            automaton, state):
+            if next_state not in g:
+                add_state(next_state)
+            transition_data = get_transition_data(state, next_state,
+                    weight=weight, control=control, ts=ts, fsa=automaton)
+            g.add_edge(state, next_state, attr_dict=transition_data)
+            next_states.add(next_state)
+        return next_states
+
+    # Remove the states of the removed TS states
+    removed_nodes = set(removed_nodes)
+    for ts_state in removed_nodes:
+        for state in states_of(ts_state):
+            remove_state(state)
+
+    # Update the data of the relabeled states
+    relabeled_nodes = set(relabeled_nodes) - removed_nodes
+    for ts_state in relabeled_nodes:
+        prop = ts.g.node[ts_state].get('prop', set())
+        for state in states_of(ts_state):
+            g.node[state].update(get_state_data(state, prop=prop, ts=ts,
+                                                fsa=automaton))
+            modified.add(state)
+
+    # Update the initial states if the label of an initial TS state changed
+    if (relabeled_nodes | removed_nodes) & set(ts.init) \
+                                    or removed_nodes & set(product_model.init):
+        init_states = set(ts_times_buchi_init_states(ts, automaton))
+        for state in set(product_model.init) - init_states:
+            del product_model.init[state]
+            lost.add(state)
+        for state in init_states:
+            product_model.init[state] = 1
+            if state not in g:
+                add_state(state)
+
+    # Recompute the transitions of the affected states
+    dirty = set(u for u, _ in it.chain(added_edges, removed_edges))
+    for ts_state in relabeled_nodes:
+        dirty.update(ts.g.predecessors(ts_state))
+    for ts_state in dirty - removed_nodes:
+        for state in states_of(ts_state):
+            if state in added:
+                continue # expanded below
+            old_next_states = set(g.successors(state))
+            next_states = expand(state)
+            lost.update(old_next_states - next_states)
+            modified.add(state)
+
+    # Explore the new states
+    while stack:
+        expand(stack.pop())
+
+    # Find the forward closure of the states which lost transitions
+    closure = set()
+    queue = [state for state in lost if state in g]
+    while queue:
+        state = queue.pop()
+        if state not in closure:
+            closure.add(state)
+            queue.extend(g.successors(state))
+    # States outside the closure are still reachable, reseed from them
+    reached = set(state for state in closure if state in product_model.init
+                  or any(p not in closure for p in g.predecessors(state)))
+    queue = list(reached)
+    while queue:
+        for next_state in g.successors(queue.pop()):
+            if next_state in closure and next_state not in reached:
+                reached.add(next_state)
+                queue.append(next_state)
+    for state in closure - reached:
+        g.remove_node(state)
+        product_model.final.discard(state)
+        removed.add(state)
+
+    logger.debug('Updated product: %d states added, %d removed, %d modified',
+                 len(added - removed), len(removed - added),
+                 len(modified - removed))
+    return (added - removed, removed - added, modified - removed)
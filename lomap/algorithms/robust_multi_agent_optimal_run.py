@@ -17,8 +17,6 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
 #from builtins import range
-import sys
-import traceback
 import logging
 
 from lomap.algorithms.product import ts_times_ts
@@ -26,6 +24,7 @@ from lomap.algorithms.optimal_run import optimal_run
 from lomap.algorithms.sync_seq import compute_sync_seqs
 from lomap.classes import Buchi
 from lomap.classes import Timer
+from lomap.classes.ts import is_traveling_state
 
 # Logger configuration
 logger = logging.getLogger(__name__)
@@ -63,13 +62,8 @@ def robust_multi_agent_optimal_run(ts_tuple, rhos, formula, opt_prop):
         # Construct the team_ts
         team_ts = ts_times_ts(ts_tuple)
         # Find the optimal run and shortest prefix on team_ts
-        try:
-            prefix_length, prefix_on_team_ts, suffix_cycle_cost, \
-               suffix_cycle_on_team_ts = optimal_run(team_ts, formula, opt_prop)
-        except: # FIXME: seems like a hack
-            exc_type, exc_value, exc_traceback = sys.exc_info()
-            traceback.print_tb(exc_traceback)
-            exit(1)
+        prefix_length, prefix_on_team_ts, suffix_cycle_cost, \
+           suffix_cycle_on_team_ts = optimal_run(team_ts, formula, opt_prop)
         # Pretty print the run
         pretty_print(len(ts_tuple), prefix_on_team_ts, suffix_cycle_on_team_ts)
         # Project the run on team_ts down to individual agents
@@ -101,7 +95,9 @@ def complement_ts_and_run(ts, prefix, suffix_cycle):
     '''TODO:
     '''
 
-    traveling_states = [x for x in prefix + suffix_cycle if type(x)==tuple]
+    # States visited by both the prefix and the suffix cycle are added once
+    traveling_states = list(set(x for x in prefix + suffix_cycle
+                                if is_traveling_state(ts, x)))
 
     if not traveling_states:
         return
@@ -0,0 +1,259 @@
+#! /usr/bin/python
+
+# Copyright (C) 2012-2015, Alphan Ulusoy (alphan@bu.edu)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import print_function
+
+import os
+import pickle
+import tempfile
+import logging
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+try:
+    from multiprocessing import shared_memory
+    shared_memory_available = True
+except ImportError:
+    shared_memory_available = False
+
+from lomap.algorithms.dijkstra import (graph_to_csr,
+                                       csr_subset_to_subset_dijkstra)
+
+# Logger configuration
+logger = logging.getLogger(__name__)
+#logger.addHandler(logging.NullHandler())
+
+__all__ = ['SharedCsrGraph', 'LocalCsrGraph', 'shared_dijkstra_job']
+
+
+# Shared graphs exported or attached by this process, keyed by block name
+_shared_graphs = dict()
+
+def _aligned(nbytes):
+    return -(-nbytes // 8) * 8
+
+
+class SharedCsrGraph(object):
+    '''Read-only graph in compressed sparse row (CSR) format stored in a single
+    shared memory block, or in a memory-mapped temporary file if shared memory
+    is not available.
+
+    The block holds the CSR arrays of the graph and of its reverse, and the
+    pickled list of node labels. Worker processes attach to the block using
+    the small picklable handle, without copying or deserializing the graph.
+
+    Examples
+    --------
+    >>> with SharedCsrGraph.from_graph(g) as graph:
+    >>>     executor.map(shared_dijkstra_job, sources, (graph.handle, targets))
+    '''
+
+    def __init__(self, handle, buf, owner=False, arrays=None):
+        '''Creates the views of the arrays stored in the buffer. If given, the
+        arrays are first copied to the buffer. Use `from_graph()` and
+        `attach()` to obtain objects of this class.
+        '''
+        self.handle = handle
+        self.owner = owner
+        self._buf = buf
+        self._nodes = None
+        self._index = None
+
+        _, _, n, nnz, _ = handle
+        views = []
+        offset = 0
+        for k, (dtype, count) in enumerate(((np.int32, n+1), (np.int32, nnz),
+                                            (np.float64, nnz)) * 2):
+            nbytes = np.dtype(dtype).itemsize * count
+            view = self._view(offset, nbytes).view(dtype)
+            if arrays is not None:
+                view[:] = arrays[k]
+            if not owner:
+                view.flags.writeable = False
+            views.append(view)
+            offset += _aligned(nbytes)
+        self._nodes_offset = offset
+
+        indptr, indices, data = views[:3]
+        self.csr = csr_matrix((data, indices, indptr), shape=(n, n),
+                              copy=False)
+        indptr, indices, data = views[3:]
+        self.reverse_csr = csr_matrix((data, indices, indptr), shape=(n, n),
+                                      copy=False)
+
+    def _view(self, offset, nbytes):
+        if isinstance(self._buf, np.ndarray): # memory-mapped file
+            return self._buf[offset:offset+nbytes]
+        return np.ndarray((nbytes,), dtype=np.uint8, buffer=self._buf.buf,
+                          offset=offset)
+
+    @classmethod
+    def from_graph(cls, G, weight_key='weight', nodelist=None):
+        '''Exports the graph G to a new shared memory block.
+        See `lomap.algorithms.dijkstra.graph_to_csr()` for the parameters.
+        '''
+        nodes, _, csr = graph_to_csr(G, weight_key=weight_key,
+                                     nodelist=nodelist)
+        reverse_csr = csr.transpose().tocsr()
+        pickled_nodes = pickle.dumps(nodes, pickle.HIGHEST_PROTOCOL)
+
+        arrays = [csr.indptr, csr.indices, csr.data,
+                  reverse_csr.indptr, reverse_csr.indices, reverse_csr.data]
+        size = sum(_aligned(a.nbytes) for a in arrays)
+        size += len(pickled_nodes)
+
+        if shared_memory_available:
+            buf = shared_memory.SharedMemory(create=True, size=max(size, 1))
+            handle = ('shm', buf.name, len(nodes), csr.nnz, len(pickled_nodes))
+        else:
+            fd, path = tempfile.mkstemp(prefix='lomap_', suffix='.csr')
+            os.close(fd)
+            buf = np.memmap(path, dtype=np.uint8, mode='w+',
+                            shape=(max(size, 1),))
+            handle = ('mmap', path, len(nodes), csr.nnz, len(pickled_nodes))
+
+        try:
+            graph = cls(handle, buf, owner=True, arrays=arrays)
+            graph._view(graph._nodes_offset, len(pickled_nodes))[:] = \
+                                np.frombuffer(pickled_nodes, dtype=np.uint8)
+        except BaseException:
+            # Remove the block, nobody else knows it
+            if shared_memory_available:
+                buf.close()
+                buf.unlink()
+            else:
+                del buf
+                os.remove(handle[1])
+            raise
+        graph._nodes = nodes
+        _shared_graphs[handle[1]] = graph
+        logger.debug('Exported graph with %d nodes and %d edges to %s',
+                     len(nodes), csr.nnz, handle[1])
+        return graph
+
+    @classmethod
+    def attach(cls, handle):
+        '''Returns the read-only graph corresponding to the handle. The block
+        is attached only once per process, and a process other than the
+        exporter detaches from the previously attached blocks.
+        '''
+        graph = _shared_graphs.get(handle[1], None)
+        if graph is None:
+            # The long-lived workers of an executor keep only the last block
+            # they attached to, the blocks of previous calls are released
+            for other in [x for x in _shared_graphs.values() if not x.owner]:
+                other.close()
+            backend, name, _, _, _ = handle
+            if backend == 'shm':
+                # The block is owned and unlinked by the exporter. Before
+                # Python 3.13, attaching does not register with the tracker.
+                try:
+                    buf = shared_memory.SharedMemory(name=name, track=False)
+                except TypeError:
+                    buf = shared_memory.SharedMemory(name=name)
+            else:
+                buf = np.memmap(name, dtype=np.uint8, mode='r')
+            graph = cls(handle, buf)
+            _shared_graphs[name] = graph
+        return graph
+
+    @property
+    def nodes(self):
+        '''The list of node labels, node nodes[i] has index i.'''
+        if self._nodes is None:
+            pickled_nodes = self._view(self._nodes_offset, self.handle[4])
+            self._nodes = pickle.loads(pickled_nodes.tobytes())
+        return self._nodes
+
+    @property
+    def index(self):
+        '''The dictionary mapping node labels to indices.'''
+        if self._index is None:
+            self._index = dict(zip(self.nodes, range(len(self.nodes))))
+        return self._index
+
+    def close(self):
+        '''Detaches from the block. The exporter also removes the block.'''
+        _shared_graphs.pop(self.handle[1], None)
+        self.csr = self.reverse_csr = None
+        if isinstance(self._buf, np.ndarray):
+            self._buf = None
+            if self.owner:
+                os.remove(self.handle[1])
+        else:
+            self._buf.close()
+            if self.owner:
+                self._buf.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class LocalCsrGraph(object):
+    '''Read-only graph in compressed sparse row (CSR) format stored in the
+    memory of the calling process, with the interface of `SharedCsrGraph`.
+    It is used instead of a shared graph when the jobs run in the calling
+    process, e.g. with the serial and thread executors, and its handle is the
+    graph itself.
+    '''
+
+    def __init__(self, G, weight_key='weight', nodelist=None):
+        '''See `lomap.algorithms.dijkstra.graph_to_csr()` for the
+        parameters.
+        '''
+        self.nodes, self.index, self.csr = graph_to_csr(G,
+                                    weight_key=weight_key, nodelist=nodelist)
+        self.reverse_csr = self.csr.transpose().tocsr()
+
+    @property
+    def handle(self):
+        return self
+
+    def close(self):
+        self.csr = self.reverse_csr = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def shared_dijkstra_job(source_ids, handle, target_ids, degen_paths=False,
+                        reverse=False):
+    '''Computes the shortest path lengths from the sources to the targets of a
+    shared graph, or of a local graph if handle is a `LocalCsrGraph`. See
+    `csr_subset_to_subset_dijkstra()`. If reverse is True, the searches run
+    on the reversed graph, i.e. they compute the lengths from the targets to
+    the sources.
+
+    Note: Job function for the executors in `lomap.algorithms.executors`.
+    '''
+    if isinstance(handle, LocalCsrGraph):
+        graph = handle
+    else:
+        graph = SharedCsrGraph.attach(handle)
+    csr, reverse_csr = graph.csr, graph.reverse_csr
+    if reverse:
+        csr, reverse_csr = reverse_csr, csr
+    return csr_subset_to_subset_dijkstra(source_ids, csr, target_ids,
+                           degen_paths=degen_paths, reverse_csr=reverse_csr)
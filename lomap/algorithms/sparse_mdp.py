@@ -0,0 +1,650 @@
+# Copyright (C) 2012-2015, Alphan Ulusoy (alphan@bu.edu)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import logging
+from collections import namedtuple
+
+import numpy as np
+from scipy.sparse import csr_matrix, identity
+from scipy.sparse.linalg import spsolve, bicgstab
+from scipy.sparse.csgraph import dijkstra, connected_components
+
+# Logger configuration
+logger = logging.getLogger(__name__)
+#logger.addHandler(logging.NullHandler())
+
+__all__ = ['SparseMdp', 'SolverResult', 'sparse_value_iteration', 'prob0',
+           'prob1', 'topological_value_iteration', 'policy_iteration',
+           'interval_iteration', 'extract_policy', 'policy_values']
+
+
+class SolverResult(namedtuple('SolverResult', ['values', 'pair_values'])):
+    '''Result of the solvers that work on a SparseMdp.
+
+    The result is a tuple (values, pair_values) of numpy arrays holding the
+    maximal probabilities of reaching the final states from the states and
+    from the state-action pairs, with the following additional attributes:
+
+    iterations : int
+        Number of iterations of the solver.
+
+    error : float or None
+        Bound on the absolute error of the values, or None if the solver does
+        not guarantee one.
+
+    backups : int or None
+        Number of Bellman backups of single states, or None if the solver
+        does not count them.
+    '''
+
+    def __new__(cls, values, pair_values, iterations=0, error=None,
+                backups=None):
+        self = super(SolverResult, cls).__new__(cls, values, pair_values)
+        self.iterations = iterations
+        self.error = error
+        self.backups = backups
+        return self
+
+
+class SparseMdp(object):
+    '''Markov model stored as a sparse matrix of transition probabilities,
+    with one row for each state-action pair.
+
+    Attributes
+    ----------
+    nodes : list
+        The states, i.e. state nodes[i] has index i.
+    index : dict
+        Maps states to their indices.
+    controls : list
+        The control of each state-action pair.
+    pair_state : numpy array
+        The index of the state of each state-action pair.
+    pair_ptr : numpy array
+        The state-action pairs of state i are pair_ptr[i]:pair_ptr[i+1].
+    matrix : SciPy CSR matrix
+        Probability of going from a state-action pair to a state.
+    final : numpy array
+        Boolean mask of the final states.
+    init : numpy array
+        The initial distribution.
+    '''
+
+    def __init__(self, p, actions=True):
+        '''Converts the Markov model p to sparse format.
+
+        Parameters
+        ----------
+        p : Markov object
+            Markov model with the probabilities of transitions stored as the
+            'prob' edge attribute, and the actions as the 'control' edge
+            attribute.
+
+        actions : Boolean, optional (default: True)
+            If False, the controls are ignored, i.e. all transitions of a
+            state form a single pair as in a Markov chain, and the controls
+            of all pairs are None.
+        '''
+        self.nodes = list(p.g.nodes())
+        self.index = dict(zip(self.nodes, range(len(self.nodes))))
+        index = self.index
+
+        self.controls = []
+        pair_state = []
+        rows, cols, probs = [], [], []
+        for k, s in enumerate(self.nodes):
+            pairs = dict()
+            for _, t, d in p.g.out_edges_iter((s,), data=True):
+                control = d['control'] if actions else None
+                pair = pairs.get(control, None)
+                if pair is None:
+                    pair = pairs[control] = len(self.controls)
+                    self.controls.append(control)
+                    pair_state.append(k)
+                rows.append(pair)
+                cols.append(index[t])
+                probs.append(d['prob'])
+
+        n, m = len(self.nodes), len(self.controls)
+        self.pair_state = np.array(pair_state, dtype=int)
+        self.pair_ptr = np.zeros(n + 1, dtype=int)
+        np.cumsum(np.bincount(self.pair_state, minlength=n),
+                  out=self.pair_ptr[1:])
+        # Parallel edges of the same pair are summed up
+        self.matrix = csr_matrix((np.array(probs, dtype=float),
+                                  (np.array(rows, dtype=int),
+                                   np.array(cols, dtype=int))), shape=(m, n))
+        # Transitions with probability 0 are not edges of the graph of p
+        self.matrix.eliminate_zeros()
+
+        self.final = np.zeros(n, dtype=bool)
+        self.final[[index[s] for s in p.final]] = True
+        self.init = np.zeros(n)
+        for s, prob in p.init.items():
+            self.init[index[s]] = prob
+
+    def size(self):
+        '''Returns the number of states and of state-action pairs.'''
+        return len(self.nodes), len(self.controls)
+
+    def pairs(self, k):
+        '''Returns the range of the state-action pairs of state k.'''
+        return range(self.pair_ptr[k], self.pair_ptr[k+1])
+
+    def pairs_of(self, states):
+        '''Returns the state-action pairs of the given state indices, and the
+        pointers ptr such that the pairs of states[i] are ptr[i]:ptr[i+1].
+        '''
+        counts = self.pair_ptr[states + 1] - self.pair_ptr[states]
+        ptr = np.zeros(len(states) + 1, dtype=int)
+        np.cumsum(counts, out=ptr[1:])
+        pairs = (np.repeat(self.pair_ptr[states] - ptr[:-1], counts)
+                 + np.arange(ptr[-1]))
+        return pairs, ptr
+
+    def max_over_actions(self, pair_values, default=0.0, ptr=None):
+        '''Returns the maximum of the values of the state-action pairs of each
+        state, and default for the states without pairs. The segments of the
+        pairs of the states are given by ptr, by default pair_ptr.
+        '''
+        return reduce_segments(np.maximum, pair_values,
+                               self.pair_ptr if ptr is None else ptr, default)
+
+    def distances_to(self, targets, pairs=None, min_prob=0):
+        '''Returns the least number of transitions from each state to the
+        states in the mask targets using only the state-action pairs in the
+        mask pairs, by default all pairs, and the transitions with probability
+        at least min_prob. The distance is infinite if the targets can not be
+        reached.
+        '''
+        targets = np.flatnonzero(targets)
+        if not len(targets):
+            return np.full(len(self.nodes), np.inf)
+        selected = np.ones(len(self.controls), dtype=bool) \
+                   if pairs is None else pairs
+        # Graph of the states induced by the selected pairs
+        matrix = self.matrix[selected]
+        if min_prob > 0:
+            matrix.data[matrix.data < min_prob] = 0
+            matrix.eliminate_zeros()
+        n = len(self.nodes)
+        to_pairs = csr_matrix((np.ones(matrix.shape[0]),
+                               (self.pair_state[selected],
+                                np.arange(matrix.shape[0]))),
+                              shape=(n, matrix.shape[0]))
+        graph = to_pairs.dot(matrix)
+        return dijkstra(graph.transpose().tocsr(), directed=True,
+                        indices=targets, unweighted=True, min_only=True)
+
+    def predecessors(self, targets, pairs=None):
+        '''Returns the mask of states that reach the states in the mask
+        targets with positive probability using only the state-action pairs in
+        the mask pairs, by default all pairs. The targets are included.
+        '''
+        return np.isfinite(self.distances_to(targets, pairs))
+
+    def to_dict(self, values):
+        '''Returns the dictionary mapping states to their values.'''
+        return dict(zip(self.nodes, values.tolist()))
+
+
+def reduce_segments(ufunc, values, ptr, default):
+    '''Returns the reductions of values[ptr[i]:ptr[i+1]] by the numpy ufunc,
+    e.g. np.maximum, and default for the empty segments.
+    '''
+    result = np.full(len(ptr) - 1, default, dtype=np.asarray(values).dtype)
+    starts = ptr[:-1]
+    non_empty = starts < ptr[1:]
+    if len(values):
+        # Only the starts of non-empty segments are passed to reduceat
+        result[non_empty] = ufunc.reduceat(values, starts[non_empty])
+    return result
+
+
+def argmax_segments(values, ptr):
+    '''Returns the index of the first maximum of each segment
+    values[ptr[i]:ptr[i+1]], and -1 for the empty segments.
+    '''
+    values = np.asarray(values)
+    maxima = reduce_segments(np.maximum, values, ptr, -np.inf)
+    owner = np.repeat(np.arange(len(ptr) - 1), np.diff(ptr))
+    positions = np.arange(len(values))
+    candidates = np.where(values >= maxima[owner], positions, len(values))
+    return reduce_segments(np.minimum, candidates, ptr, -1)
+
+
+def prob0(smdp, maximize=True):
+    '''Returns the mask of the states from which the final states are reached
+    with probability 0 under all policies (Prob0A), i.e. the maximal
+    probability is 0, or if maximize is False, under some policy (Prob0E).
+    '''
+    if maximize:
+        return ~smdp.predecessors(smdp.final)
+
+    # Least fixed point of the states that reach the final states with
+    # positive probability under all policies
+    reached = smdp.final.copy()
+    remaining = np.diff(smdp.pair_ptr)
+    pair_hit = np.zeros(len(smdp.controls), dtype=bool)
+    reverse = smdp.matrix.transpose().tocsr()
+    stack = np.flatnonzero(reached).tolist()
+    while stack:
+        t = stack.pop()
+        for pair in reverse.indices[reverse.indptr[t]:reverse.indptr[t+1]]:
+            if not pair_hit[pair]:
+                pair_hit[pair] = True
+                s = smdp.pair_state[pair]
+                remaining[s] -= 1
+                if remaining[s] == 0 and not reached[s]:
+                    reached[s] = True
+                    stack.append(s)
+    return ~reached
+
+
+def prob1(smdp, maximize=True):
+    '''Returns the mask of the states from which the final states are reached
+    with probability 1 under some policy (Prob1E), i.e. the maximal
+    probability is 1, or if maximize is False, under all policies (Prob1A).
+    '''
+    if not maximize:
+        # The policies that avoid the final states from the states of Prob0E
+        # with positive probability can be extended to the states that reach
+        # them without passing through the final states
+        not_final_pairs = ~smdp.final[smdp.pair_state]
+        return ~smdp.predecessors(prob0(smdp, maximize=False),
+                                  not_final_pairs)
+
+    # Greatest fixed point of the states that reach the final states with
+    # positive probability using pairs that do not leave the fixed point
+    states = np.ones(len(smdp.nodes), dtype=bool)
+    while True:
+        stay = smdp.matrix.dot((~states).astype(float)) == 0
+        new_states = smdp.predecessors(smdp.final,
+                                       stay & states[smdp.pair_state])
+        if (new_states == states).all():
+            return states
+        states = new_states
+
+
+def initial_values(smdp, precompute=True, start=None):
+    '''Returns the initial values of the states for the value iteration and
+    the mask of the states whose values must be iterated. If precompute is
+    True, the states with maximal probability 0 or 1 are found by graph
+    analysis, see `prob0()` and `prob1()`, and are not iterated. If given,
+    the iterated states start from the lower bounds start of their values.
+    '''
+    values = smdp.final.astype(float)
+    if precompute:
+        one = prob1(smdp)
+        values[one] = 1
+        maybe = ~(prob0(smdp) | one)
+    else:
+        maybe = ~smdp.final
+    if start is not None:
+        values[maybe] = np.maximum(values[maybe], start[maybe])
+    logger.info('Value iteration on %d of %d states', maybe.sum(),
+                len(smdp.nodes))
+    return values, maybe
+
+
+def _iterate(smdp, values, states, tol):
+    '''Updates the values of the given states in place by synchronous
+    Bellman backups until no value changes by tol or more. The values of
+    the other states are fixed. Returns the number of iterations.
+    '''
+    pairs, ptr = smdp.pairs_of(states)
+    matrix = smdp.matrix[pairs]
+    iterations = 0
+    while len(states):
+        iterations += 1
+        new_values = smdp.max_over_actions(matrix.dot(values), ptr=ptr)
+        # Values only increase as in the asynchronous value iteration
+        change = (new_values - values[states]).max()
+        np.maximum(new_values, values[states], out=new_values)
+        values[states] = new_values
+        if change < tol:
+            break
+    return iterations
+
+
+def sparse_value_iteration(smdp, tol=1e-9, precompute=True, start=None):
+    '''Computes the maximal probabilities of reaching the final states by
+    synchronous (Jacobi) value iteration using sparse matrix-vector products.
+
+    Parameters
+    ----------
+    smdp : SparseMdp object
+
+    tol : float, optional (default: 1e-9)
+        The iteration stops when no value changes by tol or more.
+
+    precompute : Boolean, optional (default: True)
+        If True, the states with maximal probability 0 or 1 are found by
+        graph analysis, see `prob0()` and `prob1()`, and only the values of
+        the other states are iterated.
+
+    start : array, optional (default: None)
+        Lower bounds of the values of the states, e.g. the values of a
+        policy, see `policy_values()`. The values only increase, so the
+        iteration must not start above the maximal probabilities.
+
+    Returns
+    -------
+    result : SolverResult object
+        The values of the states and of the state-action pairs.
+    '''
+    values, maybe = initial_values(smdp, precompute, start)
+    states = np.flatnonzero(maybe)
+    iterations = _iterate(smdp, values, states, tol)
+    logger.info('Sparse value iteration converged in %d iterations',
+                iterations)
+    return SolverResult(values, smdp.matrix.dot(values), iterations,
+                        backups=iterations * len(states))
+
+
+def scc_levels(smdp, states):
+    '''Returns the strongly connected components (SCCs) of the graph of the
+    given states by levels. The states of an SCC only lead to states in SCCs
+    of lower levels, or to states outside of the graph. Each entry is a pair
+    (states, cyclic) of a level: the SCCs with a single state and no
+    self-loop form one entry with cyclic False, whose states have no
+    transitions between them, and each of the other SCCs is an entry with
+    cyclic True. The entries are sorted by level.
+    '''
+    k = len(states)
+    if k == 0:
+        return []
+    local = np.full(len(smdp.nodes), -1, dtype=int)
+    local[states] = np.arange(k)
+    pairs, ptr = smdp.pairs_of(states)
+    # Graph of the given states induced by their pairs
+    matrix = smdp.matrix[pairs].tocoo()
+    inside = local[matrix.col] >= 0
+    owner = np.repeat(np.arange(k), np.diff(ptr))
+    u, v = owner[matrix.row[inside]], local[matrix.col[inside]]
+    graph = csr_matrix((np.ones(len(u)), (u, v)), shape=(k, k))
+    n_scc, scc = connected_components(graph, directed=True,
+                                      connection='strong')
+
+    # Longest path from each SCC to the sinks of the condensation
+    edges = np.unique(scc[u] * n_scc + scc[v])
+    edges = edges[edges // n_scc != edges % n_scc]
+    src, dst = edges // n_scc, edges % n_scc
+    out_degree = np.bincount(src, minlength=n_scc)
+    reverse = csr_matrix((np.ones(len(src)), (dst, src)),
+                         shape=(n_scc, n_scc))
+    level = np.zeros(n_scc, dtype=int)
+    stack = np.flatnonzero(out_degree == 0).tolist()
+    while stack:
+        c = stack.pop()
+        for b in reverse.indices[reverse.indptr[c]:reverse.indptr[c+1]]:
+            level[b] = max(level[b], level[c] + 1)
+            out_degree[b] -= 1
+            if out_degree[b] == 0:
+                stack.append(b)
+
+    # An SCC is cyclic if it has more than one state or a self-loop
+    scc_size = np.bincount(scc, minlength=n_scc)
+    cyclic = scc_size > 1
+    cyclic[scc[u[u == v]]] = True
+    # The acyclic SCCs of a level share the key -1
+    key = np.where(cyclic[scc], scc, -1)
+    order = np.lexsort((key, level[scc]))
+    bounds = np.flatnonzero(np.diff(level[scc][order])
+                            | np.diff(key[order])) + 1
+    return [(states[group], bool(cyclic[scc[group[0]]]))
+            for group in np.split(order, bounds)]
+
+
+def topological_value_iteration(smdp, tol=1e-9, precompute=True,
+                                start=None):
+    '''Computes the maximal probabilities of reaching the final states by
+    value iteration on the strongly connected components (SCCs) of the
+    graph, in reverse topological order, see `scc_levels()`. The states of
+    the acyclic SCCs of a level take a single backup together, and each of
+    the other SCCs is iterated on its own until no value changes by tol or
+    more.
+
+    See `sparse_value_iteration()` for the parameters and the returned
+    values.
+    '''
+    values, maybe = initial_values(smdp, precompute, start)
+    levels = scc_levels(smdp, np.flatnonzero(maybe))
+    backups = total_iterations = 0
+    for states, cyclic in levels:
+        if cyclic:
+            iterations = _iterate(smdp, values, states, tol)
+        else:
+            iterations = _iterate(smdp, values, states, float('inf'))
+        total_iterations += iterations
+        backups += iterations * len(states)
+    logger.info('Topological value iteration on %d components with %d '
+                'backups', len(levels), backups)
+    return SolverResult(values, smdp.matrix.dot(values), total_iterations,
+                        backups=backups)
+
+
+def solve_linear_system(matrix, b, x0=None, tol=1e-12):
+    '''Returns the solution of the sparse linear system matrix x = b. The
+    system is solved by the iterative BiCGSTAB method starting from x0, or by
+    the direct solver of SciPy if the iterative method does not converge.
+    '''
+    try:
+        x, info = bicgstab(matrix, b, x0=x0, rtol=tol, atol=0)
+    except TypeError: # SciPy < 1.12 names the relative tolerance tol
+        x, info = bicgstab(matrix, b, x0=x0, tol=tol, atol=0)
+    if info != 0:
+        logger.info('BiCGSTAB did not converge, using the direct solver')
+        x = spsolve(matrix.tocsc(), b)
+    return x
+
+
+def policy_values(smdp, policy, x0=None):
+    '''Returns the probabilities of reaching the final states under the
+    policy, given by the chosen pair of each state, or -1 for the states
+    without a control, which are assumed to stop with value 0. The values
+    are lower bounds of the maximal probabilities, and may be used to start
+    the value iteration, see `sparse_value_iteration()`.
+
+    The values of the states that reach the final states are computed by
+    solving a sparse linear system starting from the guess x0, if given.
+    '''
+    values = smdp.final.astype(float)
+    chosen = np.zeros(len(smdp.controls), dtype=bool)
+    chosen[policy[policy >= 0]] = True
+    states = np.flatnonzero(smdp.predecessors(smdp.final, chosen)
+                            & ~smdp.final)
+    if len(states):
+        rows = smdp.matrix[policy[states]]
+        values[states] = solve_linear_system(
+                            identity(len(states), format='csr')
+                            - rows[:, states], rows.dot(values),
+                            None if x0 is None else x0[states])
+    return values
+
+
+def extract_policy(smdp, optimal, min_prob=1e-9):
+    '''Returns the policy that chooses for each state one of its optimal
+    state-action pairs given by the mask optimal, and -1 for the states
+    without pairs.
+
+    A state chooses the optimal pair that leads closest to the final states
+    in the graph of the optimal pairs and of the transitions with probability
+    at least min_prob. Otherwise, the optimal pairs of a state can lead
+    around a cycle forever, e.g. when all their values are 1. The distances
+    are computed by a single breadth first search, see
+    `SparseMdp.distances_to()`. The states that can not reach the final
+    states choose their first optimal pair.
+
+    For details: "Control of Probabilistic Systems under Dynamic, Partially
+    Known Environments with Temporal Logic Specifications"
+    '''
+    n = len(smdp.nodes)
+    distances = smdp.distances_to(smdp.final, optimal, min_prob)
+    matrix = smdp.matrix
+    pair_distances = reduce_segments(np.minimum, distances[matrix.indices],
+                                     matrix.indptr, np.inf)
+    # Unreachable pairs come after the reachable ones, and the pairs that are
+    # not optimal after all others
+    scores = np.where(optimal, -np.minimum(pair_distances, n + 1), -(n + 2))
+    return argmax_segments(scores, smdp.pair_ptr)
+
+
+def policy_iteration(smdp, tol=1e-9, precompute=True, start=None):
+    '''Computes the maximal probabilities of reaching the final states by
+    policy iteration. The values of a policy are computed by solving a sparse
+    linear system, see `solve_linear_system()`, and the control of a state is
+    changed if it improves the value of the state by more than tol.
+
+    The states with maximal probability 0 are always excluded, see
+    `prob0()`. The initial policy decreases the distance to the states with
+    probability 1, so that the policies leave the remaining states with
+    probability 1, and the linear systems are non-singular.
+
+    See `sparse_value_iteration()` for the parameters and the returned
+    values.
+    '''
+    values, maybe = initial_values(smdp, precompute, start)
+    if not precompute:
+        maybe &= ~prob0(smdp)
+    states = np.flatnonzero(maybe)
+    pairs, ptr = smdp.pairs_of(states)
+    matrix = smdp.matrix[pairs]
+
+    # The pairs that lead closest to the states with probability 1
+    distances = smdp.distances_to(~maybe & (values == 1))
+    pair_distances = reduce_segments(np.minimum,
+                                     distances[matrix.indices],
+                                     matrix.indptr, np.inf)
+    policy = argmax_segments(-pair_distances, ptr)
+
+    identity_matrix = identity(len(states), format='csr')
+    fixed_values = values.copy()
+    fixed_values[states] = 0
+    iterations = 0
+    while len(states):
+        iterations += 1
+        # Policy evaluation
+        rows = matrix[policy]
+        values[states] = solve_linear_system(
+                                identity_matrix - rows[:, states],
+                                rows.dot(fixed_values), values[states])
+        # Policy improvement
+        pair_values = matrix.dot(values)
+        best = argmax_segments(pair_values, ptr)
+        improved = pair_values[best] > pair_values[policy] + tol
+        if not improved.any():
+            break
+        policy[improved] = best[improved]
+    logger.info('Policy iteration converged in %d iterations', iterations)
+    return SolverResult(values, smdp.matrix.dot(values), iterations)
+
+
+def maximal_end_components(smdp, states):
+    '''Returns the maximal end components (MECs) of the MDP restricted to
+    the given states. An MEC is a set of states and pairs, such that the
+    pairs lead only to states of the set, and each state of the set can be
+    reached from the others using only the pairs of the set.
+
+    Returns
+    -------
+    mec, internal : Tuple of numpy arrays
+        The index of the MEC of each of the given states, or -1 if the state
+        is not in an MEC, and the mask of the pairs of the states, ordered as
+        returned by `SparseMdp.pairs_of()`, that belong to their MEC.
+    '''
+    k = len(states)
+    local = np.full(len(smdp.nodes), -1, dtype=int)
+    local[states] = np.arange(k)
+    pairs, ptr = smdp.pairs_of(states)
+    matrix = smdp.matrix[pairs]
+    owner = np.repeat(np.arange(k), np.diff(ptr))
+    entry_pair = np.repeat(np.arange(len(pairs)), np.diff(matrix.indptr))
+    successors = local[matrix.indices]
+    inside = successors >= 0
+    internal = reduce_segments(np.logical_and, inside, matrix.indptr, True)
+    # Remove the pairs that leave the strongly connected components (SCCs)
+    # of the graph induced by the remaining pairs until none is removed
+    while True:
+        entries = internal[entry_pair] & inside
+        graph = csr_matrix((np.ones(entries.sum()),
+                            (owner[entry_pair[entries]],
+                             successors[entries])), shape=(k, k))
+        _, scc = connected_components(graph, directed=True,
+                                      connection='strong')
+        same = inside & (scc[successors] == scc[owner[entry_pair]])
+        new_internal = internal & reduce_segments(np.logical_and, same,
+                                                  matrix.indptr, True)
+        if (new_internal == internal).all():
+            break
+        internal = new_internal
+    in_mec = reduce_segments(np.logical_or, internal, ptr, False)
+    mec = np.full(k, -1, dtype=int)
+    _, mec[in_mec] = np.unique(scc[in_mec], return_inverse=True)
+    return mec, internal
+
+
+def interval_iteration(smdp, tol=1e-9, precompute=True, start=None):
+    '''Computes the maximal probabilities of reaching the final states by
+    interval iteration, i.e. value iteration on lower and upper bounds of the
+    values. The iteration stops when the bounds are less than 2*tol apart, and
+    the returned values are their midpoints, so the error is at most tol.
+
+    The upper bounds converge, because the maximal end components (MECs) of
+    the iterated states are collapsed, i.e. the states of an MEC take the
+    maximum over the pairs that leave the MEC, see
+    `maximal_end_components()`.
+
+    See `sparse_value_iteration()` for the parameters and the returned
+    values. The error attribute of the result is the bound on the error.
+    '''
+    lower, maybe = initial_values(smdp, precompute, start)
+    states = np.flatnonzero(maybe)
+    pairs, ptr = smdp.pairs_of(states)
+    mec, internal = maximal_end_components(smdp, states)
+
+    # Each MEC and each state that is not in an MEC forms a group
+    group = np.where(mec >= 0, mec, mec.max(initial=-1) + 1
+                                    + np.arange(len(states)))
+    _, group = np.unique(group, return_inverse=True)
+    owner = np.repeat(np.arange(len(states)), np.diff(ptr))
+    external = np.flatnonzero(~internal)
+    order = np.argsort(group[owner[external]], kind='stable')
+    external = external[order]
+    group_ptr = np.zeros(group.max(initial=-1) + 2, dtype=int)
+    np.cumsum(np.bincount(group[owner[external]], minlength=len(group_ptr)-1),
+              out=group_ptr[1:])
+    matrix = smdp.matrix[pairs[external]]
+
+    upper = lower.copy()
+    upper[states] = 1
+    iterations = 0
+    gap = 0.0
+    while len(states):
+        iterations += 1
+        new_lower = reduce_segments(np.maximum, matrix.dot(lower), group_ptr,
+                                    0.0)[group]
+        new_upper = reduce_segments(np.maximum, matrix.dot(upper), group_ptr,
+                                    0.0)[group]
+        lower[states] = np.maximum(lower[states], new_lower)
+        upper[states] = np.minimum(upper[states], new_upper)
+        gap = (upper[states] - lower[states]).max()
+        if gap < 2 * tol:
+            break
+    values = (lower + upper) / 2
+    logger.info('Interval iteration converged in %d iterations with error '
+                'bound %g', iterations, gap / 2)
+    return SolverResult(values, smdp.matrix.dot(values), iterations, gap / 2)
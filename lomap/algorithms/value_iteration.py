@@ -15,14 +15,100 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 import logging
 import collections as coll
+import heapq
+import itertools as it
+
+import numpy as np
+
+from .sparse_mdp import (SparseMdp, sparse_value_iteration,
+                         topological_value_iteration, policy_iteration,
+                         interval_iteration, extract_policy)
+from .parallel_mdp import parallel_value_iteration
 
 # Logger configuration
 logger = logging.getLogger(__name__)
 #logger.addHandler(logging.NullHandler())
 
-__all__ = ['policy_synthesis', 'compute_mrp']
+__all__ = ['policy_synthesis', 'compute_mrp', 'SynthesisResult']
+
+# Solvers that work on the sparse matrix of the product, see `SparseMdp`
+sparse_solvers = {
+	'sparse': sparse_value_iteration,
+	'topological': topological_value_iteration,
+	'policy': policy_iteration,
+	'interval': interval_iteration,
+	'parallel': parallel_value_iteration,
+}
+
+class SynthesisResult(coll.namedtuple('SynthesisResult',
+				['prob', 'act_val', 'act_max'])):
+	'''Result of policy_synthesis().
+
+	The result is a tuple (prob, act_val, act_max) with the following
+	additional attributes:
+
+	val : dictionary
+		Maximal probability of reaching the final states from each state.
+
+	method : string
+		The method used to compute the values.
+
+	iterations : int
+		Number of iterations of the method, i.e. sweeps over the states for
+		value iteration, rounds for backward value iteration, updates of
+		states for prioritized sweeping, or policy evaluations for policy
+		iteration.
+
+	error : float or None
+		Bound on the absolute error of the values, or None if the method does
+		not guarantee one.
+	'''
+
+	def __new__(cls, prob, act_val, act_max, val=None, method=None,
+				iterations=0, error=None):
+		self = super(SynthesisResult, cls).__new__(cls, prob, act_val,
+				act_max)
+		self.val = dict() if val is None else val
+		self.method = method
+		self.iterations = iterations
+		self.error = error
+		return self
+
+def compute_mrp(p, backward=False, method='async', tol=1e-9, executor=None):
+	'''Computes the probability of reaching the final states of the Markov
+	chain p from its initial distribution and from each state.
+
+	The method is either 'async' for the asynchronous value iteration over
+	the graph of p, forward or backward, 'prioritized' for the asynchronous
+	value iteration that updates the states in the order of the largest
+	pending changes of their values (prioritized sweeping), or one of the
+	solvers that work on the sparse matrix of p, see `SparseMdp`:
+
+	- 'sparse' for the synchronous value iteration,
+	- 'topological' for the value iteration on the strongly connected
+	  components in reverse topological order,
+	- 'policy' for the policy iteration,
+	- 'interval' for the interval iteration, which bounds the error,
+	- 'parallel' for the synchronous value iteration where the states are
+	  split among workers, see `parallel_value_iteration()`. The workers
+	  are given by executor, by default one process per CPU.
 
-def compute_mrp(p, backward=False):
+	The iteration stops when no value changes by tol or more. For
+	prioritized sweeping, a state is updated when the changes of the values
+	of its successors, weighted by the probabilities of the transitions, add
+	up to more than tol.
+
+	Returns the tuple (prob, exp_rwd), where exp_rwd maps states to their
+	probabilities.
+	'''
+
+	if method in sparse_solvers:
+		smdp = SparseMdp(p, actions=False)
+		values, _ = _solve(smdp, method, tol, executor)
+		exp_rwd = coll.defaultdict(float, smdp.to_dict(values))
+		return float(smdp.init.dot(values)), exp_rwd
+	elif method not in ('async', 'prioritized'):
+		raise ValueError('Unknown method: {}'.format(method))
 
 	# Initialize exp_rwd dict
 	exp_rwd = coll.defaultdict(float)
@@ -31,7 +117,27 @@ def compute_mrp(p, backward=False):
 	for s in p.final:
 		exp_rwd[s] = 1
 
-	if not backward:
+	if method == 'prioritized':
+		# Prioritized sweeping
+		predecessors = _predecessor_probs(p, controls=False)
+		queue = _SweepQueue(tol)
+		for s in p.final:
+			for r, prob in predecessors.get(s, ()):
+				queue.push(r, prob)
+
+		while queue:
+			s = queue.pop()
+			# Calculate new expected reward
+			new_rwd = 0
+			for _,t,d in p.g.out_edges_iter((s,), data=True):
+				new_rwd += exp_rwd[t]*d['prob']
+			# Update exp_rwd and schedule predecessors as necessary
+			if new_rwd > exp_rwd[s]:
+				change = new_rwd - exp_rwd[s]
+				exp_rwd[s] = new_rwd
+				for r, prob in predecessors.get(s, ()):
+					queue.push(r, change*prob)
+	elif not backward:
 		# Asynchronous value iteration
 		# states to consider during verification
 		states = set(p.g)-p.final
@@ -48,7 +154,7 @@ def compute_mrp(p, backward=False):
 					change = abs(new_rwd-exp_rwd[s])
 					max_change = max(max_change, change)
 					exp_rwd[s] = new_rwd
-			if max_change < 1e-9:
+			if max_change < tol:
 				done = True
 	else:
 		# Asynchronous backward value iteration
@@ -78,10 +184,48 @@ def compute_mrp(p, backward=False):
 	return (prob, exp_rwd)
 
 
-def policy_synthesis(p, backward=False):
+def policy_synthesis(p, backward=False, method='async', tol=1e-9,
+		executor=None, init_val=None):
+	'''Computes the policy of the product MDP p that maximizes the probability
+	of reaching its final states.
+
+	The method is either 'async' for the asynchronous value iteration over
+	the graph of p, forward or backward, 'prioritized' for the asynchronous
+	value iteration that updates the states in the order of the largest
+	pending changes of their values (prioritized sweeping), or one of the
+	solvers that work on the sparse matrix of p, see `SparseMdp`:
+
+	- 'sparse' for the synchronous value iteration,
+	- 'topological' for the value iteration on the strongly connected
+	  components in reverse topological order,
+	- 'policy' for the policy iteration,
+	- 'interval' for the interval iteration, which bounds the error,
+	- 'parallel' for the synchronous value iteration where the states are
+	  split among workers, see `parallel_value_iteration()`. The workers
+	  are given by executor, by default one process per CPU.
+
+	The iteration stops when no value changes by tol or more. For
+	prioritized sweeping, a state is updated when the changes of the values
+	of its successors, weighted by the probabilities of the transitions, add
+	up to more than tol.
+
+	The values of the states start from init_val, if given, a dictionary of
+	lower bounds of the maximal probabilities of some states, e.g. the
+	values of a policy. The values only increase, so they must not start
+	above the maximal probabilities.
+
+	Returns a SynthesisResult, i.e. the tuple (prob, act_val, act_max),
+	where act_val maps states to the values of their controls, and act_max
+	maps states to their optimal controls.
+	'''
+
+	if method in sparse_solvers:
+		return _sparse_policy_synthesis(p, method, tol, executor, init_val)
+	elif method not in ('async', 'prioritized'):
+		raise ValueError('Unknown method: {}'.format(method))
 
 	# states to be considered during synthesis
-	# (Used in classic value iteration and policy extraction)
+	# (Used in classic value iteration)
 	states = set(p.g) - p.final
 
 	# Initialize dicts
@@ -104,10 +248,55 @@ def policy_synthesis(p, backward=False):
 		for _,_,d in p.g.out_edges((s,), data=True):
 			act_val[s][d['control']] = 1
 
-	if not backward:
+	# Warm start, the optimal controls of these states are found again
+	warm = set()
+	if init_val:
+		warm = set(s for s in states if init_val.get(s, 0) > 0)
+		for s in warm:
+			val[s] = init_val[s]
+			act_max[s] = set()
+
+	iterations = 0
+	if method == 'prioritized':
+		# Prioritized sweeping
+		predecessors = _predecessor_probs(p)
+		queue = _SweepQueue(tol)
+		for s in p.final:
+			for r, prob in predecessors.get(s, ()):
+				queue.push(r, prob)
+		for s in warm:
+			for r, prob in predecessors.get(s, ()):
+				queue.push(r, val[s]*prob)
+
+		while queue:
+			iterations += 1
+			s = queue.pop()
+			old_val = val[s]
+			# Calculate reward for each control
+			ctrl_rwds = coll.defaultdict(float)
+			for _,t,d in p.g.out_edges_iter((s,), data=True):
+				ctrl_rwds[d['control']] += val[t]*d['prob']
+
+			# Update act_val and act_max for this state as required
+			for this_ctrl, this_rwd in ctrl_rwds.items():
+				diff = abs(this_rwd - val[s])
+				act_val[s][this_ctrl] = this_rwd
+				if diff <= 1e-9:
+					act_max[s].add(this_ctrl)
+				elif this_rwd > val[s]:
+					val[s] = this_rwd
+					act_max[s] = set([this_ctrl])
+
+			# Schedule the predecessors by the change of their values
+			if val[s] > old_val:
+				change = val[s] - old_val
+				for r, prob in predecessors.get(s, ()):
+					queue.push(r, change*prob)
+	elif not backward:
 		# Asynchronous value iteration
 		done = False
 		while not done:
+			iterations += 1
 			max_change = 0
 			# Consider states not in final set
 			for s in states:
@@ -127,16 +316,17 @@ def policy_synthesis(p, backward=False):
 						val[s] = this_rwd
 						act_max[s] = set([this_ctrl])
 
-			if max_change < 1e-9:
+			if max_change < tol:
 				done = True
 	else:
 		# Asynchronous backward value iteration
 		states_to_consider = set()
-		for s,_ in p.g.in_edges_iter(p.final):
+		for s,_ in p.g.in_edges_iter(p.final | warm):
 			states_to_consider.add(s)
 		states_to_consider -= p.final
 
 		while states_to_consider:
+			iterations += 1
 			new_states_to_consider = set()
 			for s in states_to_consider:
 				# Calculate reward for each control
@@ -158,61 +348,132 @@ def policy_synthesis(p, backward=False):
 
 			states_to_consider = new_states_to_consider
 
-	# Extract optimal policy
-	# For details: "Control of Probabilistic Systems under Dynamic,
-	# Partially Known Environments with Temporal Logic Specifications"
-
-	# Compute graph dist of each node to set of final states
-	# Only considering actions in act_max
-	# Distances of regular states set to inf
-	dist = coll.defaultdict(lambda:float('inf'))
-	# Distances of final states set to 0
-	for s in p.final:
-		dist[s] = 0
-
-	edges_to_process = p.g.in_edges_iter(p.final, data=True)
-	while edges_to_process:
-		new_edges_to_process = []
-		for s,t,d in edges_to_process:
-			# Only consider actions in act_max[s]
-			if d['control'] not in act_max[s] or d['prob'] < 1e-9:
-				continue
-			new_dist = dist[t] + 1
-			if new_dist < dist[s]:
-				dist[s] = new_dist
-				new_edges_to_process += p.g.in_edges([s], data=True)
-		edges_to_process = new_edges_to_process
+	# The warm started states that were not improved keep the controls
+	# attaining their values
+	for s in warm:
+		if not act_max[s] and act_val[s]:
+			best = max(act_val[s].values())
+			act_max[s] = set(ctrl for ctrl, rwd in act_val[s].items()
+					if rwd >= best - 1e-9)
 
-	for s in p.final:
-		# We don't care about what we do once we reach the final states
-		act_max[s] = act_max[s].pop()
-	for s in states:
-		if abs(val[s]) < 1e-9:
-			# We choose action arbitrarily for val[s] == 0
-			if act_max[s]:
-				act_max[s] = act_max[s].pop()
-			else:
-				# maybe removed in reduction step
-				act_max[s] = None
-		else:
-			if len(act_max[s]) == 1:
-				act_max[s] = act_max[s].pop()
-			else:
-				# Choose the action that takes us closer to satisfaction
-				best_act = None
-				best_dist = float('inf')
-				for a in act_max[s]:
-					this_dist = float('inf')
-					for t,_ in p.iter_action_edges(s,a):
-						this_dist = min(this_dist, dist[t])
-					if this_dist < best_dist:
-						best_dist = this_dist
-						best_act = a
-				act_max[s] = best_act
+	_extract_policy(p, act_max)
 
 	# Maximal reachability probability from initial states
 	prob = 0
 	for s in p.init:
 		prob += val[s] * p.init[s]
 
-	return (prob, act_val, act_max)
+	return SynthesisResult(prob, act_val, act_max, val, method, iterations)
+
+
+class _SweepQueue(object):
+	'''Priority queue of states for prioritized sweeping. The priority of a
+	state is the sum of the pushed changes since the state was last popped,
+	which bounds the change of its value. The state is queued while its
+	priority is larger than tol.
+	'''
+
+	def __init__(self, tol):
+		self.tol = tol
+		self.heap = []
+		self.pending = dict()
+		self.queued = dict()
+		self.count = it.count()
+
+	def __len__(self):
+		return len(self.queued)
+
+	def push(self, s, change):
+		priority = self.pending.get(s, 0) + change
+		self.pending[s] = priority
+		if priority > self.tol:
+			self.queued[s] = priority
+			# The count breaks ties, so that states are never compared
+			heapq.heappush(self.heap, (-priority, next(self.count), s))
+
+	def pop(self):
+		'''Removes and returns the state with the largest priority.'''
+		while True:
+			priority, _, s = heapq.heappop(self.heap)
+			# Skip the outdated entries
+			if self.queued.get(s, None) == -priority:
+				del self.queued[s]
+				del self.pending[s]
+				return s
+
+
+def _predecessor_probs(p, controls=True):
+	'''Returns the dictionary that maps each state s to the list of pairs
+	(r, prob), where r is a predecessor of s that is not final, and prob is
+	the largest probability to go from r to s using one of the controls of r.
+	If controls is False, prob is the probability to go from r to s using any
+	transition.
+	'''
+	probs = coll.defaultdict(lambda: coll.defaultdict(float))
+	for r,s,d in p.g.edges_iter(data=True):
+		if r not in p.final:
+			key = (r, d.get('control', None) if controls else None)
+			probs[s][key] += d['prob']
+	predecessors = dict()
+	for s, pair_probs in probs.items():
+		largest = dict()
+		for (r, _), prob in pair_probs.items():
+			largest[r] = max(largest.get(r, 0), prob)
+		predecessors[s] = list(largest.items())
+	return predecessors
+
+
+def _solve(smdp, method, tol, executor, init_val=None):
+	'''Calls the sparse solver of the method.'''
+	start = None
+	if init_val:
+		start = np.array([init_val.get(s, 0) for s in smdp.nodes],
+				dtype=float)
+	if method == 'parallel':
+		return parallel_value_iteration(smdp, tol, start=start,
+				executor='process' if executor is None else executor)
+	return sparse_solvers[method](smdp, tol, start=start)
+
+
+def _sparse_policy_synthesis(p, method, tol, executor, init_val):
+	'''Implements policy_synthesis() using a solver that works on the sparse
+	matrix of p.
+	'''
+	smdp = SparseMdp(p)
+	result = _solve(smdp, method, tol, executor, init_val)
+	values, pair_values = result
+
+	val = smdp.to_dict(values)
+	act_val = dict()
+	final_pairs = smdp.final[smdp.pair_state]
+	optimal = final_pairs | (pair_values >= values[smdp.pair_state] - 1e-9)
+	pair_values = np.where(final_pairs, 1, pair_values).tolist()
+	for k, s in enumerate(smdp.nodes):
+		act_val[s] = dict((smdp.controls[j], pair_values[j])
+				for j in smdp.pairs(k))
+
+	act_max = dict()
+	_set_policy(smdp, extract_policy(smdp, optimal), act_max)
+
+	# Maximal reachability probability from initial states
+	return SynthesisResult(float(smdp.init.dot(values)), act_val, act_max, val,
+			method, result.iterations, result.error)
+
+
+def _extract_policy(p, act_max):
+	'''Replaces the sets of optimal controls act_max[s] by one of them, see
+	`extract_policy()`.
+	'''
+	smdp = SparseMdp(p)
+	optimal = np.array([smdp.controls[j] in act_max[smdp.nodes[k]]
+			for j, k in enumerate(smdp.pair_state.tolist())], dtype=bool)
+	_set_policy(smdp, extract_policy(smdp, optimal), act_max)
+
+
+def _set_policy(smdp, policy, act_max):
+	'''Stores the controls of the pairs of the policy array in act_max, and
+	None for the states without controls.
+	'''
+	controls = smdp.controls
+	for s, j in zip(smdp.nodes, policy.tolist()):
+		act_max[s] = controls[j] if j >= 0 else None
@@ -21,10 +21,11 @@ from __future__ import absolute_import
 
 from lomap.classes.automata import Automaton, Buchi, Fsa, Rabin
 from lomap.classes.model import Model
-from lomap.classes.ts import Ts
+from lomap.classes.ts import Ts, TravelingState
 from lomap.classes.markov import Markov
 from lomap.classes.timer import Timer
 from lomap.classes.interval import Interval
+from lomap.classes.team import TeamStateEncoder, CompactTeamTs, LazyTeamTs
 
 def model_representer(dumper, model,
                       init_representer=list, final_representer=list):
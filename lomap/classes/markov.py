@@ -21,6 +21,7 @@ import copy
 import networkx as nx
 
 from lomap.classes.model import Model
+from lomap.classes.ts import is_traveling_state, TravelingState
 
 
 class Markov(Model):
@@ -39,6 +40,7 @@ class Markov(Model):
         if len(ts.init) != 1:
             raise Exception()
         nx.set_edge_attributes(self.g, name='prob', values=1.0)
+        self.invalidate_successor_table()
 
     def controls_from_run(self, run):
         """
@@ -54,35 +56,46 @@ class Markov(Model):
 
     def next_states_of_markov(self, q, traveling_states = True):
         """
-        Returns a tuple (next_state, remaining_time, control) for each outgoing
-        transition from q in a tuple.
+        Returns a tuple (next_state, remaining_time, control, prob) for each
+        outgoing transition from q in a tuple.
 
         Parameters:
         -----------
-        q : Node label or a tuple
-            A tuple stands for traveling states of the form (q,q',x), i.e.
+        q : Node label or a TravelingState
+            A TravelingState (q,q',x) stands for a traveling state, i.e.
             robot left q x time units ago and going towards q'.
 
         Notes:
         ------
         Only works for a regular weighted deterministic transition system
-        (not a nondet or team ts).
+        (not a nondet or team ts). The transitions are cached, see
+        `Model.successor_table()`, which loops over many states should index
+        directly.
         """
-        if(traveling_states and isinstance(q, tuple) and len(q)==3 and isinstance(q[2], (int, float))):
+        if traveling_states or q in self.g or isinstance(q, TravelingState):
+            return self.successor_table()[q]
+        # tuples that are not states are not traveling states if disabled
+        return ()
+
+    def _successors(self, q):
+        '''Returns the transitions of q for the successor table, see
+        `Model._successors()`.
+        '''
+        if is_traveling_state(self, q):
             # q is a tuple of the form (source, target, elapsed_time)
             source, target, elapsed_time = q
             # the last [0] is required because MultiDiGraph edges have keys
-            rem_time = self.g[source][target][0]['weight'] - elapsed_time
-            control = self.g[source][target][0].get('control', None)
-            prob = self.g[source][target][0]['prob']
+            data = self.g[source][target][0]
             # Return a tuple of tuples
-            return ((target, rem_time, control, prob),)
-        else:
-            # q is a normal state of the markov model
-            r = []
-            for source, target, data in self.g.out_edges_iter((q,), data=True):
-                r.append((target, data['weight'], data.get('control', None), data['prob']))
-            return tuple(r)
+            return ((target, data['weight'] - elapsed_time,
+                     data.get('control', None), data['prob']),)
+        if q not in self.g:
+            return None
+        # q is a normal state of the markov model
+        return tuple([(target, data['weight'], data.get('control', None),
+                       data['prob'])
+                      for _, target, data in self.g.out_edges_iter((q,),
+                                                                   data=True)])
 
     def iter_action_edges(self, s, a, keys=False):
         '''Iterate over the next states of an (state, action) pair.
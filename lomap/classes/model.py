@@ -25,18 +25,79 @@ except ImportError: # else use default PyYAML loader and dumper
     from yaml import Loader, Dumper
 
 
+def _counted(method):
+    '''Returns the graph method that also increments the graph version.'''
+    def counted_method(self, *args, **kwargs):
+        self.version += 1
+        return method(self, *args, **kwargs)
+    counted_method.__name__ = method.__name__
+    counted_method.__doc__ = method.__doc__
+    return counted_method
+
+class VersionedGraph(nx.Graph):
+    '''Graph that counts the modifications of its structure in the version
+    attribute, so that the data computed from the graph can be cached.
+    Changes of node or edge data made in place, e.g.
+    g[u][v][0]['weight'] = 1, are not counted, see
+    `Model.invalidate_successor_table()`.
+    '''
+    version = 0
+
+class VersionedDiGraph(nx.DiGraph):
+    __doc__ = VersionedGraph.__doc__
+    version = 0
+
+class VersionedMultiGraph(nx.MultiGraph):
+    __doc__ = VersionedGraph.__doc__
+    version = 0
+
+class VersionedMultiDiGraph(nx.MultiDiGraph):
+    __doc__ = VersionedGraph.__doc__
+    version = 0
+
+for _graph_type in (VersionedGraph, VersionedDiGraph, VersionedMultiGraph,
+                    VersionedMultiDiGraph):
+    for _name in ('add_node', 'add_nodes_from', 'remove_node',
+                  'remove_nodes_from', 'add_edge', 'add_edges_from',
+                  'remove_edge', 'remove_edges_from', 'clear'):
+        # bind the method of the networkx base class to avoid super() calls
+        setattr(_graph_type, _name,
+                _counted(getattr(_graph_type.__bases__[0], _name)))
+del _graph_type, _name
+
+
+class SuccessorTable(dict):
+    '''Cache of the outgoing transitions of the states of a model, see
+    `Model.successor_table()`. The transitions of a state are generated by
+    successors(q) when the state is looked up for the first time, which also
+    resolves whether q is a state of the graph or a traveling state. Keys for
+    which successors(q) returns None have no transitions and are not stored.
+    '''
+
+    def __init__(self, successors):
+        dict.__init__(self)
+        self.successors = successors
+
+    def __missing__(self, q):
+        r = self.successors(q)
+        if r is None:
+            return ()
+        self[q] = r
+        return r
+
+
 def graph_constructor(directed, multi):
     '''Returns the class to construct the appropriate graph type.'''
     if directed:
         if multi:
-            constructor = nx.MultiDiGraph
+            constructor = VersionedMultiDiGraph
         else:
-            constructor = nx.DiGraph
+            constructor = VersionedDiGraph
     else:
         if multi:
-            constructor = nx.MultiGraph
+            constructor = VersionedMultiGraph
         else:
-            constructor = nx.Graph
+            constructor = VersionedGraph
     return constructor
 
 
@@ -87,6 +148,54 @@ class Model(object):
     def size(self):
         return (self.g.number_of_nodes(), self.g.number_of_edges())
 
+    def successor_table(self):
+        '''Returns the `SuccessorTable` that caches the outgoing transitions
+        of the states of the model, e.g. for `Ts.next_states_of_wts()`. The
+        transitions of a state are generated by `_successors()` on its first
+        lookup, so loops over many states, e.g. the products, get the table
+        once and index it with the states.
+
+        The cache is cleared when the structure of the graph is modified or
+        the graph is replaced. Changes of node or edge data made in place are
+        not detected, so code changing e.g. weights in place must call
+        `invalidate_successor_table()`. If the graph does not count its
+        modifications, see `VersionedGraph`, a new table is returned by each
+        call.
+        '''
+        version = getattr(self.g, 'version', None)
+        if version is None:
+            return SuccessorTable(self._successors)
+        cache = getattr(self, '_successor_cache', None)
+        if cache is None or cache[0] is not self.g or cache[1] != version:
+            cache = self._successor_cache = (self.g, version,
+                                             SuccessorTable(self._successors))
+        return cache[2]
+
+    def _successors(self, q):
+        '''Returns the outgoing transitions of q stored by the successor
+        table, or None if q has no transitions, see `successor_table()`.
+        '''
+        raise NotImplementedError
+
+    def replace_successor_table(self, entries):
+        '''Sets the successor table of the current graph to a new table with
+        the given entries, a dictionary from states to their transitions.
+        Used after removing transitions from both the graph and the entries,
+        so that the transitions are not generated again.
+        '''
+        table = SuccessorTable(self._successors)
+        table.update(entries)
+        version = getattr(self.g, 'version', None)
+        if version is not None:
+            self._successor_cache = (self.g, version, table)
+
+    def invalidate_successor_table(self):
+        '''Clears the cache of outgoing transitions. Must be called after
+        changing the data of transitions in place, e.g. weights, see
+        `successor_table()`.
+        '''
+        self._successor_cache = None
+
     def visualize(self, edgelabel=None, draw='pygraphviz'):
         """
         Visualizes a LOMAP system model
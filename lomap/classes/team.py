@@ -0,0 +1,580 @@
+# Copyright (C) 2012-2015, Alphan Ulusoy (alphan@bu.edu)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import itertools as it
+import logging
+from collections.abc import Mapping
+
+import numpy as np
+
+from lomap.classes.model import SuccessorTable
+from lomap.classes.ts import Ts, TravelingState
+
+# Logger configuration
+logger = logging.getLogger(__name__)
+#logger.addHandler(logging.NullHandler())
+
+
+def interchangeable_agents(ts_tuple):
+    '''Returns the groups of indices of agents with identical transition
+    systems, i.e. with the same states, propositions and transitions.
+    '''
+    groups = []
+    for i, ts in enumerate(ts_tuple):
+        for group in groups:
+            other = ts_tuple[group[0]]
+            if ts is other or (ts.g.node == other.g.node
+                               and ts.g.edge == other.g.edge):
+                group.append(i)
+                break
+        else:
+            groups.append([i])
+    return groups
+
+
+def canonical_team_state(state, groups):
+    '''Returns the representative of the team states obtained by permuting
+    the states of interchangeable agents, and the permutation perm such that
+    canonical_state[perm[i]] == state[i].
+
+    Parameters
+    ----------
+    state: tuple
+        Team state, i.e. tuple of agent states.
+
+    groups: iterable of lists
+        Groups of indices of interchangeable agents, see
+        `interchangeable_agents()`.
+    '''
+    canonical_state = list(state)
+    perm = list(range(len(state)))
+    for group in groups:
+        if len(group) < 2:
+            continue
+        order = sorted(group, key=lambda i: repr(state[i]))
+        for pos, i in zip(group, order):
+            canonical_state[pos] = state[i]
+            perm[i] = pos
+    return tuple(canonical_state), tuple(perm)
+
+
+def agent_groups(ts_tuple, symmetry):
+    '''Returns the groups of interchangeable agents for the symmetry option
+    of `lomap.algorithms.product.ts_times_ts()`, or None if the symmetry
+    reduction is off.
+    '''
+    if symmetry is True:
+        return interchangeable_agents(ts_tuple)
+    elif symmetry:
+        return [list(group) for group in symmetry]
+    return None
+
+
+def team_init_state(ts_tuple, groups=None):
+    '''Returns the initial state of the team and the permutation of the
+    agents, see `canonical_team_state()`.
+    '''
+    init_state = tuple((next(iter(ts.init)) for ts in ts_tuple))
+    if groups is None:
+        return init_state, tuple(range(len(init_state)))
+    return canonical_team_state(init_state, groups)
+
+
+def team_prop(ts_tuple, state):
+    '''Returns the union of propositions satisfied by the agents.'''
+    # Note: we use .get(ns, {}) as this might be a travelling state
+    return set.union(*[ts.g.node.get(q, {}).get('prop', set())
+                       for ts, q in zip(ts_tuple, state)])
+
+
+def team_next_states(ts_tuple, state, groups=None, tables=None):
+    '''Returns the list of transitions of the team from a state as tuples
+    (next_state, weight, control, perm). If groups of interchangeable agents
+    are given, the next states are canonical and perm is the permutation of
+    the agents, otherwise perm is None. The transitions of the agents are
+    looked up in tables, the successor tables of the agents, see
+    `lomap.classes.model.Model.successor_table()`.
+    '''
+    if tables is None:
+        tables = [ts.successor_table() for ts in ts_tuple]
+    # Actual source states of traveling states
+    source_state = tuple((q.source if isinstance(q, TravelingState) else q
+                          for q in state))
+    # Time spent since actual source states
+    time_spent = tuple((q.elapsed if isinstance(q, TravelingState) else 0
+                        for q in state))
+
+    r = []
+    # Iterate over all possible transitions
+    for tran_tuple in it.product(*[table[q]
+                                   for table, q in zip(tables, state)]):
+        # tran_tuple is a tuple of m-tuples (m: size of ts_tuple)
+
+        # First element of each tuple: next_state
+        # Second element of each tuple: time_left
+        # Third element of each tuple: control
+        control = tuple([t[2] for t in tran_tuple])
+
+        # Min time until next transition
+        w_min = min([t[1] for t in tran_tuple])
+
+        # Next state label. Singleton if transition taken, tuple if
+        # traveling state
+        next_state = tuple([TravelingState((ss, t[0], w_min+ts))
+                            if w_min < t[1] else t[0]
+                            for t, ss, ts in zip(tran_tuple, source_state,
+                                                 time_spent)])
+
+        perm = None
+        if groups is not None:
+            next_state, perm = canonical_team_state(next_state, groups)
+        r.append((next_state, w_min, control, perm))
+    return r
+
+
+class LazyTeamTs(Ts):
+    """
+    Team transition system whose states and transitions are generated from
+    the agents' transition systems on demand.
+
+    The transitions of a state are generated and stored in the graph the
+    first time `next_states_of_wts()` is called for the state, so products
+    such as `lomap.algorithms.product.ts_times_buchi()` and the on-the-fly
+    searches create only the team states they reach. The states store their
+    propositions, but no labels.
+
+    Examples
+    --------
+    >>> team_ts = LazyTeamTs((ts_1, ts_2))
+    >>> product = ts_times_buchi(team_ts, buchi)
+    >>> len(team_ts.g) # number of team states created
+    """
+
+    def __init__(self, ts_tuple, symmetry=False):
+        '''Creates the initial state of the team.
+
+        Parameters
+        ----------
+        ts_tuple: iterable of LOMAP weighted deterministic transition systems
+
+        symmetry: bool or iterable of lists, optional (default: False)
+            See `lomap.algorithms.product.ts_times_ts()`.
+        '''
+        Ts.__init__(self, name='Lazy team')
+        self.ts_tuple = tuple(ts_tuple)
+        # NOTE: We assume deterministic TS
+        assert all((len(ts.init) == 1 for ts in self.ts_tuple))
+        self.groups = agent_groups(self.ts_tuple, symmetry)
+        init_state, perm = team_init_state(self.ts_tuple, self.groups)
+        if self.groups is not None:
+            self.g.graph['init_permutation'] = perm
+        self.init[init_state] = 1
+        self.g.add_node(init_state,
+                        attr_dict={'prop': team_prop(self.ts_tuple, init_state)})
+        # States whose transitions were generated
+        self.expanded = set()
+        # The transitions of expanded states do not change, so the table is
+        # kept while the graph grows
+        self._lazy_successors = SuccessorTable(self._successors)
+        self._agent_tables = [ts.successor_table() for ts in self.ts_tuple]
+
+    def expand(self, q):
+        '''Generates the transitions of state q, if not done already.'''
+        if q in self.expanded:
+            return
+        for next_state, w_min, control, perm in team_next_states(
+                    self.ts_tuple, q, self.groups, self._agent_tables):
+            if next_state not in self.g:
+                self.g.add_node(next_state, attr_dict={
+                        'prop': team_prop(self.ts_tuple, next_state)})
+            if next_state not in self.g[q]:
+                tran_data = {'weight': w_min, 'control': control}
+                if perm is not None:
+                    tran_data['permutation'] = perm
+                self.g.add_edge(q, next_state, attr_dict=tran_data)
+        self.expanded.add(q)
+
+    def expand_all(self):
+        '''Generates all reachable states and transitions of the team, i.e.
+        the result of `lomap.algorithms.product.ts_times_ts()`.
+        '''
+        stack = [q for q in self.g if q not in self.expanded]
+        while stack:
+            q = stack.pop()
+            self.expand(q)
+            stack.extend(v for v in self.g.successors(q)
+                         if v not in self.expanded)
+
+    def next_states_of_wts(self, q, traveling_states=True):
+        '''Returns a tuple (next_state, weight, control) for each outgoing
+        transition from team state q. The traveling_states parameter is
+        ignored, since the team states are always tuples.
+        '''
+        return self._lazy_successors[q]
+
+    def successor_table(self):
+        '''Returns the table of the transitions of the team states, which
+        are generated on the first lookup of each state, see
+        `Ts.successor_table()`.
+        '''
+        return self._lazy_successors
+
+    def _successors(self, q):
+        '''Expands q and returns its transitions for the successor table.'''
+        self.expand(q)
+        return tuple((v, d['weight'], d['control'])
+                     for _, v, d in self.g.out_edges_iter((q,), data=True))
+
+
+
+class TeamStateEncoder(object):
+    """
+    Packs the states of the team transition system of a tuple of weighted
+    deterministic transition systems into integers.
+
+    The state of an agent is either a state of its transition system or a
+    traveling state (source, target, elapsed_time). Each agent state is
+    mapped to a local code: the states of the transition system are numbered
+    from 0 to n-1, and the traveling states of the transitions from source to
+    target are numbered from n on, with one code per elapsed time from 0 to
+    weight-1. A team state is the mixed-radix number with the local codes as
+    digits, the first agent being the least significant digit.
+
+    Notes
+    -----
+    The transition weights must be integers, so that there is a finite number
+    of traveling states.
+    """
+
+    def __init__(self, ts_tuple):
+        self.ts_tuple = tuple(ts_tuple)
+        # Node labels, node indices, transitions, traveling offsets and moves
+        # of each agent
+        self.nodes, self.index, self.edges = [], [], []
+        self.offsets, self.moves, self.spent = [], [], []
+        self.radix = []
+
+        for ts in self.ts_tuple:
+            nodes = list(ts.g.nodes())
+            index = dict(zip(nodes, range(len(nodes))))
+            edges = list(ts.g.edges_iter(keys=True, data=True))
+            edge_ids, max_weights = dict(), dict()
+            for e, (u, v, key, data) in enumerate(edges):
+                weight = data['weight']
+                if weight != int(weight):
+                    raise ValueError('Team state encoding requires integer '
+                                     'weights, found {} on {}'.format(weight,
+                                                                      (u, v)))
+                edge_ids.setdefault((u, v), e)
+                max_weights[(u, v)] = max(max_weights.get((u, v), 0),
+                                          int(weight))
+            # Traveling codes of the transitions from source to target, one
+            # for each elapsed time from 0 to weight-1
+            offsets = dict()
+            n_codes = len(nodes)
+            for u, v, _, _ in edges:
+                if (u, v) not in offsets and max_weights[(u, v)] > 0:
+                    offsets[(u, v)] = n_codes
+                    n_codes += max_weights[(u, v)]
+
+            # The moves of each local code: (target node index, time left,
+            # transition index, traveling offset of transition)
+            moves = [[] for _ in range(n_codes)]
+            spent = [0] * n_codes
+            for e, (u, v, key, data) in enumerate(edges):
+                moves[index[u]].append((index[v], data['weight'], e,
+                                        offsets.get((u, v), -1)))
+            for (u, v), offset in offsets.items():
+                # The traveling time is given by the first parallel transition
+                e = edge_ids[(u, v)]
+                weight = ts.g[u][v][0]['weight']
+                for elapsed in range(max_weights[(u, v)]):
+                    moves[offset + elapsed] = [(index[v], weight - elapsed,
+                                                e, offset)]
+                    spent[offset + elapsed] = elapsed
+
+            self.nodes.append(nodes)
+            self.index.append(index)
+            self.edges.append(edges)
+            self.offsets.append(offsets)
+            self.moves.append([tuple(m) for m in moves])
+            self.spent.append(spent)
+            self.radix.append(n_codes)
+
+        self.strides = [1]
+        for radix in self.radix[:-1]:
+            self.strides.append(self.strides[-1] * radix)
+        self.n_codes = self.strides[-1] * self.radix[-1] if self.radix else 1
+        if self.n_codes > np.iinfo(np.int64).max:
+            raise ValueError('The team has too many states to be encoded: '
+                             '{}'.format(self.n_codes))
+        logger.debug('Team state encoding with radices %s', self.radix)
+
+    def encode_local(self, agent, q):
+        '''Returns the local code of the state q of an agent.'''
+        k = self.index[agent].get(q, None)
+        if k is not None:
+            return k
+        source, target, elapsed = q
+        return self.offsets[agent][(source, target)] + int(elapsed)
+
+    def decode_local(self, agent, k):
+        '''Returns the state of an agent given its local code.'''
+        nodes = self.nodes[agent]
+        if k < len(nodes):
+            return nodes[k]
+        target, _, e, _ = self.moves[agent][k][0]
+        return TravelingState((self.edges[agent][e][0], nodes[target],
+                               self.spent[agent][k]))
+
+    def encode(self, state):
+        '''Returns the code of a team state, i.e. a tuple of agent states.'''
+        return sum(self.encode_local(agent, q) * stride
+                   for agent, (q, stride) in enumerate(zip(state,
+                                                           self.strides)))
+
+    def local_codes(self, code):
+        '''Returns the tuple of local codes of a team state code.'''
+        digits = []
+        for radix in self.radix:
+            code, k = divmod(code, radix)
+            digits.append(k)
+        return tuple(digits)
+
+    def decode(self, code):
+        '''Returns the team state, i.e. a tuple of agent states, of a code.'''
+        return tuple(self.decode_local(agent, k)
+                     for agent, k in enumerate(self.local_codes(code)))
+
+    def prop(self, code):
+        '''Returns the union of propositions satisfied by the agents that are
+        not traveling.
+        '''
+        prop = set()
+        for agent, k in enumerate(self.local_codes(code)):
+            if k < len(self.nodes[agent]):
+                ts = self.ts_tuple[agent]
+                prop |= ts.g.node[self.nodes[agent][k]].get('prop', set())
+        return prop
+
+    def next_states(self, code):
+        '''Generates the transitions of the team from a state as tuples
+        (next code, weight, transition indices). The transitions are
+        generated in the order of `lomap.algorithms.product.ts_times_ts()`.
+        '''
+        digits = self.local_codes(code)
+        spent = [self.spent[agent][k] for agent, k in enumerate(digits)]
+        for tran_tuple in it.product(*[self.moves[agent][k]
+                                       for agent, k in enumerate(digits)]):
+            # Min time until next transition
+            w_min = min([m[1] for m in tran_tuple])
+            next_code = 0
+            for (target, time_left, _, offset), elapsed, stride in zip(
+                                        tran_tuple, spent, self.strides):
+                if w_min < time_left: # traveling state
+                    next_code += (offset + w_min + elapsed) * stride
+                else:
+                    next_code += target * stride
+            yield next_code, w_min, tuple([m[2] for m in tran_tuple])
+
+    def control(self, edge_ids):
+        '''Returns the tuple of agent controls of a team transition.'''
+        return tuple(self.edges[agent][e][3].get('control', None)
+                     for agent, e in enumerate(edge_ids))
+
+
+class CompactTeamNodes(Mapping):
+    """
+    Read-only mapping from the state indices of a `CompactTeamTs` to their
+    data, which holds the propositions generated on demand.
+    """
+
+    def __init__(self, team_ts):
+        self.team_ts = team_ts
+
+    def __getitem__(self, u):
+        if u not in self.team_ts.g:
+            raise KeyError(u)
+        return {'prop': self.team_ts.prop(u)}
+
+    def __iter__(self):
+        return iter(range(len(self.team_ts)))
+
+    def __len__(self):
+        return len(self.team_ts)
+
+
+class CompactTeamGraph(object):
+    """
+    Read-only view of the graph of a `CompactTeamTs` with the part of the
+    NetworkX interface used by the products and by
+    `lomap.algorithms.optimal_run.optimal_run()`. The nodes are the state
+    indices.
+    """
+
+    def __init__(self, team_ts):
+        self.team_ts = team_ts
+        self.node = CompactTeamNodes(team_ts)
+
+    def __len__(self):
+        return len(self.team_ts)
+
+    def __iter__(self):
+        return iter(range(len(self.team_ts)))
+
+    def __contains__(self, u):
+        return (isinstance(u, (int, np.integer)) and not isinstance(u, bool)
+                and 0 <= u < len(self.team_ts))
+
+    def nodes(self):
+        return list(range(len(self.team_ts)))
+
+    def number_of_nodes(self):
+        return len(self.team_ts)
+
+    def number_of_edges(self):
+        return len(self.team_ts.indices)
+
+    def successors(self, u):
+        return [v for v, _ in self.team_ts.successors(u)]
+
+
+class CompactTeamTs(object):
+    """
+    Team transition system with packed integer states and transitions stored
+    in arrays in compressed sparse row (CSR) format.
+
+    The states are identified by their indices, the states are sorted by their
+    codes. Propositions, labels and controls are generated on demand. Use
+    `lomap.algorithms.product.compact_ts_times_ts()` to construct objects of
+    this class.
+
+    The object can be used in place of a `Ts` by the products with automata,
+    e.g. `lomap.algorithms.product.ts_times_buchi()`, and by
+    `lomap.algorithms.optimal_run.optimal_run()`, whose runs are then given
+    by state indices. The graph attribute g is a read-only view with the
+    propositions of the states.
+
+    Attributes
+    ----------
+    encoder : TeamStateEncoder
+    codes : array of int64
+        The codes of the states.
+    init : dict
+        The initial state indices.
+    g : CompactTeamGraph
+        Read-only view of the states and their propositions.
+    indptr, indices, weights, edge_ids : arrays
+        The transitions of state u are indices[indptr[u]:indptr[u+1]], with
+        weights and agent transition indices (one row per team transition)
+        in the same positions.
+    """
+
+    def __init__(self, encoder, codes, init, indptr, indices, weights,
+                 edge_ids):
+        self.encoder = encoder
+        self.codes = codes
+        self.init = init
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.edge_ids = edge_ids
+        self.name = 'Compact team'
+        self.g = CompactTeamGraph(self)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def size(self):
+        return (len(self.codes), len(self.indices))
+
+    def node_of(self, state):
+        '''Returns the index of a team state, or None if not in the system.'''
+        code = self.encoder.encode(state)
+        u = int(np.searchsorted(self.codes, code))
+        if u < len(self.codes) and self.codes[u] == code:
+            return u
+        return None
+
+    def state(self, u):
+        '''Returns the team state, i.e. a tuple of agent states, of u.'''
+        return self.encoder.decode(int(self.codes[u]))
+
+    def prop(self, u):
+        '''Returns the set of propositions satisfied at u.'''
+        return self.encoder.prop(int(self.codes[u]))
+
+    def label(self, u):
+        '''Returns the label of u used by `ts_times_ts()`.'''
+        return "{}\\n{}".format(self.state(u), list(self.prop(u)))
+
+    def successors(self, u):
+        '''Returns the list of (next state index, weight) pairs of u.'''
+        start, stop = self.indptr[u], self.indptr[u+1]
+        return list(zip(self.indices[start:stop].tolist(),
+                        self.weights[start:stop].tolist()))
+
+    def control(self, k):
+        '''Returns the control of the k-th transition.'''
+        return self.encoder.control(self.edge_ids[k])
+
+    def next_states_of_wts(self, u, traveling_states=True):
+        '''Returns a tuple (next_state, weight, control) for each outgoing
+        transition from state index u, see `Ts.next_states_of_wts()`. The
+        traveling_states parameter is ignored, since the traveling states are
+        part of the team states.
+        '''
+        start, stop = self.indptr[u], self.indptr[u+1]
+        return tuple(zip(self.indices[start:stop].tolist(),
+                         self.weights[start:stop].tolist(),
+                         [self.control(k) for k in range(start, stop)]))
+
+    def successor_table(self):
+        '''Returns a table of the transitions of the state indices, see
+        `Ts.successor_table()`. The table is not kept by the object, so the
+        transitions are stored only while the caller uses it.
+        '''
+        return SuccessorTable(self.next_states_of_wts)
+
+    def run_states(self, run):
+        '''Returns the team states, i.e. tuples of agent states, of a run
+        given by state indices.
+        '''
+        return [self.state(u) for u in run]
+
+    def nodes_w_prop(self, propset):
+        '''Returns the set of state indices with given properties.'''
+        return set(u for u in range(len(self.codes))
+                   if propset <= self.prop(u))
+
+    def to_ts(self, labels=True):
+        '''Returns the team transition system as a `Ts` object with the same
+        states and transitions as `ts_times_ts()`.
+        '''
+        ts = Ts()
+        states = [self.state(u) for u in range(len(self.codes))]
+        for u, state in enumerate(states):
+            data = {'prop': self.prop(u)}
+            if labels:
+                data['label'] = "{}\\n{}".format(state, list(data['prop']))
+            ts.g.add_node(state, attr_dict=data)
+        for u in range(len(self.codes)):
+            for k in range(self.indptr[u], self.indptr[u+1]):
+                ts.g.add_edge(states[u], states[self.indices[k]],
+                              attr_dict={'weight': self.weights[k].item(),
+                                         'control': self.control(k)})
+        ts.init = dict((states[u], 1) for u in self.init)
+        return ts
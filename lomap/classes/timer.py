@@ -37,10 +37,16 @@ class Timer(object):
     >>> with lomap.Timer('Taking product'):
     >>>     time.sleep(0.1)
     Taking product took 100 ms.
+
+    >>> with lomap.Timer() as timer:
+    >>>     time.sleep(0.1)
+    >>> timer.duration
+    100.0
     """
     def __enter__(self):
         logger.debug('%s started.', self.op_name)
         self.start = time.time()
+        return self
     def __init__(self, op_name=None, template=None):
         if op_name is not None:
             self.op_name = op_name
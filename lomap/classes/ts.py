@@ -16,12 +16,42 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 #from builtins import next
 import itertools as it
+import operator as op
 
 import networkx as nx
 
 from lomap.classes.model import Model
 
 
+class TravelingState(tuple):
+    """
+    State (source, target, elapsed) of an agent that left state source
+    elapsed time units ago and is traveling towards state target. The class
+    marks traveling states, so that they are not confused with states that
+    are tuples. It is constructed from a tuple, compares equal to the tuple
+    and has the same representation.
+
+    Examples
+    --------
+    >>> q = TravelingState((1, 2, 0.5))
+    >>> q.target, q == (1, 2, 0.5)
+    (2, True)
+    """
+    __slots__ = ()
+
+    source = property(op.itemgetter(0), doc='The state the agent left.')
+    target = property(op.itemgetter(1), doc='The state the agent goes to.')
+    elapsed = property(op.itemgetter(2), doc='The time since leaving source.')
+
+def is_traveling_state(model, q, traveling_states=True):
+    '''Returns whether q is a traveling state of the model. For backward
+    compatibility, tuples that are not states of the model are also traveling
+    states, unless traveling_states is False.
+    '''
+    return isinstance(q, TravelingState) or (traveling_states
+                            and isinstance(q, tuple) and q not in model.g)
+
+
 class Ts(Model): #TODO: make independent of graph type
     """
     Base class for (weighted) transition systems.
@@ -48,29 +78,40 @@ class Ts(Model): #TODO: make independent of graph type
 
         Parameters:
         -----------
-        q : Node label or a tuple
-            A tuple stands for traveling states of the form (q,q',x), i.e.
+        q : Node label or a TravelingState
+            A TravelingState (q,q',x) stands for a traveling state, i.e.
             robot left q x time units ago and going towards q'.
 
         Notes:
         ------
         Only works for a regular weighted deterministic transition system
-        (not a nondet or team ts).
+        (not a nondet or team ts). The transitions are cached, see
+        `Model.successor_table()`, which loops over many states should index
+        directly.
         """
-        if(traveling_states and isinstance(q, tuple)):
+        if traveling_states or q in self.g or isinstance(q, TravelingState):
+            return self.successor_table()[q]
+        # tuples that are not states are not traveling states if disabled
+        return ()
+
+    def _successors(self, q):
+        '''Returns the transitions of q for the successor table, see
+        `Model._successors()`.
+        '''
+        if is_traveling_state(self, q):
             # q is a tuple of the form (source, target, elapsed_time)
             source, target, elapsed_time = q
             # the last [0] is required because MultiDiGraph edges have keys
-            rem_time = self.g[source][target][0]['weight'] - elapsed_time
-            control = self.g[source][target][0].get('control', None)
+            data = self.g[source][target][0]
             # Return a tuple of tuples
-            return ((target, rem_time, control),)
-        else:
-            # q is a normal state of the transition system
-            r = []
-            for source, target, data in self.g.edges_iter((q,), data=True):
-                r.append((target, data['weight'], data.get('control', None)))
-            return tuple(r)
+            return ((target, data['weight'] - elapsed_time,
+                     data.get('control', None)),)
+        if q not in self.g:
+            return None
+        # q is a normal state of the transition system
+        return tuple([(target, data['weight'], data.get('control', None))
+                      for _, target, data in self.g.edges_iter((q,),
+                                                               data=True)])
 
     def visualize(self, edgelabel='control', current_node=None,
                   draw='pygraphviz'):
@@ -0,0 +1,176 @@
+#! /usr/bin/python
+
+# Copyright (C) 2012-2015, Alphan Ulusoy (alphan@bu.edu)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import print_function
+
+import random
+
+import networkx as nx
+import numpy as np
+
+from lomap.algorithms.dijkstra import (dijkstra_to_all, dijkstra_to_set,
+                                       subset_to_subset_dijkstra_path_value,
+                                       bottleneck_floyd_warshall,
+                                       bounded_shortest_path,
+                                       bounded_shortest_path_lengths,
+                                       nearest_target_dijkstra,
+                                       DynamicDistanceToSet)
+
+
+def random_weighted_graph(n=60, p=0.08, seed=1):
+    '''Returns a random directed multi-graph with integer edge weights.'''
+    random.seed(seed)
+    g = nx.MultiDiGraph(nx.gnp_random_graph(n=n, p=p, seed=seed,
+                                            directed=True))
+    for _, _, d in g.edges_iter(data=True):
+        d['weight'] = random.randint(0, 10)
+    # add some parallel edges
+    for u, v in random.sample(g.edges(), 10):
+        g.add_edge(u, v, weight=random.randint(0, 10))
+    return g
+
+def test_dijkstra_to_set():
+    '''Compares the reverse multi-target search with one search per node.'''
+    g = random_weighted_graph()
+    targets = set(random.sample(g.nodes(), 5))
+
+    # the edges of undirected graphs are traversed in both directions
+    for g in (g, g.to_undirected()):
+        dist, next_hop = dijkstra_to_set(g, targets)
+        for u in g:
+            dists, _ = dijkstra_to_all(g, u, degen_paths=True)
+            expected = min([dists.get(t, float('inf')) for t in targets])
+            assert dist[u] == expected, (u, dist[u], expected)
+            if u in targets or expected == float('inf'):
+                assert next_hop[u] is None
+            else:
+                # the next hop is on a shortest path to the target set
+                v = next_hop[u]
+                w = min(d['weight'] for d in g[u][v].values())
+                assert w + dist[v] == dist[u]
+
+    g = nx.path_graph(5)
+    nx.set_edge_attributes(g, 'weight', 1)
+    dist, next_hop = dijkstra_to_set(g, {0, 4})
+    assert dist == {0: 0, 1: 1, 2: 2, 3: 1, 4: 0}
+    assert (next_hop[1], next_hop[3]) == (0, 4)
+
+def test_bottleneck_floyd_warshall():
+    '''Compares the bottleneck values with the 'max' Dijkstra search, and the
+    lengths with the shortest bounded paths.
+    '''
+    rng = np.random.RandomState(4)
+    n = 25
+    # small weights produce many tied bottlenecks
+    for max_weight in (20, 4):
+        weights = rng.randint(0, max_weight, size=(n, n)).astype(float)
+        weights[rng.rand(n, n) < 0.6] = float('inf')
+        g = nx.MultiDiGraph()
+        g.add_weighted_edges_from((i, j, weights[i, j])
+                                  for i in range(n) for j in range(n))
+
+        d_bot = subset_to_subset_dijkstra_path_value(range(n), g,
+                                        set(range(n)), combine_fn='max')
+        bottleneck, length = bottleneck_floyd_warshall(weights)
+        sources, targets = np.nonzero(np.isfinite(bottleneck))
+        exact = bounded_shortest_path_lengths(weights, sources, targets,
+                                              bottleneck[sources, targets])
+        exact = dict(zip(zip(sources.tolist(), targets.tolist()), exact))
+        for i in range(n):
+            for j in range(n):
+                assert bottleneck[i, j] == d_bot[i][j][0], (i, j)
+                if bottleneck[i, j] == float('inf'):
+                    assert length[i, j] == float('inf')
+                    continue
+                # the shortest min-bottleneck path is at most as long as the
+                # tie-breaking lengths
+                path_len, path = bounded_shortest_path(weights, i, j,
+                                                       bottleneck[i, j])
+                edges = list(zip(path[:-1], path[1:]))
+                assert path[0] == i and path[-1] == j and edges
+                assert max(weights[u, v] for u, v in edges) == bottleneck[i, j]
+                assert sum(weights[u, v] for u, v in edges) == path_len
+                assert path_len <= min(length[i, j], d_bot[i][j][1])
+                assert exact[(i, j)] == path_len, (i, j)
+
+def test_nearest_target_dijkstra():
+    '''Compares the multi-source search with one search per node.'''
+    g = random_weighted_graph()
+    random.seed(5)
+    sources = random.sample(g.nodes(), 3)
+    targets = random.sample(g.nodes(), 8)
+    targets.append(targets[2])
+
+    length, path, index = nearest_target_dijkstra(g, sources, targets)
+    dists = [dijkstra_to_all(g, u, degen_paths=True)[0] for u in sources]
+    expected = [min(d.get(t, float('inf')) for d in dists) for t in targets]
+    assert length == min(expected)
+    assert index == expected.index(length)
+    assert path[0] in sources and path[-1] == targets[index]
+    assert length == sum(min(d['weight'] for d in g[u][v].values())
+                         for u, v in zip(path[:-1], path[1:]))
+
+def test_dynamic_distance_to_set():
+    '''Compares the repaired distances with a search from scratch.'''
+    g = random_weighted_graph()
+    targets = set(random.sample(g.nodes(), 3))
+    table = DynamicDistanceToSet(g, targets)
+    for step in range(20):
+        changed_edges = []
+        for u, v, key in random.sample(g.edges(keys=True), 3):
+            g.remove_edge(u, v, key)
+            changed_edges.append((u, v))
+        for _ in range(3):
+            # may add new nodes
+            u, v = random.randrange(70), random.choice(g.nodes())
+            g.add_edge(u, v, weight=random.randint(0, 10))
+            changed_edges.append((u, v))
+        for u, v, key in random.sample(g.edges(keys=True), 3):
+            g[u][v][key]['weight'] = random.randint(0, 10)
+            changed_edges.append((u, v))
+        removed_nodes = [random.choice(g.nodes())]
+        g.remove_node(removed_nodes[0])
+        changed_edges = [e for e in changed_edges if removed_nodes[0] not in e]
+        targets.discard(removed_nodes[0])
+        added_targets = [random.choice(g.nodes())]
+        removed_targets = random.sample(sorted(targets), 1) if step % 2 else []
+        targets.update(added_targets)
+        targets.difference_update(removed_targets)
+
+        old_dist = dict(table.dist)
+        changed = table.update(changed_edges, removed_nodes, added_targets,
+                               removed_targets)
+        dist, _ = dijkstra_to_set(g, targets)
+        assert table.dist == dist, step
+        for u in set(old_dist) | set(dist):
+            if old_dist.get(u, float('inf')) != dist.get(u, float('inf')):
+                assert u in changed, (step, u)
+        for u in g:
+            if u in targets or dist[u] == float('inf'):
+                assert table.next_hop[u] is None
+            else:
+                v = table.next_hop[u]
+                w = min(d['weight'] for d in g[u][v].values())
+                assert w + dist[v] == dist[u]
+
+
+if __name__ == '__main__':
+    test_dijkstra_to_set()
+    test_bottleneck_floyd_warshall()
+    test_nearest_target_dijkstra()
+    test_dynamic_distance_to_set()
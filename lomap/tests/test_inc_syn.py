@@ -0,0 +1,218 @@
+# Copyright (C) 2012-2015, Alphan Ulusoy (alphan@bu.edu)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import print_function
+
+import random
+
+from lomap.classes import Fsa, Markov
+from lomap.algorithms.product import (markov_times_markov, markov_times_fsa,
+                                      markov_tuple_times_fsa)
+from lomap.algorithms.value_iteration import policy_synthesis, compute_mrp
+from lomap.algorithms.inc_syn import (incremental_synthesis, minimize_mdp,
+                                      _verification_product,
+                                      _projected_policy_values)
+
+
+def traps_case(traps=3, cells=6, seed=None):
+    '''Returns a vehicle moving along a corridor of cells, the MCs of traps
+    that turn on and off randomly, the FSA of (! unsafe U end), and the
+    function that sets the propositions of the states.
+    '''
+    rnd = random.Random(seed)
+    vehicle = Markov()
+    for u in range(cells):
+        vehicle.g.add_edge(u, u, attr_dict={'control': 'wait', 'weight': 1,
+                                            'prob': 1.0})
+        if u + 1 < cells:
+            vehicle.g.add_edge(u, u + 1, attr_dict={'control': 'go',
+                                                    'weight': 1, 'prob': 1.0})
+    vehicle.init = {0: 1}
+
+    targets = []
+    trap_cells = dict()
+    for i in range(traps):
+        target = Markov()
+        p_on, p_off = rnd.uniform(0.1, 0.5), rnd.uniform(0.1, 0.5)
+        for s, t, prob in [('off', 'off', 1 - p_on), ('off', 'on', p_on),
+                           ('on', 'on', 1 - p_off), ('on', 'off', p_off)]:
+            target.g.add_edge('t%d%s' % (i, s), 't%d%s' % (i, t),
+                              attr_dict={'weight': 1, 'prob': prob})
+        target.init = {'t%doff' % i: 1}
+        targets.append(target)
+        trap_cells['t%don' % i] = rnd.randrange(1, cells - 1)
+
+    fsa = Fsa(props=['unsafe', 'end'], multi=False)
+    bitmap = fsa.bitmap_of_props
+    fsa.g.add_edge('q0', 'q0', attr_dict={'input': {bitmap(set())}})
+    fsa.g.add_edge('q0', 'q1', attr_dict={'input': {bitmap({'end'}),
+                                                  bitmap({'end', 'unsafe'})}})
+    fsa.g.add_edge('q0', 'trap', attr_dict={'input': {bitmap({'unsafe'})}})
+    fsa.g.add_edge('q1', 'q1', attr_dict={'input': set(fsa.alphabet)})
+    fsa.g.add_edge('trap', 'trap', attr_dict={'input': set(fsa.alphabet)})
+    fsa.init['q0'] = 1
+    fsa.final.add('q1')
+
+    def set_props(mdp):
+        for s in mdp.g:
+            props = set()
+            if s[0] == cells - 1:
+                props.add('end')
+            if any(trap_cells.get(t, None) == s[0] for t in s[1:]):
+                props.add('unsafe')
+            mdp.g.node[s]['prop'] = props
+
+    return vehicle, targets, fsa, set_props
+
+def test_targets_product():
+    '''Compares the verification product using the cached products of the
+    remaining targets with the product of all MCs.
+    '''
+    # the weights of the transitions of the vehicle and the targets, and
+    # whether the products of the targets can be cached
+    for vehicle_weight, target_weight, cached in [(1, 1, True),
+                                                  (1, 2, False),
+                                                  (2, 2, True)]:
+        vehicle, targets, fsa, set_props = traps_case(traps=4, seed=1)
+        for m, weight in [(vehicle, vehicle_weight)] \
+                         + [(t, target_weight) for t in targets]:
+            for _, _, d in m.g.edges_iter(data=True):
+                d['weight'] = weight
+        mdp = markov_times_markov((vehicle, targets[0]))
+        set_props(mdp)
+        p = markov_times_fsa(mdp, fsa)
+        mc = Markov()
+        mc.mc_from_mdp_policy(p, policy_synthesis(p).act_max)
+
+        products = dict()
+        for k in range(1, 4):
+            remaining = targets[k:]
+            expected = markov_times_markov(tuple([mc] + remaining))
+            product = _verification_product(mc, remaining, products)
+            assert product.init == expected.init
+            assert set(product.g) == set(expected.g)
+            assert product.g.number_of_edges() \
+                   == expected.g.number_of_edges()
+            # The probabilities are multiplied in a different order
+            for u, v, d in product.g.edges_iter(data=True):
+                assert abs(d['prob'] - expected.g[u][v][0]['prob']) < 1e-12
+        # The product of the last two targets was reused
+        assert set(products) == ({2, 3} if cached else set())
+
+def test_projected_policy_values():
+    '''Checks that the values of the projected policy are lower bounds that
+    warm start the synthesis on the next product.
+    '''
+    for seed in range(3):
+        vehicle, targets, fsa, set_props = traps_case(seed=seed)
+        mdp = markov_times_markov((vehicle, targets[0]))
+        set_props(mdp)
+        result = policy_synthesis(markov_times_fsa(mdp, fsa))
+
+        state_cnt = len(next(iter(mdp.g)))
+        mdp = markov_times_markov((mdp, targets[1]))
+        set_props(mdp)
+        p = markov_times_fsa(mdp, fsa)
+        expected = policy_synthesis(p)
+        init_val = _projected_policy_values(p, state_cnt, result.act_max,
+                                            result.val)
+        assert all(init_val[s] <= expected.val[s] + 1e-9 for s in p.g)
+        assert any(init_val[s] > 0 for s in p.g if s not in p.final)
+
+        for method in ('async', 'sparse'):
+            warm = policy_synthesis(p, method=method, init_val=init_val)
+            assert abs(warm.prob - expected.prob) < 1e-6
+            assert all(abs(warm.val[s] - expected.val[s]) < 1e-6
+                       for s in p.g)
+
+def test_minimize_mdp():
+    '''Checks the controls kept by the minimization of the MDP.'''
+    vehicle, targets, fsa, set_props = traps_case(traps=4, seed=2)
+    mdp = markov_times_markov((vehicle, targets[0]))
+    set_props(mdp)
+    p = markov_times_fsa(mdp, fsa)
+    result = policy_synthesis(p)
+    mc = Markov()
+    mc.mc_from_mdp_policy(p, result.act_max)
+    mc = markov_times_markov(tuple([mc] + targets[1:]))
+    set_props(mc)
+    _, exp_rwd_ver = compute_mrp(markov_times_fsa(mc, fsa))
+
+    min_exp_rwd_ver = dict()
+    for s, rwd in exp_rwd_ver.items():
+        min_exp_rwd_ver[s[:2]] = min(min_exp_rwd_ver.get(s[:2], 1), rwd)
+    expected = set()
+    for s, ctrl_rwds in result.act_val.items():
+        for ctrl, rwd in ctrl_rwds.items():
+            if rwd > 0 and rwd + 1e-3 >= min_exp_rwd_ver.get(s[:-1], 0):
+                expected.add((s[:-1], ctrl))
+
+    edges = mdp.g.number_of_edges()
+    stats = minimize_mdp(mdp, result.act_val, exp_rwd_ver)
+    kept = set((s, d['control']) for s, _, d in mdp.g.edges_iter(data=True))
+    assert kept == expected
+    assert stats['states'] == len(mdp.g)
+    assert stats['edges'] - stats['removed_edges'] \
+           == mdp.g.number_of_edges() < edges
+    assert stats['controls'] - stats['removed_controls'] == len(kept)
+
+    # the successor table keeps the transitions of the remaining edges
+    pruned = dict(mdp.successor_table())
+    mdp.invalidate_successor_table()
+    assert pruned == dict((s, mdp.next_states_of_markov(s)) for s in mdp.g)
+
+def test_incremental_synthesis():
+    '''Runs the incremental synthesis, the states of the vehicle are not
+    tuples.
+    '''
+    vehicle, targets, fsa, set_props = traps_case(seed=0)
+    incremental_synthesis(vehicle, fsa, targets, set_props)
+
+def test_markov_tuple_times_fsa():
+    '''Compares the product built in one search with the product of the FSA
+    and the labeled product of the Markov models.
+    '''
+    for seed in range(4):
+        vehicle, targets, fsa, set_props = traps_case(seed=seed)
+        if seed % 2:
+            # the traps change slower than the vehicle moves
+            for target in targets:
+                for _, _, d in target.g.edges_iter(data=True):
+                    d['weight'] = 2
+        labeled = []
+        def count_props(mdp):
+            labeled.extend(mdp.g)
+            set_props(mdp)
+
+        markov_tuple = tuple([vehicle] + targets)
+        mdp = markov_times_markov(markov_tuple)
+        set_props(mdp)
+        expected = markov_times_fsa(mdp, fsa)
+        p = markov_tuple_times_fsa(markov_tuple, fsa, count_props)
+        assert p.init == expected.init and p.final == expected.final
+        assert dict(p.g.nodes_iter(data=True)) \
+               == dict(expected.g.nodes_iter(data=True))
+        assert sorted(p.g.edges_iter(data=True), key=repr) \
+               == sorted(expected.g.edges_iter(data=True), key=repr)
+        # each reachable state of the product of the models is labeled once
+        assert sorted(labeled) == sorted(mdp.g)
+
+if __name__ == '__main__':
+    test_targets_product()
+    test_projected_policy_values()
+    test_minimize_mdp()
+    test_incremental_synthesis()
+    test_markov_tuple_times_fsa()
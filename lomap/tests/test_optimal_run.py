@@ -0,0 +1,341 @@
+#! /usr/bin/python
+
+# Copyright (C) 2012-2015, Alphan Ulusoy (alphan@bu.edu)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import print_function
+
+import random
+import itertools as it
+
+import networkx as nx
+import numpy as np
+
+from lomap.classes import Buchi, Ts
+from lomap.algorithms.product import ts_times_buchi
+from lomap.algorithms.optimal_run import (min_bottleneck_cycle, find_best_cycle,
+                                          accepting_lasso, final_state_cycles,
+                                          suffix_cycle_cost, Budget,
+                                          BudgetExceeded,
+                                          NoSatisfyingCycleError, optimal_run)
+from lomap.algorithms.planning_session import PlanningSession
+from lomap.algorithms.multi_agent_optimal_run import multi_agent_optimal_run
+from lomap.algorithms.executors import ProcessExecutor
+from lomap.algorithms.dijkstra import (dijkstra_to_all,
+                                       bottleneck_floyd_warshall,
+                                       bounded_shortest_path,
+                                       csr_subset_to_subset_dijkstra)
+from lomap.algorithms import shared_graph
+
+
+def random_product(n=40, p=0.1, seed=2, max_weight=10):
+    '''Returns a random strongly connected graph together with the sets S and
+    F used by the minimum bottleneck cycle algorithm.
+    '''
+    random.seed(seed)
+    g = nx.MultiDiGraph()
+    nodes = [(i, 'q{}'.format(i % 3)) for i in range(n)]
+    # a Hamiltonian cycle ensures strong connectivity
+    for u, v in zip(nodes, nodes[1:] + nodes[:1]):
+        g.add_edge(u, v, weight=random.randint(1, max_weight))
+    for u in nodes:
+        for v in nodes:
+            if u != v and random.random() < p:
+                g.add_edge(u, v, weight=random.randint(1, max_weight))
+    s = set(random.sample(nodes, 8))
+    f = set(random.sample(nodes, 4))
+    return g, s, f
+
+def cycle_cost(g, cycle, s):
+    '''Returns the maximum time between two visits to S along the cycle.'''
+    weights = [min(d['weight'] for d in g[u][v].values())
+               for u, v in zip(cycle[:-1], cycle[1:])]
+    visits = [i for i, u in enumerate(cycle[:-1]) if u in s]
+    assert visits
+    gaps = [sum(weights[i:j]) for i, j in zip(visits, visits[1:])]
+    gaps.append(sum(weights[visits[-1]:]) + sum(weights[:visits[0]]))
+    return max(gaps)
+
+def cycle_length(g, cycle):
+    '''Returns the total weight of the cycle.'''
+    return sum(min(d['weight'] for d in g[u][v].values())
+               for u, v in zip(cycle[:-1], cycle[1:]))
+
+def best_cycle_cost(g, s, f):
+    '''Returns the cost and the length of the best cycle by an exhaustive
+    search over F x S x S, with the lengths of the shortest minimum
+    bottleneck paths between the states of S.
+    '''
+    s_list = list(s)
+    dists = dict((u, dijkstra_to_all(g, u, degen_paths=True)[0])
+                 for u in s | f)
+    weights = np.array([[dijkstra_to_all(g, u, degen_paths=False)[0].get(v,
+                        float('inf')) for v in s_list] for u in s_list])
+    bottleneck, _ = bottleneck_floyd_warshall(weights)
+
+    best = (float('inf'), float('inf'))
+    for ff in f:
+        for (i, s1), (j, s2) in it.product(enumerate(s_list), repeat=2):
+            f_s_cost = dists[ff].get(s1, float('inf')) \
+                       + dists[s2].get(ff, float('inf'))
+            if s1 == s2 and ff != s1:
+                best = min(best, (f_s_cost, f_s_cost))
+            elif bottleneck[i, j] < float('inf'):
+                length, _ = bounded_shortest_path(weights, i, j,
+                                                  bottleneck[i, j])
+                best = min(best, (max(f_s_cost, bottleneck[i, j]),
+                                  f_s_cost + length))
+    return best
+
+def test_min_bottleneck_cycle():
+    g, s, f = random_product()
+    timings = dict()
+    cost, cycle = min_bottleneck_cycle(g, s, f, timings=timings)
+    assert cycle[0] == cycle[-1] and cycle[0] in f
+    # the cycle attains the reported cost, which is the optimum
+    assert cycle_cost(g, cycle, s) == cost
+    assert (cost, cycle_length(g, cycle)) == best_cycle_cost(g, s, f)
+    assert set(timings) == {'S->S+F', 'F->S', 'S-bottleneck', 'Path*',
+                            'Path extraction'}
+
+    # no state of S is reachable from F
+    try:
+        min_bottleneck_cycle(g, set(), f)
+        assert False, 'Expected NoSatisfyingCycleError'
+    except NoSatisfyingCycleError:
+        pass
+
+    for executor in ('thread', 'process'):
+        cost_par, cycle_par = min_bottleneck_cycle(g, s, f, executor=executor,
+                                                   chunk_size=3)
+        assert (cost, cycle) == (cost_par, cycle_par), executor
+
+    # the calls share the workers of an executor object
+    with ProcessExecutor(2) as executor:
+        assert min_bottleneck_cycle(g, s, f, executor=executor,
+                                    chunk_size=3) == (cost, cycle)
+        pool = executor._pool
+        assert pool is not None
+        assert min_bottleneck_cycle(g, s, f, executor=executor,
+                                    chunk_size=3) == (cost, cycle)
+        assert executor._pool is pool
+    assert executor._pool is None
+
+    # the exported graph is removed when a job or the lookup of S fails
+    for executor in ('serial', 'process'):
+        try:
+            min_bottleneck_cycle(g, set(s) | {'not a node'}, f,
+                                 executor=executor)
+            assert False, 'Expected KeyError'
+        except KeyError:
+            pass
+        assert not shared_graph._shared_graphs, executor
+
+def test_min_bottleneck_cycle_ties():
+    '''Compares the cycles of graphs with many tied bottlenecks with the
+    exhaustive search.
+    '''
+    for seed in range(6):
+        g, s, f = random_product(n=25, p=0.15, seed=seed, max_weight=3)
+        cost, cycle = min_bottleneck_cycle(g, s, f)
+        assert (cost, cycle_length(g, cycle)) == best_cycle_cost(g, s, f), seed
+        assert cycle_cost(g, cycle, s) <= cost
+
+    # The path 1 -> 2 -> ... -> 11 of weight 1 edges is the minimum bottleneck
+    # path from 1 to 11, but the edge 1 -> 11 of weight 3 gives the shortest
+    # bounded path from 1 to 12, so the cycles through 1 and 2 tie in cost.
+    g = nx.MultiDiGraph()
+    chain = list(range(1, 12))
+    g.add_weighted_edges_from((u, v, 1) for u, v in zip(chain[:-1], chain[1:]))
+    g.add_weighted_edges_from([(1, 11, 3), (11, 12, 5), (12, 0, 1), (0, 1, 2),
+                               (0, 2, 1)])
+    s, f = set(chain + [12]), {0}
+    cost, cycle = min_bottleneck_cycle(g, s, f)
+    assert best_cycle_cost(g, s, f) == (5, 11)
+    assert (cost, cycle_length(g, cycle)) == (5, 11)
+    assert cycle == [0, 1, 11, 12, 0]
+
+def test_find_best_cycle():
+    '''Compares the blocked search with an exhaustive search over F x S x S.'''
+    rng = np.random.RandomState(3)
+    n_f, n_s = 6, 9
+    # small integer values produce many ties
+    d_f_to_s = rng.randint(0, 5, size=(n_f, n_s)).astype(float)
+    d_s_to_f = rng.randint(0, 5, size=(n_s, n_f)).astype(float)
+    bot_cost = rng.randint(0, 5, size=(n_s, n_s)).astype(float)
+    bot_len = bot_cost + rng.randint(0, 5, size=(n_s, n_s))
+    d_f_to_s[0, :] = float('inf')
+    bot_cost[1, 2] = bot_len[1, 2] = float('inf')
+    f_in_s = np.array([-1, 4, -1, 0, -1, 7])
+
+    cost_star, len_star, cycle_star = float('inf'), float('inf'), None
+    for ff, s1, s2 in it.product(range(n_f), range(n_s), range(n_s)):
+        cost = this_len = d_f_to_s[ff, s1] + d_s_to_f[s2, ff]
+        if not (s1 == s2 and f_in_s[ff] != s1):
+            cost = max(cost, bot_cost[s1, s2])
+            this_len += bot_len[s1, s2]
+        if cost < cost_star or (cost == cost_star and this_len < len_star):
+            cost_star, len_star, cycle_star = cost, this_len, (ff, s1, s2)
+
+    for block_size in (1, 10, 2**20):
+        assert find_best_cycle(range(n_f), d_f_to_s, d_s_to_f, bot_cost,
+                               bot_len, f_in_s, block_size) \
+               == (cost_star, len_star, cycle_star), block_size
+
+def gf_buchi():
+    '''Returns the Buchi automaton of the formula G F a.'''
+    b = Buchi(props=['a'])
+    b.g.add_edge('q0', 'q0', attr_dict={'input': {0}})
+    b.g.add_edge('q0', 'q1', attr_dict={'input': {1}})
+    b.g.add_edge('q1', 'q1', attr_dict={'input': {1}})
+    b.g.add_edge('q1', 'q0', attr_dict={'input': {0}})
+    b.init['q0'] = 1
+    b.final.add('q1')
+    return b
+
+def random_ts(n=30, seed=1):
+    '''Returns a random transition system with propositions a and b.'''
+    random.seed(seed)
+    t = Ts()
+    for u in range(n):
+        prop = {'a'} if u % 7 == 3 else ({'b'} if u % 5 == 0 else set())
+        t.g.add_node(u, attr_dict={'prop': prop})
+    for u in range(n):
+        t.g.add_edge(u, (u+1) % n, attr_dict={'weight': random.randint(1, 5)})
+        for v in random.sample(range(n), 2):
+            t.g.add_edge(u, v, attr_dict={'weight': random.randint(1, 5)})
+    t.init[0] = 1
+    return t
+
+def test_anytime_phases():
+    t, b = random_ts(), gf_buchi()
+    p = ts_times_buchi(t, b)
+    s = p.nodes_w_prop({'b'})
+    weight = lambda u, v: min(d['weight'] for d in p.g[u][v].values())
+
+    prefix, cycle, _ = accepting_lasso(t, b)
+    assert prefix[0] in p.init and prefix[-1] == cycle[0] == cycle[-1]
+    assert all(p.g.has_edge(u, v) for u, v in zip(prefix[:-1], prefix[1:]))
+    assert all(p.g.has_edge(u, v) for u, v in zip(cycle[:-1], cycle[1:]))
+    assert set(cycle) & p.final
+
+    # the final state cycles are feasible, so not better than the optimum
+    cost, _ = min_bottleneck_cycle(p.g, s, p.final)
+    costs = [suffix_cycle_cost(cycle, weight, s)
+             for cycle in final_state_cycles(p, s)]
+    assert costs and min(costs) >= cost
+
+    try:
+        accepting_lasso(t, b, Budget(max_expansions=3))
+        assert False, 'Expected BudgetExceeded'
+    except BudgetExceeded:
+        pass
+
+def test_planning_session():
+    '''Compares the queries of a session with optimal_run().'''
+    t = random_ts()
+    # stub the translation of the formula, the session translates it once
+    from_formula = Buchi.from_formula
+    calls = []
+    def gf_from_formula(self, formula):
+        calls.append(formula)
+        self.__dict__.update(gf_buchi().__dict__)
+    Buchi.from_formula = gf_from_formula
+    # the sets S of {b} and {a} are disjoint, the one of the empty set has
+    # all states and overlaps both
+    queries = ({'b'}, {'a'}, set(), {'b'})
+    try:
+        expected = [optimal_run(t, 'G F a', opt_prop) for opt_prop in queries]
+        for executor in ('serial', 'process'):
+            check_planning_session(t, executor, queries, expected)
+            assert not shared_graph._shared_graphs
+        assert calls.count('G F a') == len(queries) + 2
+    finally:
+        Buchi.from_formula = from_formula
+
+def check_planning_session(t, executor, queries, expected):
+    '''Runs the queries in a session and compares them with the results of
+    optimal_run().
+    '''
+    with PlanningSession(t, 'G F a', executor=executor) as session:
+        assert session.sizes['SRFS'] > 0
+        for opt_prop, expected_result in zip(queries, expected):
+            s = session.product.nodes_w_prop(opt_prop)
+            new = [u for u in s if session.index[u] not in session.s_pos]
+            cached = len(session.s_ids)
+
+            result = session.optimal_run(opt_prop)
+            assert result.prefix_length == expected_result.prefix_length, \
+                   opt_prop
+            assert result.suffix_cycle_cost \
+                   == expected_result.suffix_cycle_cost, opt_prop
+
+            prefix, cycle = result.prefix_on_p, result.suffix_cycle_on_p
+            assert prefix[0] in session.product.init
+            assert prefix[-1] == cycle[0] == cycle[-1]
+            assert set(cycle) & session.product.final
+            assert cycle_cost(session.product.g, cycle, s) \
+                   <= result.suffix_cycle_cost
+
+            # only the lengths from and to the new states of S are computed,
+            # the cache holds the lengths between the states of S
+            n = cached + len(new)
+            assert len(session.s_ids) == n, opt_prop
+            assert session.s_dist.shape == (n, n), opt_prop
+        # the last query is answered from the cache
+        assert not new and len(session.s_ids) == len(session.nodes)
+
+        # the cached lengths are the non-degenerate shortest path lengths
+        s_dist = csr_subset_to_subset_dijkstra(session.s_ids, session.csr,
+                                               session.s_ids, degen_paths=False)
+        assert np.allclose(session.s_dist, s_dist)
+
+def test_compact_multi_agent_optimal_run():
+    '''Compares the runs on the compact team with the runs on the team.'''
+    ts_tuple = (random_ts(n=8, seed=1), random_ts(n=8, seed=2))
+    # the traveling times of the team are given by the first parallel edge
+    for ts in ts_tuple:
+        ts.g.remove_edges_from([(u, v, key) for u, v, key
+                                in ts.g.edges_iter(keys=True) if key != 0])
+    from_formula = Buchi.from_formula
+    Buchi.from_formula = lambda self, formula: \
+                                self.__dict__.update(gf_buchi().__dict__)
+    try:
+        expected = multi_agent_optimal_run(ts_tuple, 'G F a', {'b'})
+        result = multi_agent_optimal_run(ts_tuple, 'G F a', {'b'},
+                                         compact=True)
+    finally:
+        Buchi.from_formula = from_formula
+    # the prefixes lead to optimal cycles that may differ by tie-breaking
+    assert result[2] == expected[2]
+    for prefix, suffix_cycle, ts in zip(result[1], result[3], ts_tuple):
+        assert prefix[0] in ts.init and set(prefix + suffix_cycle) <= set(ts.g)
+
+    try:
+        multi_agent_optimal_run(ts_tuple, 'G F a', {'b'}, symmetry=True,
+                                compact=True)
+        assert False, 'Expected ValueError'
+    except ValueError:
+        pass
+
+
+if __name__ == '__main__':
+    test_min_bottleneck_cycle()
+    test_min_bottleneck_cycle_ties()
+    test_find_best_cycle()
+    test_anytime_phases()
+    test_planning_session()
+    test_compact_multi_agent_optimal_run()
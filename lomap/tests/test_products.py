@@ -16,13 +16,20 @@
 
 from __future__ import print_function
 
+import random
+
 import networkx as nx
 from networkx.utils import generate_unique_node
 import matplotlib.pyplot as plt
 
-from lomap.classes import Buchi, Ts
-from lomap.algorithms.product import ts_times_buchi
+from lomap.classes import Buchi, Ts, LazyTeamTs, TravelingState
+from lomap.algorithms.product import (ts_times_buchi, update_ts_product,
+                                      ts_times_ts, compact_ts_times_ts,
+                                      canonical_team_state,
+                                      expand_symmetric_run)
 from lomap.algorithms.dijkstra import source_to_target_dijkstra
+from lomap.algorithms.robust_multi_agent_optimal_run import \
+                                                    complement_ts_and_run
 
 
 def policy_buchi_pa(pa, weight_label='weight'):
@@ -112,6 +119,221 @@ def test_ts_times_buchi():
     print('prefix:', prefix)
     print('suffix:', suffix)
 
+def product_snapshot(pa):
+    '''Returns the states, transitions, initial and final states of pa.'''
+    return (dict((u, d['prop']) for u, d in pa.g.nodes_iter(data=True)),
+            sorted(((u, v, d['weight'])
+                    for u, v, d in pa.g.edges_iter(data=True)), key=repr),
+            set(pa.init), set(pa.final))
+
+def test_update_ts_product():
+    '''Compares the incrementally updated product with a new product.'''
+    # Buchi automaton of G F a
+    buchi = Buchi(props=['a'])
+    buchi.g.add_edge('q0', 'q0', attr_dict={'input': {0}})
+    buchi.g.add_edge('q0', 'q1', attr_dict={'input': {1}})
+    buchi.g.add_edge('q1', 'q1', attr_dict={'input': {1}})
+    buchi.g.add_edge('q1', 'q0', attr_dict={'input': {0}})
+    buchi.init['q0'] = 1
+    buchi.final.add('q1')
+
+    random.seed(1)
+    for _ in range(20):
+        ts = Ts()
+        for u in range(20):
+            ts.g.add_node(u, attr_dict={'prop': random.choice([set(), {'a'}])})
+        for _ in range(40):
+            ts.g.add_edge(random.randrange(20), random.randrange(20),
+                          attr_dict={'weight': random.randint(1, 5)})
+        ts.init[0] = 1
+        pa = ts_times_buchi(ts, buchi)
+
+        added_edges = [(random.randrange(22), random.randrange(20))
+                       for _ in range(2)]
+        for u, v in added_edges:
+            ts.g.add_edge(u, v, attr_dict={'weight': random.randint(1, 5)})
+            ts.g.node[u].setdefault('prop', set())
+        removed_edges = random.sample(ts.g.edges(), 3)
+        ts.g.remove_edges_from(removed_edges)
+        relabeled_nodes = random.sample(range(20), 2)
+        for u in relabeled_nodes:
+            ts.g.node[u]['prop'] = random.choice([set(), {'a'}])
+        removed_nodes = [19]
+        ts.g.remove_node(19)
+        added_edges = [(u, v) for u, v in added_edges if 19 not in (u, v)]
+        removed_edges = [(u, v) for u, v in removed_edges if u != 19]
+        relabeled_nodes = [u for u in relabeled_nodes if u != 19]
+
+        update_ts_product(pa, ts, buchi, added_edges, removed_edges,
+                          removed_nodes, relabeled_nodes)
+        assert product_snapshot(pa) == product_snapshot(ts_times_buchi(ts, buchi))
+
+def test_compact_ts_times_ts():
+    '''Compares the compact team transition system with ts_times_ts().'''
+    random.seed(2)
+    ts_tuple = []
+    for _ in range(3):
+        ts = Ts()
+        for u in range(6):
+            ts.g.add_node(u, attr_dict={'prop': random.choice([set(), {'a'},
+                                                               {'b'}])})
+        for u in range(6):
+            for v in random.sample(range(6), 2):
+                ts.g.add_edge(u, v, attr_dict={'weight': random.randint(0, 3),
+                                               'control': (u, v)})
+        ts.init[0] = 1
+        ts_tuple.append(ts)
+
+    team_ts = ts_times_ts(ts_tuple)
+    compact_team_ts = compact_ts_times_ts(ts_tuple)
+    assert compact_team_ts.size() == team_ts.size()
+    assert compact_team_ts.to_ts() == team_ts
+    for u in range(len(compact_team_ts)):
+        assert compact_team_ts.node_of(compact_team_ts.state(u)) == u
+    assert set(map(compact_team_ts.state, compact_team_ts.nodes_w_prop({'a'}))) \
+           == team_ts.nodes_w_prop({'a'})
+
+    # the product with a Buchi automaton of G F a holds the state indices
+    buchi = Buchi(props=['a'])
+    buchi.g.add_edge('q0', 'q0', attr_dict={'input': {0}})
+    buchi.g.add_edge('q0', 'q1', attr_dict={'input': {1}})
+    buchi.g.add_edge('q1', 'q1', attr_dict={'input': {1}})
+    buchi.g.add_edge('q1', 'q0', attr_dict={'input': {0}})
+    buchi.init['q0'] = 1
+    buchi.final.add('q1')
+    pa = ts_times_buchi(team_ts, buchi)
+    compact_pa = ts_times_buchi(compact_team_ts, buchi)
+    assert all(isinstance(u, int) for u, _ in compact_pa.g)
+    decode = lambda x: (compact_team_ts.state(x[0]), x[1])
+    states, edges, init, final = product_snapshot(compact_pa)
+    assert dict((decode(u), prop) for u, prop in states.items()) \
+           == product_snapshot(pa)[0]
+    assert set((decode(u), decode(v), w) for u, v, w in edges) \
+           == set(product_snapshot(pa)[1])
+    assert (set(map(decode, init)), set(map(decode, final))) \
+           == product_snapshot(pa)[2:]
+
+def test_ts_times_ts_symmetry():
+    '''Checks the team transition system of interchangeable agents.'''
+    random.seed(3)
+    ts = Ts()
+    for u in range(5):
+        ts.g.add_node(u, attr_dict={'prop': {'a'} if u == 2 else set()})
+    for u in range(5):
+        for v in random.sample(range(5), 2):
+            ts.g.add_edge(u, v, attr_dict={'weight': random.randint(1, 3),
+                                           'control': (u, v)})
+    ts_tuple = []
+    for init in (0, 3, 0):
+        agent_ts = Ts()
+        agent_ts.g = ts.g
+        agent_ts.init[init] = 1
+        ts_tuple.append(agent_ts)
+
+    team_ts = ts_times_ts(ts_tuple)
+    reduced_ts = ts_times_ts(ts_tuple, symmetry=True)
+    assert reduced_ts.size()[0] < team_ts.size()[0]
+    assert set(reduced_ts.g) == set(canonical_team_state(u, [[0, 1, 2]])[0]
+                                    for u in team_ts.g)
+
+    # a random run of the reduced team is a run of the team
+    run = list(reduced_ts.init)
+    for _ in range(30):
+        run.append(random.choice(reduced_ts.g.successors(run[-1])))
+    team_run, _ = expand_symmetric_run(reduced_ts, run)
+    assert team_run[0] in team_ts.init
+    for u, v, x, y in zip(team_run[:-1], team_run[1:], run[:-1], run[1:]):
+        assert team_ts.g[u][v][0]['weight'] == reduced_ts.g[x][y][0]['weight']
+        assert team_ts.g.node[v]['prop'] == reduced_ts.g.node[y]['prop']
+
+def test_lazy_team_ts():
+    '''Compares the lazy team transition system with ts_times_ts().'''
+    random.seed(4)
+    ts_tuple = []
+    for _ in range(3):
+        ts = Ts()
+        for u in range(6):
+            ts.g.add_node(u, attr_dict={'prop': {'c'} if u == 5 else set()})
+        for u in range(6):
+            for v in random.sample(range(6), 2):
+                ts.g.add_edge(u, v, attr_dict={'weight': random.randint(1, 3),
+                                               'control': (u, v)})
+        ts.init[0] = 1
+        ts_tuple.append(ts)
+    # Buchi automaton of G !c
+    buchi = Buchi(props=['c'])
+    buchi.g.add_edge('q0', 'q0', attr_dict={'input': {0}})
+    buchi.init['q0'] = 1
+    buchi.final.add('q0')
+
+    team_ts = ts_times_ts(ts_tuple)
+    lazy_team_ts = LazyTeamTs(ts_tuple)
+    assert product_snapshot(ts_times_buchi(lazy_team_ts, buchi)) \
+           == product_snapshot(ts_times_buchi(team_ts, buchi))
+    # only the team states reachable in the product are created
+    assert len(lazy_team_ts.g) < len(team_ts.g)
+
+    lazy_team_ts.expand_all()
+    assert product_snapshot(lazy_team_ts)[:3] == product_snapshot(team_ts)[:3]
+
+def test_next_states_of_wts():
+    '''Checks the cached transitions of a transition system.'''
+    ts = Ts()
+    ts.g.add_edge((0, 0), (0, 1), attr_dict={'weight': 3, 'control': 'e'})
+    assert ts.next_states_of_wts((0, 0)) == (((0, 1), 3, 'e'),)
+    assert ts.next_states_of_wts(TravelingState(((0, 0), (0, 1), 1))) \
+           == (((0, 1), 2, 'e'),)
+    # the cache is cleared when the graph changes
+    ts.g.add_edge((0, 0), (1, 0), attr_dict={'weight': 1, 'control': 's'})
+    assert len(ts.next_states_of_wts((0, 0))) == 2
+    # data changed in place requires clearing the cache
+    ts.g[(0, 0)][(1, 0)][0]['weight'] = 2
+    ts.invalidate_successor_table()
+    assert ((1, 0), 2, 's') in ts.next_states_of_wts((0, 0))
+    # the kind of a state is resolved once, when its entry is created
+    table = ts.successor_table()
+    traveling = TravelingState(((0, 0), (1, 0), 1))
+    assert table[traveling] == (((1, 0), 1, 's'),)
+    assert set(table) == {(0, 0), traveling}
+    # other states that are not in the graph have no transitions and are not
+    # stored
+    assert table[2] == () and 2 not in table
+    # a tuple that is not a state is a traveling state only if allowed
+    q = ((0, 0), (1, 0), 1)
+    assert ts.next_states_of_wts(q) == (((1, 0), 1, 's'),)
+    assert ts.next_states_of_wts(q, traveling_states=False) == ()
+    assert ts.next_states_of_wts(q) == (((1, 0), 1, 's'),)
+    # tables of graphs that do not count their modifications are not kept
+    ts.g = nx.MultiDiGraph(ts.g)
+    assert ts.successor_table() is not ts.successor_table()
+    assert ((1, 0), 2, 's') in ts.next_states_of_wts((0, 0))
+
+def test_complement_ts_and_run():
+    '''Splits the edges of an agent at the traveling states of a team run.'''
+    ts_tuple = []
+    for weight in (1, 3):
+        ts = Ts()
+        ts.g.add_edge(0, 1, attr_dict={'weight': weight, 'control': 'go'})
+        ts.g.add_edge(1, 0, attr_dict={'weight': weight, 'control': 'back'})
+        ts.init[0] = 1
+        ts_tuple.append(ts)
+    team_ts = ts_times_ts(ts_tuple)
+    # the team has a single run
+    run = list(team_ts.init)
+    for _ in range(8):
+        run.append(team_ts.g.successors(run[-1])[0])
+    prefix = [x[1] for x in run[:5]]
+    suffix_cycle = [x[1] for x in run[4:]]
+    assert any(isinstance(x, TravelingState) for x in prefix + suffix_cycle)
+
+    ts = ts_tuple[1]
+    complement_ts_and_run(ts, prefix, suffix_cycle)
+    # 0 -> (0, 1, 1) -> (0, 1, 2) -> 1 and back
+    assert ts.g.number_of_edges() == 6
+    assert sum(d['weight'] for _, _, d in ts.g.edges_iter(data=True)) == 6
+    for run in (prefix, suffix_cycle):
+        assert all(ts.g.has_edge(u, v) for u, v in zip(run[:-1], run[1:]))
+
 def test_ts_times_rabin():
     '''TODO:'''
     raise NotImplementedError
@@ -126,3 +348,9 @@ def test_mdp_times_rabin():
 if __name__ == '__main__':
 
     test_ts_times_buchi()
+    test_update_ts_product()
+    test_compact_ts_times_ts()
+    test_ts_times_ts_symmetry()
+    test_lazy_team_ts()
+    test_next_states_of_wts()
+    test_complement_ts_and_run()
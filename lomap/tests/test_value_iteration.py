@@ -0,0 +1,260 @@
+# Copyright (C) 2012-2015, Alphan Ulusoy (alphan@bu.edu)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from __future__ import print_function
+
+import random
+
+import numpy as np
+
+from lomap.classes import Markov
+from lomap.algorithms.value_iteration import policy_synthesis, compute_mrp
+from lomap.algorithms.sparse_mdp import (SparseMdp, sparse_value_iteration,
+                                         prob0, prob1, scc_levels,
+                                         topological_value_iteration,
+                                         interval_iteration,
+                                         maximal_end_components)
+from lomap.algorithms.parallel_mdp import (parallel_value_iteration,
+                                           partition_states)
+
+
+def random_mdp(n, controls=2, successors=3, finals=2, traps=2, seed=None):
+    '''Returns a random product MDP with n states. The last traps states can
+    not be left.
+    '''
+    rnd = random.Random(seed)
+    p = Markov()
+    p.g.add_nodes_from(range(n))
+    for s in range(n - traps, n):
+        p.g.add_edge(s, s, attr_dict={'control': 0, 'weight': 1, 'prob': 1.0})
+    for s in range(n - traps):
+        for ctrl in rnd.sample(range(3), controls):
+            targets = rnd.sample(range(n), successors)
+            weights = [rnd.random() for _ in targets]
+            for t, w in zip(targets, weights):
+                p.g.add_edge(s, t, attr_dict={'control': ctrl, 'weight': 1,
+                                              'prob': w / sum(weights)})
+    p.init = {0: 0.5, 1: 0.5}
+    p.final = set(rnd.sample(range(2, n - traps), finals))
+    return p
+
+def policy_value(p, policy):
+    '''Returns the probability of reaching the final states of p under the
+    policy.
+    '''
+    mc = Markov()
+    mc.mc_from_mdp_policy(p, policy)
+    mc.final = set(p.final)
+    return compute_mrp(mc)[0]
+
+def test_sparse_value_iteration():
+    '''Compares the sparse solvers and the asynchronous value iteration.'''
+    for seed in range(10):
+        p = random_mdp(40, successors=2, traps=10, seed=seed)
+        mc = Markov()
+        prob, act_val, policy = policy_synthesis(p)
+        mc.mc_from_mdp_policy(p, policy)
+        mc.final = set(p.final)
+        mc_prob, exp_rwd = compute_mrp(mc)
+
+        for method in ('sparse', 'topological', 'policy', 'interval'):
+            sparse_prob, sparse_act_val, sparse_policy = policy_synthesis(p,
+                                                                method=method)
+            assert abs(prob - sparse_prob) < 1e-6
+            assert set(act_val) == set(sparse_act_val)
+            for s in act_val:
+                assert set(act_val[s]) == set(sparse_act_val[s])
+                for ctrl in act_val[s]:
+                    assert abs(act_val[s][ctrl]
+                               - sparse_act_val[s][ctrl]) < 1e-6
+            assert set(sparse_policy) == set(p.g)
+            assert abs(policy_value(p, sparse_policy) - prob) < 1e-6
+
+            sparse_prob, sparse_exp_rwd = compute_mrp(mc, method=method)
+            assert abs(mc_prob - sparse_prob) < 1e-6
+            for s in mc.g:
+                assert abs(exp_rwd[s] - sparse_exp_rwd[s]) < 1e-6
+
+def test_scc_levels():
+    '''Checks the levels of the strongly connected components.'''
+    p = random_mdp(40, successors=2, traps=10, seed=0)
+    smdp = SparseMdp(p)
+    states = np.arange(len(smdp.nodes))
+    levels = scc_levels(smdp, states)
+    assert sorted(np.concatenate([u for u, _ in levels])) == list(states)
+    level_of = dict()
+    for k, (level, _) in enumerate(levels):
+        level_of.update((u, k) for u in level)
+    for k, (level, cyclic) in enumerate(levels):
+        for u in level:
+            for t in smdp.matrix[smdp.pairs_of(np.array([u]))[0]].indices:
+                assert level_of[t] < k or (cyclic and level_of[t] == k)
+
+    # a chain is acyclic
+    p = Markov()
+    for u in range(9):
+        p.g.add_edge(u, u + 1, attr_dict={'control': 0, 'prob': 1.0})
+    p.final = {9}
+    smdp = SparseMdp(p)
+    levels = scc_levels(smdp, np.arange(9))
+    assert len(levels) == 9 and not any(cyclic for _, cyclic in levels)
+
+def test_topological_value_iteration():
+    '''Counts the backups of the cyclic and acyclic components of a level.'''
+    # The cycle 0 <-> 1 and the states 2, ..., 6 lead to the final state 7
+    # and the trap 8, so they form the first level
+    p = Markov()
+    for u, v in ((0, 1), (1, 0)):
+        for t, prob in ((v, 0.9), (7, 0.05), (8, 0.05)):
+            p.g.add_edge(u, t, attr_dict={'control': 0, 'prob': prob})
+    for u in range(2, 7):
+        for t in (7, 8):
+            p.g.add_edge(u, t, attr_dict={'control': 0, 'prob': 0.5})
+    for u in (7, 8):
+        p.g.add_edge(u, u, attr_dict={'control': 0, 'prob': 1.0})
+    p.final = {7}
+    smdp = SparseMdp(p)
+    index = smdp.index
+
+    states = np.array([index[u] for u in range(7)])
+    levels = scc_levels(smdp, states)
+    assert sorted((sorted(smdp.nodes[k] for k in level), cyclic)
+                  for level, cyclic in levels) \
+           == [([0, 1], True), ([2, 3, 4, 5, 6], False)]
+
+    result = topological_value_iteration(smdp)
+    expected = sparse_value_iteration(smdp)
+    assert abs(result.values - expected.values).max() < 1e-6
+    # the acyclic states take a single backup instead of one per iteration
+    # of the cycle
+    assert result.iterations > 10
+    assert result.backups == 2 * (result.iterations - 1) + 5
+    assert expected.backups == 7 * expected.iterations
+
+def test_prob0_prob1():
+    '''Checks the states with maximal probability 0 and 1.'''
+    for seed in range(10):
+        p = random_mdp(40, successors=2, traps=10, seed=seed)
+        # a state that can not reach the final states
+        p.g.remove_edges_from(p.g.out_edges(5, keys=True))
+        p.g.add_edge(5, 39, attr_dict={'control': 0, 'weight': 1, 'prob': 1})
+        smdp = SparseMdp(p)
+        values, _ = sparse_value_iteration(smdp, precompute=False)
+        zero, one = prob0(smdp), prob1(smdp)
+        assert zero[smdp.index[5]] and not one[smdp.index[5]]
+        assert (zero == (values == 0)).all()
+        assert (values[one] > 1 - 1e-6).all()
+        assert abs(sparse_value_iteration(smdp)[0] - values).max() < 1e-6
+
+def test_prioritized_sweeping():
+    '''Compares prioritized sweeping and the asynchronous value iteration.'''
+    for seed in range(10):
+        p = random_mdp(40, successors=2, traps=10, seed=seed)
+        result = policy_synthesis(p)
+        swept = policy_synthesis(p, method='prioritized')
+        assert abs(result.prob - swept.prob) < 1e-6
+        for s in p.g:
+            assert abs(result.val[s] - swept.val[s]) < 1e-6
+        assert abs(policy_value(p, swept.act_max) - result.prob) < 1e-6
+        # prioritized sweeping counts the updates of states, not sweeps
+        assert swept.iterations < result.iterations * len(p.g)
+
+        mc = Markov()
+        mc.mc_from_mdp_policy(p, result.act_max)
+        mc.final = set(p.final)
+        prob, exp_rwd = compute_mrp(mc)
+        swept_prob, swept_exp_rwd = compute_mrp(mc, method='prioritized')
+        assert abs(prob - swept_prob) < 1e-6
+        for s in mc.g:
+            assert abs(exp_rwd[s] - swept_exp_rwd[s]) < 1e-6
+
+def test_extract_policy():
+    '''Checks that the policy makes progress towards the final states when
+    all controls are optimal.
+    '''
+    # Each state can stay or move to the next state, and the last is final
+    p = Markov()
+    for s in range(10):
+        p.g.add_edge(s, s, attr_dict={'control': 'stay', 'prob': 1.0})
+        p.g.add_edge(s, s + 1, attr_dict={'control': 'next', 'prob': 1.0})
+    p.init = {0: 1}
+    p.final = {10}
+    for method in ('async', 'sparse'):
+        result = policy_synthesis(p, method=method)
+        assert result.prob == 1
+        assert all(result.act_max[s] == 'next' for s in range(10))
+
+def test_interval_iteration():
+    '''Checks the error bound of the interval iteration on an MDP with an
+    end component.
+    '''
+    # States 0 and 1 can move between them forever, or try to reach the
+    # final state 2 or the trap 3
+    p = Markov()
+    for s, t, ctrl, prob in [(0, 1, 'a', 1.0), (1, 0, 'a', 1.0),
+                             (0, 2, 'b', 0.5), (0, 3, 'b', 0.5),
+                             (1, 2, 'b', 0.3), (1, 3, 'b', 0.7),
+                             (2, 2, 'a', 1.0), (3, 3, 'a', 1.0)]:
+        p.g.add_edge(s, t, attr_dict={'control': ctrl, 'prob': prob})
+    p.init = {1: 1}
+    p.final = {2}
+    smdp = SparseMdp(p)
+    mec, internal = maximal_end_components(smdp, np.arange(4))
+    assert mec[smdp.index[0]] == mec[smdp.index[1]] >= 0
+    assert internal.sum() == 4
+
+    for precompute in (True, False):
+        result = interval_iteration(smdp, tol=1e-6, precompute=precompute)
+        assert result.error <= 1e-6
+        assert abs(result.values[smdp.index[1]] - 0.5) <= result.error
+
+    result = policy_synthesis(p, method='interval')
+    assert abs(result.prob - 0.5) <= result.error
+    assert result.act_max[1] == 'a' and result.act_max[0] == 'b'
+
+def test_parallel_value_iteration():
+    '''Checks that the parallel value iteration gives the same values as the
+    sparse value iteration for any executor and number of workers.
+    '''
+    for seed in range(5):
+        p = random_mdp(60, successors=2, traps=10, seed=seed)
+        smdp = SparseMdp(p)
+        result = sparse_value_iteration(smdp)
+        states = np.flatnonzero(~smdp.final)
+        blocks = partition_states(smdp, states, 4)
+        assert len(blocks) == 4
+        assert (np.concatenate(blocks) == states).all()
+        for executor in ('serial', 'thread', 'process'):
+            for workers in (1, 3):
+                parallel = parallel_value_iteration(smdp, executor=executor,
+                                                    workers=workers)
+                assert (parallel.values == result.values).all()
+                assert parallel.iterations == result.iterations
+
+    result = policy_synthesis(p)
+    parallel = policy_synthesis(p, method='parallel', executor='thread')
+    assert abs(result.prob - parallel.prob) < 1e-6
+    assert abs(policy_value(p, parallel.act_max) - result.prob) < 1e-6
+
+if __name__ == '__main__':
+    test_sparse_value_iteration()
+    test_prob0_prob1()
+    test_scc_levels()
+    test_topological_value_iteration()
+    test_prioritized_sweeping()
+    test_extract_policy()
+    test_interval_iteration()
+    test_parallel_value_iteration()
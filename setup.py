@@ -32,7 +32,8 @@ setup(
         'Intended Audience :: Science/Research',
         'License :: OSI Approved :: GNU General Public License v2 (GPLv2)',
         'Operating System :: OS Independent',
-        'Programming Language :: Python :: 2',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
         'Topic :: Scientific/Engineering',
         'Topic :: Scientific/Engineering :: Artificial Intelligence',
     ],
@@ -42,7 +43,8 @@ setup(
     license='GNU GPLv2',
     packages=['lomap', 'lomap.algorithms', 'lomap.classes'],
     package_dir={'lomap': 'lomap'},
-    install_requires=['networkx >= 1.11', 'pp >= 1.6.2', 'matplotlib >= 1.3.1',
-                      'setuptools >= 1.1.6'],
+    install_requires=['networkx >= 1.11', 'matplotlib >= 1.3.1',
+                      'numpy >= 1.11', 'scipy >= 1.3', 'setuptools >= 1.1.6'],
+    python_requires='>=3.7',
     zip_safe=False
 )